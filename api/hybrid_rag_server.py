@@ -5,6 +5,11 @@ Chạy trên port 8002 để tránh conflict với RAG server gốc (8001).
 
 Usage:
     python api/hybrid_rag_server.py
+
+API Endpoints:
+    POST /hybrid/retrieve - Chỉ retrieve (internal + web)
+    POST /hybrid/query - Full Hybrid RAG với LLM
+    POST /hybrid/query/stream - Full Hybrid RAG, câu trả lời stream qua Server-Sent Events
 """
 
 import sys
@@ -12,11 +17,13 @@ import logging
 import os
 import torch
 from pathlib import Path
+from time import perf_counter
 from typing import Optional, List, Dict, Any
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 # --- 1. Setup Environment & Paths ---
@@ -35,7 +42,13 @@ except Exception as e:
 try:
     from src.hybrid_retriever import hybrid_retriever
     from src.prompt_builder import build_rag_prompt
-    from src.llm_client import generate_answer
+    from src.llm_client import agenerate_answer, ollama_client
+    from src.rag_service import sse_encode, stream_answer_events
+    from src.query_cache import query_embedding_cache
+    from src.web_cache import web_result_cache
+    from src.reranker import reranker
+    from src.encode_batcher import EncodeQueueFull, encode_batcher
+    from src.config import settings
 except ImportError as e:
     print(f"❌ Error importing src modules: {e}")
     print("👉 Hãy chắc chắn bạn đang chạy từ root folder hoặc đã set PYTHONPATH.")
@@ -69,10 +82,20 @@ async def lifespan(app: FastAPI):
     if hybrid_retriever.tavily_retriever is None:
         logger.warning("⚠️ Tavily Retriever not initialized inside hybrid_retriever.")
 
+    # Gom các lần encode câu hỏi đồng thời thành batch
+    if settings.encode_batching:
+        encode_batcher.start()
+
+    # Load cross-encoder sẵn để request đầu tiên không hết budget rerank
+    if settings.rerank_enabled:
+        reranker.warm_up()
+
     yield  # Server chạy tại điểm này
 
     # --- Shutdown Logic ---
     logger.info("🛑 Shutting down Hybrid RAG Server...")
+    encode_batcher.stop()
+    await ollama_client.aclose()
 
 # --- 5. App Definition ---
 app = FastAPI(
@@ -118,6 +141,11 @@ class RAGChatRequest(BaseModel):
     webSearchMode: Optional[str] = "auto"  # ⭐ NEW: auto, force-on, force-off
     documentId: Optional[str] = None  # ⭐ Nếu có = chỉ tìm trong document này
 
+def _overloaded(exc: EncodeQueueFull) -> HTTPException:
+    """Hàng đợi encode đầy → 503 để client/gateway thử lại sau."""
+    logger.warning(f"⏳ Overloaded: {exc}")
+    return HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"})
+
 # --- 7. Endpoints ---
 
 @app.get("/health")
@@ -127,7 +155,11 @@ async def health():
         "status": "healthy",
         "service": "Hybrid RAG Server",
         "gpu_available": torch.cuda.is_available(),
-        "tavily_enabled": hybrid_retriever.tavily_retriever is not None
+        "tavily_enabled": hybrid_retriever.tavily_retriever is not None,
+        "query_cache": query_embedding_cache.stats(),
+        "web_cache": web_result_cache.stats(),
+        "rerank": reranker.stats(),
+        "encode_batcher": encode_batcher.stats(),
     }
 
 @app.post("/hybrid/retrieve")
@@ -143,7 +175,7 @@ async def hybrid_retrieve(request: HybridRetrieveRequest):
         logger.info(f"🔍 Retrieving for: '{request.query}' (User: {request.user_id}, Mode: {request.web_search_mode})")
         
         # GỌI LOGIC TÌM KIẾM TRUNG TÂM (HybridRetriever)
-        result = hybrid_retriever.retrieve(
+        result = await hybrid_retriever.aretrieve(
             query=request.query,
             user_id=request.user_id,
             document_id=request.document_id,
@@ -171,10 +203,39 @@ async def hybrid_retrieve(request: HybridRetrieveRequest):
             "context_preview": "\n\n".join([s["content"][:200] + "..." for s in sources]),
             "metadata": result.metadata
         }
+    except EncodeQueueFull as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"❌ Hybrid retrieval error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _prepare_hybrid_query(request: HybridQueryRequest):
+    """Retrieve (Hybrid) + Build Prompt; trả về (retrieval_result, prompt, sources_list)."""
+    # 1. Retrieve Hybrid
+    retrieval_result = await hybrid_retriever.aretrieve(
+        query=request.query,
+        user_id=request.user_id,
+        document_id=request.document_id,
+        web_search_mode=request.web_search_mode,
+        top_k=request.top_k,
+        web_max_results=request.web_max_results,
+        internal_max_results=request.internal_max_results
+    )
+
+    # 2. Build Prompt
+    prompt = build_rag_prompt(
+        query=request.query,
+        chunks=retrieval_result.sources,
+        system_prompt=request.system_prompt
+    )
+
+    sources_list = [{
+        "content": chunk.content,
+        "similarity": chunk.similarity,
+        "source": chunk.metadata.get("source", "internal") if chunk.metadata else "internal"
+    } for chunk in retrieval_result.sources]
+    return retrieval_result, prompt, sources_list
+
 @app.post("/hybrid/query")
 async def hybrid_query(request: HybridQueryRequest):
     """
@@ -183,39 +244,16 @@ async def hybrid_query(request: HybridQueryRequest):
     try:
         logger.info(f"🧠 Processing Query: '{request.query}' (Mode: {request.web_search_mode})")
 
-        # 1. Retrieve Hybrid
-        retrieval_result = hybrid_retriever.retrieve(
-            query=request.query,
-            user_id=request.user_id,
-            document_id=request.document_id,
-            web_search_mode=request.web_search_mode,
-            top_k=request.top_k,
-            web_max_results=request.web_max_results,
-            internal_max_results=request.internal_max_results
-        )
-        
-        # 2. Build Prompt
-        prompt = build_rag_prompt(
-            query=request.query,
-            chunks=retrieval_result.sources,
-            system_prompt=request.system_prompt
-        )
+        retrieval_result, prompt, sources_list = await _prepare_hybrid_query(request)
         
         # 3. Call LLM
         model_name = request.model or os.getenv("OLLAMA_MODEL", "llama3")
         logger.info(f"🤖 Sending prompt to LLM ({model_name})...")
         
-        llm_response = generate_answer(
+        llm_response = await agenerate_answer(
             prompt=prompt,
             model=model_name
         )
-        
-        # 4. Format Response
-        sources_list = [{
-            "content": chunk.content,
-            "similarity": chunk.similarity,
-            "source": chunk.metadata.get("source", "internal") if chunk.metadata else "internal"
-        } for chunk in retrieval_result.sources]
 
         logger.info("🎉 Query processed successfully.")
 
@@ -225,14 +263,41 @@ async def hybrid_query(request: HybridQueryRequest):
             "metadata": {
                 **retrieval_result.metadata,
                 "model_used": llm_response.model,
-                "generation_time": llm_response.total_duration,
+                "generation_time": llm_response.raw.get("total_duration"),
             }
         }
 
+    except EncodeQueueFull as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"❌ Hybrid query error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/hybrid/query/stream")
+async def hybrid_query_stream(request: HybridQueryRequest):
+    """
+    Full Flow dạng Server-Sent Events: sources (internal + web) được gửi ngay sau
+    retrieve, sau đó từng token của LLM, cuối cùng event done với metadata
+    (ttft_ms, query_time_ms); lỗi giữa chừng → event error.
+    """
+    started = perf_counter()
+    try:
+        logger.info(f"🧠 Streaming Query: '{request.query}' (Mode: {request.web_search_mode})")
+        retrieval_result, prompt, sources_list = await _prepare_hybrid_query(request)
+    except EncodeQueueFull as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"❌ Hybrid query error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+    model_name = request.model or os.getenv("OLLAMA_MODEL", "llama3")
+    events = stream_answer_events(prompt, sources_list, model_name, started, dict(retrieval_result.metadata))
+    return StreamingResponse(
+        sse_encode(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post("/api/rag/chat")
 async def rag_chat_compatible(request: RAGChatRequest, authorization: Optional[str] = Header(None)):
     """
@@ -263,7 +328,7 @@ async def rag_chat_compatible(request: RAGChatRequest, authorization: Optional[s
         logger.info(f"🔍 RAG Chat: '{request.query}' (webSearchMode={request.webSearchMode}, documentId={request.documentId})")
         
         # ⭐ Luôn dùng hybrid retriever với smart mode resolution
-        retrieval_result = hybrid_retriever.retrieve(
+        retrieval_result = await hybrid_retriever.aretrieve(
             query=request.query,
             user_id=user_id,
             document_id=request.documentId,
@@ -310,6 +375,8 @@ async def rag_chat_compatible(request: RAGChatRequest, authorization: Optional[s
             }
         }
         
+    except EncodeQueueFull as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"❌ RAG chat error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -16,6 +16,7 @@ Usage:
 
 API Endpoints:
     POST /rag/query - Full RAG với LLM
+    POST /rag/query/stream - Full RAG, câu trả lời stream qua Server-Sent Events
     POST /rag/retrieve - Chỉ retrieve chunks
 """
 
@@ -29,6 +30,7 @@ from typing import Optional, List, Dict, Any
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, field_validator
 
 # --- 1. Setup Path & Env ---
@@ -44,9 +46,14 @@ except Exception:
 
 # --- 2. Import Modules ---
 try:
-    from src.rag_service import rag_query
+    from src.rag_service import arag_query, arag_query_stream, sse_encode
+    from src.llm_client import ollama_client
     from src.embedder import _get_model
-    from src.retriever import retrieve_similar_chunks_by_user 
+    from src.retriever import aretrieve_similar_chunks_by_user
+    from src.query_cache import query_embedding_cache
+    from src.answer_cache import answer_cache
+    from src.encode_batcher import EncodeQueueFull, encode_batcher
+    from src.config import settings
 except ImportError as e:
     print(f"❌ Import Error: {e}")
     sys.exit(1)
@@ -76,11 +83,17 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"❌ Failed to load model: {e}")
         raise
+
+    # Gom các lần encode câu hỏi đồng thời thành batch
+    if settings.encode_batching:
+        encode_batcher.start()
     
     yield  # Server chạy tại đây
 
     # --- Shutdown ---
     logger.info("🛑 Shutting down RAG Server...")
+    encode_batcher.stop()
+    await ollama_client.aclose()
 
 # --- 4. App Definition ---
 app = FastAPI(
@@ -126,6 +139,11 @@ class RAGResponse(BaseModel):
     prompt: Optional[str] = None
     raw_llm_response: Optional[dict] = None
 
+def _overloaded(exc: EncodeQueueFull) -> HTTPException:
+    """Hàng đợi encode đầy → 503 để client/gateway thử lại sau."""
+    logger.warning(f"⏳ Overloaded: {exc}")
+    return HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"})
+
 # --- 6. Endpoints ---
 
 @app.get("/")
@@ -140,7 +158,10 @@ async def health():
         return {
             "status": "healthy",
             "gpu": torch.cuda.is_available(),
-            "model_loaded": model is not None
+            "model_loaded": model is not None,
+            "query_cache": query_embedding_cache.stats(),
+            "answer_cache": answer_cache.stats(),
+            "encode_batcher": encode_batcher.stats(),
         }
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}
@@ -151,7 +172,7 @@ async def query_rag(request: RAGRequest):
     try:
         logger.info(f"🧠 Querying: '{request.query}' (Model: {request.model or 'default'})")
         
-        result = rag_query(
+        result = await arag_query(
             query=request.query,
             user_id=request.user_id,
             top_k=request.top_k,
@@ -161,17 +182,50 @@ async def query_rag(request: RAGRequest):
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except EncodeQueueFull as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"❌ Server error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/rag/query/stream")
+async def query_rag_stream(request: RAGRequest):
+    """
+    Full RAG Flow dạng Server-Sent Events.
+
+    Thứ tự event: sources (kèm retrieval_ms) → token (mỗi đoạn text) → done
+    (metadata có ttft_ms, query_time_ms); lỗi giữa chừng → event error.
+    """
+    try:
+        logger.info(f"🧠 Streaming query: '{request.query}' (Model: {request.model or 'default'})")
+        events = await arag_query_stream(
+            query=request.query,
+            user_id=request.user_id,
+            top_k=request.top_k,
+            system_prompt=request.system_prompt,
+            model=request.model
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except EncodeQueueFull as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"❌ Server error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+    return StreamingResponse(
+        sse_encode(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post("/rag/retrieve")
 async def retrieve_chunks(request: RAGRequest):
     """Chỉ Retrieve Chunks (dùng cho Frontend tự gọi Gemini/GPT)."""
     try:
         logger.info(f"🔍 Retrieving chunks for: '{request.query}'")
         
-        chunks = retrieve_similar_chunks_by_user(
+        chunks = await aretrieve_similar_chunks_by_user(
             query=request.query,
             user_id=request.user_id,
             top_k=request.top_k
@@ -188,6 +242,8 @@ async def retrieve_chunks(request: RAGRequest):
             "sources": sources,
             "metadata": {"chunk_count": len(sources)}
         }
+    except EncodeQueueFull as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"❌ Retrieval error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -5,7 +5,8 @@ from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 
-from src.rag_service import rag_query
+from src.encode_batcher import EncodeQueueFull
+from src.rag_service import arag_query, rag_query
 
 router = APIRouter(prefix="/api/rag", tags=["rag"])
 
@@ -47,7 +48,8 @@ class RAGResponse(BaseModel):
 
 
 @router.post("/chat", response_model=RAGResponse)
-async def chat_with_rag(payload: RAGRequest) -> Dict[str, Any]:
+def chat_with_rag(payload: RAGRequest) -> Dict[str, Any]:
+    # Handler sync: FastAPI chạy trong threadpool nên không chặn event loop
     if not payload.query.strip():
         raise HTTPException(status_code=400, detail="Query không được để trống")
     if not payload.document_id.strip():
@@ -85,7 +87,7 @@ async def query_by_user(payload: RAGQueryByUserRequest) -> Dict[str, Any]:
         raise HTTPException(status_code=400, detail="user_id không được để trống")
 
     try:
-        result = rag_query(
+        result = await arag_query(
             query=payload.query,
             user_id=payload.user_id,
             top_k=payload.top_k,
@@ -100,6 +102,8 @@ async def query_by_user(payload: RAGQueryByUserRequest) -> Dict[str, Any]:
         }
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except EncodeQueueFull as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "1"}) from exc
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=500, detail=f"RAG lỗi xử lý: {exc}") from exc
 
@@ -0,0 +1,14 @@
+-- =====================================================
+-- MIGRATION: documents.embedding_fingerprint
+-- =====================================================
+-- Mục đích: Lưu fingerprint của lần ingest thành công gần nhất
+--   {"checksum": sha256 file, "model": HF_MODEL_NAME, "chunk_size": ..., "chunk_overlap": ...}
+-- Pipeline bỏ qua extract/embed/ghi khi fingerprint không đổi (trừ khi --force-refresh).
+-- Nếu chưa chạy migration này, pipeline vẫn hoạt động nhưng không bao giờ bỏ qua.
+-- =====================================================
+
+ALTER TABLE public.documents
+    ADD COLUMN IF NOT EXISTS embedding_fingerprint jsonb;
+
+COMMENT ON COLUMN public.documents.embedding_fingerprint IS
+'Checksum file + model + tham số chunk của lần ingest embedding thành công gần nhất. NULL = cần ingest lại.';
@@ -0,0 +1,32 @@
+-- =====================================================
+-- RPC FUNCTION: update_chunk_positions
+-- =====================================================
+-- Mục đích: Ingest incremental cập nhật chunk_index/page_number của các chunk
+-- được tái sử dụng nhưng đổi vị trí (ví dụ chèn đoạn văn ở đầu tài liệu làm
+-- mọi chunk phía sau dịch chỗ) trong MỘT request cho cả batch, thay vì một
+-- UPDATE cho mỗi chunk.
+-- updates: [{"id": "<id chunk>", "chunk_index": 12, "page_number": 3}, ...]
+-- Nếu chưa tạo function này, pipeline vẫn chạy nhưng cập nhật từng chunk.
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION public.update_chunk_positions(
+    p_document_id uuid,               -- Tài liệu chứa các chunk (giới hạn phạm vi UPDATE)
+    updates jsonb                     -- Mảng {id, chunk_index, page_number}
+)
+RETURNS integer                       -- Số chunk đã cập nhật
+LANGUAGE sql
+AS $$
+    WITH moved AS (
+        UPDATE public.document_embeddings de
+        SET
+            chunk_index = u.chunk_index,
+            page_number = u.page_number
+        FROM jsonb_to_recordset(updates) AS u(id text, chunk_index int, page_number int)
+        WHERE de.document_id = p_document_id
+          AND de.id::text = u.id
+        RETURNING 1
+    )
+    SELECT count(*)::int FROM moved;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.update_chunk_positions(uuid, jsonb) TO service_role;
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Benchmark recall@k vs latency: HNSW in-process (src.ann_index) so với tìm kiếm chính xác.
+
+Đường "exact" là brute-force cosine trên toàn bộ ma trận, cho cùng kết quả với
+RPC match_embeddings_by_user (ORDER BY embedding <=> query) nhưng không có mạng.
+Dữ liệu giả lập dạng cụm (giống embedding thật: nhiều chunk gần nhau theo chủ đề).
+
+Usage:
+    python scripts/benchmark_ann.py
+    python scripts/benchmark_ann.py --rows 50000 --ef 16 32 64 128 256 --m 16
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src.ann_index import AnnParams, UserAnnIndex
+from src.retriever import _normalize_rows, _score_matrix, _top_k_indices
+
+
+def _make_corpus(n_rows: int, dim: int, n_clusters: int, seed: int = 0) -> np.ndarray:
+    """Sinh embedding dạng cụm, đã chuẩn hoá L2."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n_rows)
+    matrix = centers[labels] + 0.6 * rng.standard_normal((n_rows, dim)).astype(np.float32)
+    return _normalize_rows(matrix)
+
+
+def _percentile_ms(samples: list[float], q: float) -> float:
+    return float(np.percentile(samples, q)) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark HNSW recall@k vs latency")
+    parser.add_argument("--rows", type=int, default=20000, help="Số chunk của user (default: 20000)")
+    parser.add_argument("--dim", type=int, default=768, help="Số chiều embedding (default: 768)")
+    parser.add_argument("--clusters", type=int, default=200, help="Số cụm chủ đề (default: 200)")
+    parser.add_argument("--queries", type=int, default=200, help="Số query (default: 200)")
+    parser.add_argument("--top-k", type=int, default=5, help="top_k (default: 5)")
+    parser.add_argument("--m", type=int, default=16, help="HNSW M (default: 16)")
+    parser.add_argument("--ef-construction", type=int, default=200, help="HNSW ef_construction (default: 200)")
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128, 256], help="Các giá trị ef_search")
+    args = parser.parse_args()
+
+    matrix = _make_corpus(args.rows, args.dim, args.clusters)
+    rows = [{"content": f"chunk {i}", "chunk_index": i} for i in range(args.rows)]
+    queries = _make_corpus(args.queries, args.dim, args.clusters, seed=1)
+
+    # Exact: brute-force cosine (tương đương ORDER BY embedding <=> query)
+    exact_ids: list[set[int]] = []
+    exact_times: list[float] = []
+    for query in queries:
+        start = perf_counter()
+        scores = _score_matrix(query, matrix)
+        top = _top_k_indices(scores, args.top_k)
+        exact_times.append(perf_counter() - start)
+        exact_ids.append({int(i) for i in top})
+
+    params = AnnParams(m=args.m, ef_construction=args.ef_construction, ef_search=args.ef[0])
+    start = perf_counter()
+    index = UserAnnIndex(matrix.copy(), rows, params)
+    build_s = perf_counter() - start
+
+    print(f"rows={args.rows} dim={args.dim} queries={args.queries} top_k={args.top_k} M={args.m} "
+          f"ef_construction={args.ef_construction}")
+    print(f"HNSW build: {build_s:.2f}s")
+    print(f"{'backend':<14}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    print(f"{'exact':<14}{1.0:>10.3f}{_percentile_ms(exact_times, 50):>10.3f}{_percentile_ms(exact_times, 99):>10.3f}")
+
+    for ef in args.ef:
+        hits = 0
+        times: list[float] = []
+        for query, truth in zip(queries, exact_ids):
+            start = perf_counter()
+            chunks = index.search(query, top_k=args.top_k, ef_search=ef)
+            times.append(perf_counter() - start)
+            hits += len({chunk.chunk_index for chunk in chunks} & truth)
+        recall = hits / (len(queries) * args.top_k)
+        label = f"hnsw ef={ef}"
+        print(f"{label:<14}{recall:>10.3f}{_percentile_ms(times, 50):>10.3f}{_percentile_ms(times, 99):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
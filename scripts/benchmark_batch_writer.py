@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Benchmark ghi embedding vào một PostgREST giả lập cục bộ (HTTP thật, postgrest-py client).
+
+Server giả lập nhận POST /rest/v1/document_embeddings, parse JSON, sleep
+--latency-ms (+ thời gian tỉ lệ với số byte theo --mbps) rồi trả 201; với
+--fail-rate, một phần request trả 503 trước khi ghi để kiểm tra retry từng batch.
+Server đếm số row đã ghi để xác nhận không mất / trùng row.
+
+So sánh: ghi tuần tự batch 100 rows (cách cũ của insert_embeddings) với
+src.batch_writer.BatchWriter ở các mức --in-flight.
+
+Usage:
+    python scripts/benchmark_batch_writer.py
+    python scripts/benchmark_batch_writer.py --rows 5000 --latency-ms 80 --in-flight 1 2 4 8 --fail-rate 0.05
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+from postgrest import SyncPostgrestClient
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.batch_writer import BatchWriter
+from src.vector_codec import encode_vectors
+
+
+class _StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency_s: float, bytes_per_s: float, fail_rate: float) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency_s = latency_s
+        self.bytes_per_s = bytes_per_s
+        self.fail_rate = fail_rate
+        self.rows = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: _StandIn
+
+    def do_POST(self) -> None:  # noqa: N802 - API của BaseHTTPRequestHandler
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        rows = json.loads(body)
+        time.sleep(self.server.latency_s + len(body) / self.server.bytes_per_s)
+        with self.server.lock:
+            self.server.requests += 1
+            failed = random.random() < self.server.fail_rate
+            if not failed:
+                self.server.rows += len(rows)
+        self.send_response(503 if failed else 201)
+        payload = b'{"message": "unavailable"}' if failed else b"[]"
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def _records(n_rows: int, dim: int) -> list[dict]:
+    matrix = (np.random.default_rng(0).standard_normal((n_rows, dim)) * 0.15).astype(np.float32)
+    vectors = encode_vectors(matrix, "text", 6)
+    return [
+        {"document_id": "benchmark", "content": "Lập trình hướng đối tượng. " * 30,
+         "page_number": i // 8 + 1, "chunk_index": i + 1, "embedding": vectors[i]}
+        for i in range(n_rows)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark concurrent batch writer vs sequential inserts")
+    parser.add_argument("--rows", type=int, default=3000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latency giả lập mỗi request")
+    parser.add_argument("--mbps", type=float, default=50.0, help="Băng thông giả lập (MB/s) của server")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Tỉ lệ request trả 503")
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--max-batch-kb", type=int, default=1024)
+    parser.add_argument("--max-batch-rows", type=int, default=100)
+    args = parser.parse_args()
+
+    server = _StandIn(args.latency_ms / 1000, args.mbps * 1024 * 1024, args.fail_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = SyncPostgrestClient(f"http://127.0.0.1:{server.server_address[1]}/rest/v1")
+
+    def write_batch(rows: list[dict]) -> None:
+        client.from_("document_embeddings").insert(rows).execute()
+
+    records = _records(args.rows, args.dim)
+    print(f"rows={args.rows} latency={args.latency_ms}ms bandwidth={args.mbps}MB/s fail_rate={args.fail_rate}")
+    print(f"{'writer':<14}{'seconds':>9}{'rows/s':>9}{'batches':>9}{'requests':>10}{'rows stored':>13}")
+
+    def report(name: str, seconds: float, batches: int) -> None:
+        print(f"{name:<14}{seconds:>9.2f}{server.rows / seconds:>9.0f}{batches:>9}{server.requests:>10}{server.rows:>13}")
+        server.rows = server.requests = 0
+
+    # Cách cũ: batch 100 rows tuần tự (không retry để tránh ghi lại từ đầu khi có --fail-rate)
+    start = perf_counter()
+    batches = 0
+    try:
+        for i in range(0, len(records), 100):
+            write_batch(records[i:i + 100])
+            batches += 1
+    except Exception as exc:  # noqa: BLE001 - chỉ báo cáo
+        print(f"sequential stopped at batch {batches}: {exc}")
+    report("sequential", perf_counter() - start, batches)
+
+    for in_flight in args.in_flight:
+        writer = BatchWriter(
+            write_batch,
+            max_in_flight=in_flight,
+            max_batch_bytes=args.max_batch_kb * 1024,
+            max_batch_rows=args.max_batch_rows,
+            initial_delay=0.05,
+        )
+        stats = writer.write(records)
+        report(f"in_flight={in_flight}", stats.seconds, stats.batches)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
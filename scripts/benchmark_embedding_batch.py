@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Đo bộ nhớ và số lần cấp phát của bước gom kết quả embed → payload insert:
+danh sách EmbeddingResult (mỗi chunk một np.array, tolist() từng dòng) so với
+EmbeddingBatch (một ma trận float32, tolist() một lần) + _prepare_records.
+
+Không chạy model: ma trận (n, dim) ngẫu nhiên thay cho output của model.encode,
+nên chỉ phần xử lý sau encode được đo (tracemalloc). Stage "embed" là kết quả
+trả về của embed_chunks; stage "records" tính thêm payload insert (vẫn là list
+float Python cho JSON nên chiếm phần lớn bộ nhớ ở stage này).
+
+Usage:
+    python scripts/benchmark_embedding_batch.py
+    python scripts/benchmark_embedding_batch.py --chunks 20000 --dim 768
+"""
+
+import argparse
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src.chunker import TextChunk
+from src.embedder import EmbeddingBatch, EmbeddingResult
+from src.pipeline import _prepare_records
+
+
+def _per_chunk_results(chunks: list[TextChunk], encoded: np.ndarray) -> list[EmbeddingResult]:
+    """Đường cũ: copy từng dòng của output encode thành một np.array riêng."""
+    return [EmbeddingResult(chunk=chunk, vector=np.array(vector, dtype=np.float32))
+            for chunk, vector in zip(chunks, encoded)]
+
+
+def _per_chunk_records(chunks: list[TextChunk], encoded: np.ndarray) -> list[dict]:
+    """Đường cũ đến payload: tolist() từng vector."""
+    return [
+        {
+            "document_id": "benchmark",
+            "content": item.chunk.text,
+            "page_number": item.chunk.page_number,
+            "chunk_index": item.chunk.chunk_index,
+            "embedding": item.vector.tolist(),
+        }
+        for item in _per_chunk_results(chunks, encoded)
+    ]
+
+
+def _columnar_batch(chunks: list[TextChunk], encoded: np.ndarray) -> EmbeddingBatch:
+    """Đường mới: ghi thẳng vào ma trận của EmbeddingBatch."""
+    matrix = np.empty(encoded.shape, dtype=np.float32)
+    matrix[:] = encoded
+    return EmbeddingBatch(chunks, matrix)
+
+
+def _columnar_records(chunks: list[TextChunk], encoded: np.ndarray) -> list[dict]:
+    """Đường mới đến payload: _prepare_records tolist() một lần trên cả ma trận."""
+    return _prepare_records("benchmark", _columnar_batch(chunks, encoded))
+
+
+def _measure(fn, chunks: list[TextChunk], encoded: np.ndarray) -> tuple[float, float, int]:
+    """(giây, peak MB, số block cấp phát còn sống trong lúc chạy) của fn."""
+    gc.collect()
+    tracemalloc.start()
+    before = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    start = perf_counter()
+    records = fn(chunks, encoded)
+    seconds = perf_counter() - start
+    after = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return seconds, peak / 1024 ** 2, after - before
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark EmbeddingResult list vs EmbeddingBatch")
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=768)
+    args = parser.parse_args()
+
+    chunks = [TextChunk(text=f"Đoạn {i}: lập trình hướng đối tượng. " * 20, page_number=i // 8 + 1, chunk_index=i + 1)
+              for i in range(args.chunks)]
+    encoded = np.random.default_rng(0).standard_normal((args.chunks, args.dim)).astype(np.float32)
+
+    print(f"chunks={args.chunks} dim={args.dim} matrix={encoded.nbytes / 1024 ** 2:.1f}MB")
+    print(f"{'stage':<10}{'layout':<12}{'seconds':>10}{'peak MB':>10}{'live blocks':>13}")
+    runs = (
+        ("embed", "per-chunk", _per_chunk_results),
+        ("embed", "columnar", _columnar_batch),
+        ("records", "per-chunk", _per_chunk_records),
+        ("records", "columnar", _columnar_records),
+    )
+    for stage, name, fn in runs:
+        seconds, peak_mb, blocks = _measure(fn, chunks, encoded)
+        print(f"{stage:<10}{name:<12}{seconds:>10.3f}{peak_mb:>10.1f}{blocks:>13}")
+
+
+if __name__ == "__main__":
+    main()
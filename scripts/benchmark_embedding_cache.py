@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Benchmark throughput của embed_chunks khi re-ingest với cache embedding nóng.
+
+Chạy embed_chunks 2 lần trên cùng tập chunk với một cache tạm (rỗng lúc đầu):
+lần 1 = ingest lần đầu (cache lạnh), lần 2 = re-ingest (cache nóng).
+
+Usage:
+    python scripts/benchmark_embedding_cache.py --pdf path/to/file.pdf
+    python scripts/benchmark_embedding_cache.py --chunks 2000   # text giả lập
+"""
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src import embedding_cache
+from src.chunker import TextChunk, split_chunks
+from src.embedder import _get_model, embed_chunks
+from src.text_extractor import extract_pdf_text
+
+
+def _load_chunks(pdf: Path | None, n_chunks: int) -> list[TextChunk]:
+    """Chunk từ PDF thật, hoặc n_chunks đoạn text giả lập."""
+    if pdf is not None:
+        return list(split_chunks(extract_pdf_text(pdf)))
+    return [
+        TextChunk(text=f"Đoạn {i}: lập trình hướng đối tượng, kế thừa, đa hình và đóng gói. " * 8, chunk_index=i)
+        for i in range(n_chunks)
+    ]
+
+
+def _run(chunks: list[TextChunk]) -> float:
+    start = perf_counter()
+    embed_chunks(chunks)
+    return perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark embed_chunks với cache embedding")
+    parser.add_argument("--pdf", type=Path, default=None, help="File PDF để chunk (mặc định: text giả lập)")
+    parser.add_argument("--chunks", type=int, default=1000, help="Số chunk giả lập khi không có --pdf")
+    args = parser.parse_args()
+
+    chunks = _load_chunks(args.pdf, args.chunks)
+    _get_model()  # Không tính thời gian load model
+
+    with tempfile.TemporaryDirectory() as tmp:
+        embedding_cache._cache = embedding_cache.EmbeddingCache(Path(tmp) / "bench.sqlite", max_bytes=1 << 30)
+        cold_s = _run(chunks)
+        warm_s = _run(chunks)
+        stats = embedding_cache._cache.stats()
+        embedding_cache._cache.close()
+
+    print(f"chunks={len(chunks)}")
+    print(f"  cold (first ingest) : {cold_s:8.2f}s  {len(chunks) / cold_s:10.1f} chunks/s")
+    print(f"  warm (re-ingest)    : {warm_s:8.2f}s  {len(chunks) / warm_s:10.1f} chunks/s  (x{cold_s / warm_s:.1f})")
+    print(f"  cache stats: {stats}")
+
+
+if __name__ == "__main__":
+    main()
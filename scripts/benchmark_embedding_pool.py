@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Benchmark chunks/giây khi encode trên CPU theo số worker (src.embedding_pool).
+
+workers=1 là model.encode trong process hiện tại (đường mặc định của embed_chunks);
+các mức khác dùng EmbeddingPool với số thread torch chia đều số core.
+
+Usage:
+    python scripts/benchmark_embedding_pool.py --pdf path/to/file.pdf
+    python scripts/benchmark_embedding_pool.py --chunks 2000 --workers 1 2 4 8
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src.chunker import split_chunks
+from src.config import settings
+from src.embedder import _get_model
+from src.embedding_pool import EmbeddingPool
+from src.text_extractor import extract_pdf_text
+
+
+def _load_texts(pdf: Path | None, n_chunks: int) -> list[str]:
+    """Text của chunk từ PDF thật, hoặc n_chunks đoạn giả lập."""
+    if pdf is not None:
+        return [chunk.text for chunk in split_chunks(extract_pdf_text(pdf))]
+    return [f"Đoạn {i}: lập trình hướng đối tượng, kế thừa, đa hình và đóng gói. " * 10 for i in range(n_chunks)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark multi-process CPU embedding")
+    parser.add_argument("--pdf", type=Path, default=None, help="File PDF để chunk (mặc định: text giả lập)")
+    parser.add_argument("--chunks", type=int, default=1000, help="Số chunk giả lập khi không có --pdf")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Các mức worker")
+    parser.add_argument("--shard-size", type=int, default=settings.embed_shard_size)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    texts = _load_texts(args.pdf, args.chunks)
+    print(f"chunks={len(texts)} shard_size={args.shard_size} batch_size={args.batch_size}")
+    print(f"{'workers':>8}{'threads':>9}{'seconds':>10}{'chunks/s':>10}{'speedup':>10}{'max |Δ|':>10}")
+
+    model = _get_model()
+    model.encode(texts[:8])  # warm up
+    start = perf_counter()
+    baseline = np.asarray(model.encode(texts, batch_size=args.batch_size, convert_to_numpy=True), dtype=np.float32)
+    baseline_s = perf_counter() - start
+    print(f"{1:>8}{'default':>9}{baseline_s:>10.2f}{len(texts) / baseline_s:>10.1f}{1.0:>10.2f}{'-':>10}")
+
+    for workers in args.workers:
+        if workers <= 1:
+            continue
+        pool = EmbeddingPool(workers, shard_size=args.shard_size)
+        pool.encode(texts[: workers * args.shard_size])  # Chờ các worker load model xong
+        start = perf_counter()
+        vectors = pool.encode(texts, batch_size=args.batch_size)
+        seconds = perf_counter() - start
+        pool.shutdown()
+        diff = float(np.abs(vectors - baseline).max())
+        print(f"{workers:>8}{pool.torch_threads:>9}{seconds:>10.2f}{len(texts) / seconds:>10.1f}"
+              f"{baseline_s / seconds:>10.2f}{diff:>10.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Benchmark ingest tuần tự vs. streaming (src.pipeline) trên một file PDF lớn.
+
+Mỗi chế độ chạy trong một process con riêng (tắt cache embedding) để đo peak RSS độc lập.
+Supabase được thay bằng sink cục bộ: serialize JSON từng batch insert và
+sleep --insert-latency-ms để giả lập round-trip mạng của một request insert.
+
+Usage:
+    python scripts/benchmark_ingest_pipeline.py --pdf path/to/large.pdf
+    python scripts/benchmark_ingest_pipeline.py --pdf big.pdf --insert-latency-ms 80 --memory-budget-mb 128
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from time import perf_counter
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+def _make_sink(latency_s: float):
+    """Sink thay cho Supabase: mỗi batch insert serialize + sleep, các thao tác khác no-op."""
+    from src.pipeline import EmbeddingSink
+
+    class LocalSink(EmbeddingSink):
+        def fetch_existing(self, document_id: str) -> list[dict]:
+            return []
+
+        def insert_batch(self, rows: list[dict]) -> None:
+            json.dumps(rows)
+            time.sleep(latency_s)
+
+        def fetch_ids(self, document_id: str) -> list:
+            return []
+
+    return LocalSink()
+
+
+def _child(args: argparse.Namespace) -> None:
+    """Chạy một chế độ ingest và in kết quả JSON (chạy trong process con)."""
+    from src.embedder import _get_model
+    from src.pipeline import IngestParams, _ingest_serial, _ingest_streaming
+
+    _get_model()  # Không tính thời gian load model
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    sink = _make_sink(args.insert_latency_ms / 1000)
+
+    start = perf_counter()
+    if args.mode == "serial":
+        result = _ingest_serial("benchmark", args.pdf, sink=sink)
+    else:
+        params = IngestParams(
+            embed_batch_size=args.embed_batch_size,
+            insert_batch_size=args.insert_batch_size,
+            memory_budget_mb=args.memory_budget_mb,
+        )
+        result = _ingest_streaming("benchmark", args.pdf, params, sink=sink)
+    elapsed = perf_counter() - start
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "mode": args.mode,
+        "chunks": result.added,
+        "seconds": elapsed,
+        "peak_rss_mb": peak_kb / 1024,
+        "rss_over_model_mb": (peak_kb - baseline_kb) / 1024,
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark serial vs streaming ingestion")
+    parser.add_argument("--pdf", type=Path, required=True, help="File PDF lớn để ingest")
+    parser.add_argument("--insert-latency-ms", type=float, default=50.0, help="Latency giả lập mỗi batch insert")
+    parser.add_argument("--embed-batch-size", type=int, default=64)
+    parser.add_argument("--insert-batch-size", type=int, default=100)
+    parser.add_argument("--memory-budget-mb", type=int, default=256)
+    parser.add_argument("--mode", choices=["serial", "streaming"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        _child(args)
+        return
+
+    # Tắt cache embedding để lần chạy sau không hưởng cache của lần chạy trước
+    env = {**os.environ, "EMBEDDING_CACHE": "false"}
+    results = []
+    for mode in ("serial", "streaming"):
+        cmd = [sys.executable, __file__, "--mode", mode, *sys.argv[1:]]
+        output = subprocess.run(cmd, check=True, capture_output=True, text=True, env=env).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"pdf={args.pdf} insert_latency={args.insert_latency_ms}ms budget={args.memory_budget_mb}MB")
+    print(f"{'mode':<11}{'chunks':>8}{'seconds':>10}{'chunks/s':>10}{'peak RSS MB':>13}{'Δ vs model MB':>15}")
+    for r in results:
+        print(f"{r['mode']:<11}{r['chunks']:>8}{r['seconds']:>10.2f}{r['chunks'] / r['seconds']:>10.1f}"
+              f"{r['peak_rss_mb']:>13.1f}{r['rss_over_model_mb']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
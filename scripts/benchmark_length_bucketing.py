@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Benchmark chunks/giây của embed theo thứ tự tài liệu (batch cố định) vs. gom batch
+theo độ dài token (src.embedder._encode_bucketed).
+
+Embed được đo theo từng lô --group chunk giống stage embed của ingest streaming
+(INGEST_EMBED_BATCH_SIZE). Cột "padded" là tổng token sau padding của mọi batch,
+ước lượng theo cách chia batch của từng chế độ.
+
+Usage:
+    python scripts/benchmark_length_bucketing.py --pdf path/to/file.pdf
+    python scripts/benchmark_length_bucketing.py --pdf file.pdf --group 256 --batch-tokens 2048
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src.chunker import split_chunks
+from src.config import settings
+from src.embedder import _MAX_BATCH_FACTOR, _encode_bucketed, _get_model, _token_lengths, plan_length_batches
+from src.text_extractor import extract_pdf_text
+
+
+def _fixed_padded(lengths: np.ndarray, batch_size: int) -> int:
+    """Token sau padding khi model.encode chia batch cố định (sắp theo số ký tự, giống sentence-transformers)."""
+    return sum(len(b) * int(b.max()) for b in np.array_split(lengths, range(batch_size, len(lengths), batch_size)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark length-bucketed embedding batches")
+    parser.add_argument("--pdf", type=Path, required=True, help="File PDF để chunk và embed")
+    parser.add_argument("--group", type=int, default=settings.ingest_embed_batch_size,
+                        help="Số chunk mỗi lần gọi embed (như stage embed của ingest)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--batch-tokens", type=int, default=settings.embed_batch_tokens,
+                        help="Token (kể cả padding) mỗi batch; 0 = batch_size * max_seq_length")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = [chunk.text for chunk in split_chunks(extract_pdf_text(args.pdf))]
+    groups = [texts[i:i + args.group] for i in range(0, len(texts), args.group)]
+    model = _get_model()
+    model.encode(texts[:8])  # warm up
+
+    token_budget = args.batch_tokens or args.batch_size * int(model.max_seq_length)
+
+    real = fixed_padded = bucket_padded = 0
+    for group in groups:
+        lengths = _token_lengths(model, group)
+        real += int(lengths.sum())
+        by_chars = lengths[np.argsort([-len(t) for t in group], kind="stable")]
+        fixed_padded += _fixed_padded(by_chars, args.batch_size)
+        bucket_padded += sum(len(b) * int(lengths[b].max())
+                             for b in plan_length_batches(lengths, token_budget, args.batch_size * _MAX_BATCH_FACTOR))
+
+    def run_fixed() -> None:
+        for group in groups:
+            model.encode(group, batch_size=args.batch_size, show_progress_bar=False, convert_to_numpy=True)
+
+    def run_bucketed() -> None:
+        for group in groups:
+            _encode_bucketed(model, group, args.batch_size, token_budget)
+
+    print(f"pdf={args.pdf} chunks={len(texts)} group={args.group} batch_size={args.batch_size} "
+          f"token_budget={token_budget} real_tokens={real}")
+    print(f"{'mode':<10}{'seconds':>10}{'chunks/s':>10}{'padded':>10}{'pad waste':>11}{'speedup':>9}")
+    baseline = None
+    for name, fn, padded in (("fixed", run_fixed, fixed_padded), ("bucketed", run_bucketed, bucket_padded)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = perf_counter()
+            fn()
+            best = min(best, perf_counter() - start)
+        baseline = baseline or best
+        print(f"{name:<10}{best:>10.2f}{len(texts) / best:>10.1f}{padded:>10}"
+              f"{100 * (padded - real) / max(padded, 1):>10.1f}%{baseline / best:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
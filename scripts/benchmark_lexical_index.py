@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Benchmark index từ khoá BM25 (src/lexical_index.py): thời gian build segment từ
+TextChunk, dung lượng trên đĩa, thời gian load và latency truy vấn.
+
+Corpus = các chunk của --pdf, nhân bản --copies lần thành các tài liệu riêng (mỗi
+bản một segment, như khi user có nhiều tài liệu). Câu hỏi từ khoá được lấy mẫu từ
+từ điển (1-3 term hiếm, kiểu mã lỗi / tên riêng). --with-encode đo thêm
+model.encode một câu hỏi để so với đường dense (cần gọi model).
+
+Usage:
+    python scripts/benchmark_lexical_index.py --pdf path/to/file.pdf
+    python scripts/benchmark_lexical_index.py --pdf file.pdf --copies 50 --queries 200 --with-encode
+"""
+
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src.chunker import split_chunks
+from src.lexical_index import LexicalIndex, LexicalSegmentBuilder
+from src.text_extractor import extract_pdf_text
+
+_USER_ID = "benchmark-user"
+
+
+def _percentiles(seconds: list[float]) -> str:
+    ms = np.array(seconds) * 1000
+    return f"p50={np.percentile(ms, 50):.2f}ms p95={np.percentile(ms, 95):.2f}ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark BM25 lexical index build and query latency")
+    parser.add_argument("--pdf", type=Path, required=True)
+    parser.add_argument("--copies", type=int, default=20, help="Số tài liệu (bản sao của --pdf)")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--with-encode", action="store_true", help="Đo thêm encode câu hỏi bằng model embedding")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    chunks = list(split_chunks(extract_pdf_text(args.pdf)))
+    raw_bytes = sum(len(chunk.text.encode("utf-8")) for chunk in chunks) * args.copies
+    root = Path(tempfile.mkdtemp(prefix="lexical-bench-"))
+    index = LexicalIndex(root)
+
+    try:
+        build_s, save_s = [], []
+        segment = None
+        for copy in range(args.copies):
+            start = perf_counter()
+            document_id = str(uuid.UUID(int=copy))
+            builder = LexicalSegmentBuilder(document_id)
+            for chunk in chunks:
+                builder.add(chunk)
+            segment = builder.build()
+            build_s.append(perf_counter() - start)
+            start = perf_counter()
+            index.write_document(_USER_ID, document_id, segment)
+            save_s.append(perf_counter() - start)
+
+        disk_bytes = sum(path.stat().st_size for path in root.rglob("*.npz"))
+        print(f"pdf={args.pdf} chunks/doc={len(chunks)} docs={args.copies} total chunks={len(chunks) * args.copies}")
+        print(f"terms/doc={len(segment.term_ids)} postings/doc={len(segment.chunk_ids)}")
+        print(f"build/doc: {_percentiles(build_s)}  ({len(chunks) / np.median(build_s):.0f} chunks/s)")
+        print(f"save/doc:  {_percentiles(save_s)}")
+        print(f"on disk:   {disk_bytes / 1e6:.2f} MB for {raw_bytes / 1e6:.2f} MB chunk text "
+              f"({disk_bytes / max(raw_bytes, 1):.2f}x, incl. text)")
+
+        rng = random.Random(args.seed)
+        vocab = [term for term in segment.term_ids if len(term) > 2]
+        rare = [term for term in vocab if len(segment.postings(term)[0]) <= 3] or vocab
+        queries = [" ".join(rng.sample(rare, rng.randint(1, min(3, len(rare))))) for _ in range(args.queries)]
+
+        start = perf_counter()
+        index.search(queries[0], _USER_ID, args.top_k)
+        print(f"cold query (load {args.copies} segments): {(perf_counter() - start) * 1000:.1f}ms")
+
+        latencies, hits = [], 0
+        for query in queries:
+            start = perf_counter()
+            results = index.search(query, _USER_ID, args.top_k)
+            latencies.append(perf_counter() - start)
+            hits += bool(results)
+        print(f"warm query: {_percentiles(latencies)}  ({hits}/{len(queries)} queries with results)")
+
+        if args.with_encode:
+            from src.embedder import _get_model
+
+            model = _get_model()
+            model.encode(queries[:4])  # warm up
+            encode_s = []
+            for query in queries:
+                start = perf_counter()
+                model.encode([query])
+                encode_s.append(perf_counter() - start)
+            print(f"dense query encode only (no vector search): {_percentiles(encode_s)}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Benchmark client Ollama dưới tải đồng thời: requests.post không session (cách cũ)
+vs OllamaClient pooled (sync từ thread pool, async từ một event loop).
+
+Server giả lập /api/generate cục bộ (HTTP/1.1 keep-alive) trả lời sau --latency-ms
+và đếm số kết nối TCP được mở. Với --ollama-url, benchmark gọi Ollama thật (khi đó
+không đếm được số kết nối).
+
+Usage:
+    python scripts/benchmark_llm_client.py
+    python scripts/benchmark_llm_client.py --requests 400 --concurrency 8 32 --latency-ms 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, List
+
+import numpy as np
+import requests
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+
+class _StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, latency_s: float) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency_s = latency_s
+        self.connections = 0
+        self.lock = threading.Lock()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: _StandIn
+    protocol_version = "HTTP/1.1"  # Giữ kết nối giữa các request như Ollama
+    disable_nagle_algorithm = True  # Như net/http của Ollama (TCP_NODELAY)
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self) -> None:  # noqa: N802 - API của BaseHTTPRequestHandler
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(self.server.latency_s)
+        body = json.dumps({"model": payload["model"], "response": "Câu trả lời.", "done": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def _threaded(call: Callable[[], None], n_requests: int, concurrency: int) -> List[float]:
+    def timed(_: int) -> float:
+        start = perf_counter()
+        call()
+        return perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(timed, range(n_requests)))
+
+
+async def _async(n_requests: int, concurrency: int, prompt: str) -> List[float]:
+    from src.llm_client import agenerate_answer
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def timed() -> float:
+        async with slots:
+            start = perf_counter()
+            await agenerate_answer(prompt)
+            return perf_counter() - start
+
+    return await asyncio.gather(*(timed() for _ in range(n_requests)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark pooled keep-alive Ollama client under concurrent load")
+    parser.add_argument("--ollama-url", default=None, help="Ollama thật; bỏ trống = server giả lập")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="Latency giả lập mỗi request")
+    args = parser.parse_args()
+
+    server = None
+    if args.ollama_url:
+        os.environ["OLLAMA_URL"] = args.ollama_url
+    else:
+        server = _StandIn(args.latency_ms / 1000)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    if args.model:
+        os.environ["OLLAMA_MODEL"] = args.model
+
+    from src.config import settings  # Đọc OLLAMA_URL khi import
+    from src.llm_client import generate_answer
+
+    prompt = "Giải thích ngắn gọn lập trình hướng đối tượng là gì?"
+    url = settings.ollama_url.rstrip("/") + "/api/generate"
+    payload = {"model": settings.ollama_model, "prompt": prompt, "stream": False}
+
+    def old_call() -> None:
+        requests.post(url, json=payload, timeout=120).raise_for_status()
+
+    print(f"requests={args.requests} latency={args.latency_ms}ms")
+    print(f"{'client':<16}{'conc':>5}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'connections':>13}")
+    for concurrency in args.concurrency:
+        runs = [
+            ("requests.post", lambda: _threaded(old_call, args.requests, concurrency)),
+            ("pooled sync", lambda: _threaded(lambda: generate_answer(prompt), args.requests, concurrency)),
+            ("pooled async", lambda: asyncio.run(_async(args.requests, concurrency, prompt))),
+        ]
+        for name, run in runs:
+            if server is not None:
+                server.connections = 0
+            start = perf_counter()
+            latencies = np.array(run()) * 1000
+            seconds = perf_counter() - start
+            connections = server.connections if server is not None else "-"
+            print(
+                f"{name:<16}{concurrency:>5}{args.requests / seconds:>9.0f}"
+                f"{np.percentile(latencies, 50):>9.1f}{np.percentile(latencies, 95):>9.1f}{connections:>13}"
+            )
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Benchmark time-to-first-token: generate_answer (stream=False) vs stream_answer.
+
+Mặc định dùng một Ollama giả lập cục bộ (HTTP thật, NDJSON như /api/generate)
+sinh --tokens token, mỗi token cách nhau --token-ms, sau --prefill-ms xử lý
+prompt. Với --ollama-url, benchmark gọi Ollama thật (cần model đã pull).
+
+Usage:
+    python scripts/benchmark_llm_streaming.py
+    python scripts/benchmark_llm_streaming.py --tokens 400 --token-ms 30 --prefill-ms 400
+    python scripts/benchmark_llm_streaming.py --ollama-url http://localhost:11434 --model llama3
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+
+class _StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, tokens: int, token_s: float, prefill_s: float) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.tokens = tokens
+        self.token_s = token_s
+        self.prefill_s = prefill_s
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: _StandIn
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:  # noqa: N802 - API của BaseHTTPRequestHandler
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self.close_connection = True  # Client đóng response sau khi đọc xong
+        words = [f"từ{i} " for i in range(self.server.tokens)]
+        time.sleep(self.server.prefill_s)
+        if not payload.get("stream", True):
+            time.sleep(self.server.token_s * len(words))
+            body = json.dumps({"model": payload["model"], "response": "".join(words), "done": True}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        lines = [{"model": payload["model"], "response": word, "done": False} for word in words]
+        lines.append({"model": payload["model"], "response": "", "done": True, "eval_count": len(words)})
+        for i, line in enumerate(lines):
+            if i:
+                time.sleep(self.server.token_s)
+            data = json.dumps(line).encode() + b"\n"
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark time-to-first-token of streaming vs blocking answers")
+    parser.add_argument("--ollama-url", default=None, help="Ollama thật; bỏ trống = server giả lập")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--tokens", type=int, default=200, help="Số token server giả lập sinh ra")
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--prefill-ms", type=float, default=300.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    server = None
+    if args.ollama_url:
+        os.environ["OLLAMA_URL"] = args.ollama_url
+    else:
+        server = _StandIn(args.tokens, args.token_ms / 1000, args.prefill_ms / 1000)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    if args.model:
+        os.environ["OLLAMA_MODEL"] = args.model
+
+    from src.llm_client import generate_answer, stream_answer  # Đọc OLLAMA_URL khi import config
+
+    prompt = "Giải thích ngắn gọn lập trình hướng đối tượng là gì?"
+    blocking, first, total = [], [], []
+    for _ in range(args.repeat):
+        start = perf_counter()
+        generate_answer(prompt)
+        blocking.append(perf_counter() - start)
+
+        start = perf_counter()
+        first_at = None
+        for _token in stream_answer(prompt):
+            if first_at is None:
+                first_at = perf_counter() - start
+        first.append(first_at)
+        total.append(perf_counter() - start)
+
+    print(f"{'mode':<12}{'first text ms':>15}{'total ms':>11}")
+    print(f"{'blocking':<12}{median(blocking) * 1000:>15.0f}{median(blocking) * 1000:>11.0f}")
+    print(f"{'streaming':<12}{median(first) * 1000:>15.0f}{median(total) * 1000:>11.0f}")
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Benchmark trích xuất PDF theo số worker (src.text_extractor.extract_pdf_text).
+
+workers=1 là đường tuần tự cũ; các mức khác dùng process pool. Kiểm tra output
+giống hệt đường tuần tự (cùng trang, cùng thứ tự, cùng nội dung).
+
+Usage:
+    python scripts/benchmark_pdf_extraction.py --pdf path/to/large.pdf
+    python scripts/benchmark_pdf_extraction.py --pdf big.pdf --workers 1 2 4 8 --pages-per-task 8
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+from time import perf_counter
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src.config import settings
+from src.text_extractor import _get_pool, extract_pdf_text
+
+
+def _extract(pdf: Path, workers: int, pages_per_task: int) -> tuple[list[tuple[int, str]], float]:
+    start = perf_counter()
+    pages = [(chunk.page_number, chunk.text) for chunk in extract_pdf_text(pdf, workers, pages_per_task)]
+    return pages, perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark parallel PDF extraction")
+    parser.add_argument("--pdf", type=Path, required=True, help="File PDF nhiều trang")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Các mức worker")
+    parser.add_argument("--pages-per-task", type=int, default=settings.pdf_pages_per_task)
+    args = parser.parse_args()
+    logging.getLogger("src.text_extractor").setLevel(logging.WARNING)
+
+    baseline, baseline_s = _extract(args.pdf, 1, args.pages_per_task)
+    print(f"pdf={args.pdf} pages_with_text={len(baseline)} pages_per_task={args.pages_per_task}")
+    print(f"{'workers':>8}{'seconds':>10}{'pages/s':>10}{'speedup':>10}{'same output':>13}")
+    print(f"{1:>8}{baseline_s:>10.2f}{len(baseline) / baseline_s:>10.1f}{1.0:>10.2f}{'-':>13}")
+
+    for workers in args.workers:
+        if workers <= 1:
+            continue
+        _get_pool(workers).submit(int).result()  # Khởi động worker trước, không tính thời gian spawn
+        pages, seconds = _extract(args.pdf, workers, args.pages_per_task)
+        print(f"{workers:>8}{seconds:>10.2f}{len(pages) / seconds:>10.1f}{baseline_s / seconds:>10.2f}"
+              f"{str(pages == baseline):>13}")
+
+
+if __name__ == "__main__":
+    main()
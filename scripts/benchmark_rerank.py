@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Benchmark bước rerank cross-encoder: latency một lượt batch theo số ứng viên
+(cold = chưa có điểm trong cache, warm = mọi điểm đã cache), để chọn RERANK_BUDGET_MS.
+
+Usage:
+    python scripts/benchmark_rerank.py
+    python scripts/benchmark_rerank.py --candidates 5 10 20 40 --chunk-chars 900 --repeats 5
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src.config import settings
+from src.reranker import CrossEncoderReranker, RerankScoreCache
+from src.retriever import RetrievedChunk
+
+_SENTENCE = "Lập trình hướng đối tượng tổ chức chương trình thành các lớp và đối tượng có trạng thái và hành vi. "
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark cross-encoder rerank latency")
+    parser.add_argument("--model", default=settings.rerank_model)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[5, 10, 20, 40])
+    parser.add_argument("--chunk-chars", type=int, default=900, help="Độ dài mỗi ứng viên (ký tự)")
+    parser.add_argument("--batch-size", type=int, default=settings.rerank_batch_size)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    reranker = CrossEncoderReranker(args.model, args.batch_size, budget_ms=0, cache=RerankScoreCache(100_000))
+    start = perf_counter()
+    reranker.warm_up().result()
+    print(f"model={args.model} load={perf_counter() - start:.1f}s batch_size={args.batch_size}")
+    print(f"{'candidates':>10}{'cold p50 ms':>13}{'cold max ms':>13}{'warm p50 ms':>13}")
+
+    body = (_SENTENCE * (args.chunk_chars // len(_SENTENCE) + 1))[: args.chunk_chars]
+    for n in args.candidates:
+        cold, warm = [], []
+        for r in range(args.repeats):
+            chunks = [RetrievedChunk(f"[{r}-{i}] {body}", i, None, 0.5) for i in range(n)]
+            query = f"Lập trình hướng đối tượng là gì? ({r})"
+            cold.append(reranker.rerank(query, chunks)[1]["ms"])
+            warm.append(reranker.rerank(query, chunks)[1]["ms"])
+        print(f"{n:>10}{np.percentile(cold, 50):>13.1f}{max(cold):>13.1f}{np.percentile(warm, 50):>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Benchmark chấm điểm per-document trong retrieve_similar_chunks.
+
+So sánh vòng lặp cũ (cosine từng row + sort toàn bộ) với đường
+vectorized (_rank_rows: ma trận float32 liên tục + matvec + argpartition).
+Dữ liệu giả lập giống response Supabase: embedding dạng chuỗi JSON.
+
+Usage:
+    python scripts/benchmark_retrieval.py
+    python scripts/benchmark_retrieval.py --rows 5000 --dim 768 --top-k 5 --repeat 10
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src.retriever import (
+    RetrievedChunk,
+    _build_embedding_matrix,
+    _normalize_rows,
+    _rank_rows,
+    _score_matrix,
+    _top_k_indices,
+)
+
+
+def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Cosine similarity giữa hai vector (cách tính từng row của vòng lặp cũ)."""
+    norm_a = np.linalg.norm(a)
+    norm_b = np.linalg.norm(b)
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
+    return float(np.dot(a, b) / (norm_a * norm_b))
+
+
+def _make_rows(n_rows: int, dim: int, seed: int = 0) -> list[dict]:
+    """Sinh rows giống bảng document_embeddings (embedding là chuỗi JSON)."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n_rows, dim)).astype(np.float32)
+    return [
+        {
+            "content": f"chunk {i}",
+            "chunk_index": i + 1,
+            "page_number": i // 4 + 1,
+            "embedding": json.dumps(vectors[i].tolist()),
+        }
+        for i in range(n_rows)
+    ]
+
+
+def _legacy_rank(query_vector: np.ndarray, rows: list[dict], top_k: int) -> list[RetrievedChunk]:
+    """Bản sao vòng lặp cũ: json.loads + cosine từng row + sort toàn bộ list."""
+    scored: list[RetrievedChunk] = []
+    for row in rows:
+        embedding = np.asarray(json.loads(row["embedding"]), dtype=np.float32)
+        scored.append(
+            RetrievedChunk(
+                content=row["content"],
+                chunk_index=row.get("chunk_index", 0) or 0,
+                page_number=row.get("page_number"),
+                similarity=_cosine_similarity(query_vector, embedding),
+            )
+        )
+    scored.sort(key=lambda item: item.similarity, reverse=True)
+    return scored[: max(top_k, 1)]
+
+
+def _legacy_score(query_vector: np.ndarray, vectors: list[np.ndarray], top_k: int) -> list[float]:
+    """Chỉ phần chấm điểm của vòng lặp cũ, trên vector đã decode sẵn."""
+    scores = [_cosine_similarity(query_vector, vector) for vector in vectors]
+    scores.sort(reverse=True)
+    return scores[: max(top_k, 1)]
+
+
+def _matrix_score(query_vector: np.ndarray, matrix: np.ndarray, top_k: int) -> np.ndarray:
+    """Chỉ phần chấm điểm của đường vectorized, trên ma trận đã decode sẵn."""
+    scores = _score_matrix(query_vector, _normalize_rows(matrix.copy()))
+    return scores[_top_k_indices(scores, top_k)]
+
+
+def _time(func, repeat: int) -> float:
+    """Trả về thời gian trung bình (ms) của func qua repeat lần chạy."""
+    start = perf_counter()
+    for _ in range(repeat):
+        func()
+    return (perf_counter() - start) * 1000 / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark per-document scoring")
+    parser.add_argument("--rows", type=int, default=2000, help="Số chunk trong document (default: 2000)")
+    parser.add_argument("--dim", type=int, default=768, help="Số chiều embedding (default: 768)")
+    parser.add_argument("--top-k", type=int, default=5, help="top_k (default: 5)")
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần lặp mỗi phép đo (default: 5)")
+    args = parser.parse_args()
+
+    rows = _make_rows(args.rows, args.dim)
+    query_vector = np.random.default_rng(1).standard_normal(args.dim).astype(np.float32)
+
+    legacy = _legacy_rank(query_vector, rows, args.top_k)
+    vectorized = _rank_rows(query_vector, rows, args.top_k)
+    same_order = [c.chunk_index for c in legacy] == [c.chunk_index for c in vectorized]
+    max_diff = max(abs(a.similarity - b.similarity) for a, b in zip(legacy, vectorized))
+
+    legacy_ms = _time(lambda: _legacy_rank(query_vector, rows, args.top_k), args.repeat)
+    vectorized_ms = _time(lambda: _rank_rows(query_vector, rows, args.top_k), args.repeat)
+
+    # Tách riêng phần chấm điểm: decode JSON là chi phí chung của cả hai đường
+    matrix, _ = _build_embedding_matrix(rows, args.dim)
+    vectors = list(matrix)
+    decode_ms = _time(lambda: _build_embedding_matrix(rows, args.dim), args.repeat)
+    legacy_score_ms = _time(lambda: _legacy_score(query_vector, vectors, args.top_k), args.repeat)
+    matrix_score_ms = _time(lambda: _matrix_score(query_vector, matrix, args.top_k), args.repeat)
+
+    print(f"rows={args.rows} dim={args.dim} top_k={args.top_k} repeat={args.repeat}")
+    print("End-to-end (decode JSON + score + top_k):")
+    print(f"  legacy loop : {legacy_ms:9.2f} ms")
+    print(f"  vectorized  : {vectorized_ms:9.2f} ms  (x{legacy_ms / vectorized_ms:.1f})")
+    print(f"Decode JSON → matrix: {decode_ms:9.2f} ms")
+    print("Scoring only (embeddings đã decode):")
+    print(f"  legacy loop : {legacy_score_ms:9.2f} ms")
+    print(f"  matvec      : {matrix_score_ms:9.2f} ms  (x{legacy_score_ms / matrix_score_ms:.1f})")
+    print(f"  same top_k order: {same_order}  max |Δsimilarity|: {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+So sánh chia chunk theo ký tự (CHUNK_SIZE) và theo token (CHUNK_TOKENS) của src.chunker.
+
+Với mỗi chế độ: số chunk, số token trung bình, số chunk/token vượt max_seq_length
+(phần bị model cắt bỏ khi encode, tức nội dung không được embed) và thời gian model.encode.
+
+Usage:
+    python scripts/benchmark_token_chunker.py --pdf path/to/file.pdf
+    python scripts/benchmark_token_chunker.py --pdf file.pdf --tokens 96 --overlap 16
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from time import perf_counter
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src.chunker import _get_tokenizer, _iter_char_pieces, _iter_token_pieces
+from src.config import settings
+from src.embedder import _get_model
+from src.text_extractor import extract_pdf_text
+
+
+def _measure(name: str, texts: list[str], tokenizer, budget: int, batch_size: int) -> None:
+    lengths = [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+    total = sum(lengths)
+    lost = sum(max(n - budget, 0) for n in lengths)
+    over = sum(1 for n in lengths if n > budget)
+
+    model = _get_model()
+    start = perf_counter()
+    model.encode(texts, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True)
+    seconds = perf_counter() - start
+
+    print(f"{name:<7}{len(texts):>8}{total / max(len(texts), 1):>11.1f}{over:>11}{lost:>12}"
+          f"{100 * lost / max(total, 1):>9.1f}%{seconds:>11.2f}{len(texts) / seconds:>11.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark character vs token-budgeted chunking")
+    parser.add_argument("--pdf", type=Path, required=True, help="File PDF để chunk")
+    parser.add_argument("--tokens", type=int, default=0, help="Số token mỗi chunk (0 = auto theo max_seq_length)")
+    parser.add_argument("--overlap", type=int, default=-1, help="Số token chồng lấn (-1 = theo tỉ lệ CHUNK_OVERLAP)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    tokenizer, max_seq_length = _get_tokenizer()
+    model_budget = max_seq_length - tokenizer.num_special_tokens_to_add()
+    budget = min(args.tokens, model_budget) if args.tokens > 0 else model_budget
+    overlap = args.overlap if args.overlap >= 0 else round(budget * settings.chunk_overlap / settings.chunk_size)
+    overlap = min(overlap, budget // 2)
+
+    pages = list(extract_pdf_text(args.pdf))
+    char_texts = [piece.strip() for _, piece in _iter_char_pieces(pages) if piece.strip()]
+
+    start = perf_counter()
+    token_texts = [piece.strip() for _, piece in _iter_token_pieces(pages, budget, overlap) if piece.strip()]
+    chunk_s = perf_counter() - start
+
+    print(f"pdf={args.pdf} pages={len(pages)} max_seq_length={max_seq_length} budget={budget} overlap={overlap}")
+    print(f"chars: chunk_size={settings.chunk_size} overlap={settings.chunk_overlap}; "
+          f"token chunking took {chunk_s:.2f}s")
+    print(f"{'mode':<7}{'chunks':>8}{'avg tokens':>11}{'truncated':>11}{'lost tokens':>12}{'wasted':>10}"
+          f"{'encode s':>11}{'chunks/s':>11}")
+    _get_model().encode(char_texts[:8])  # warm up
+    _measure("chars", char_texts, tokenizer, model_budget, args.batch_size)
+    _measure("tokens", token_texts, tokenizer, model_budget, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Benchmark định dạng vector gửi lên / đọc về từ Supabase (src.vector_codec).
+
+Ghi: kích thước payload JSON của một batch insert 100 rows và thời gian mã hoá
+(encode_vectors + json.dumps như postgrest-py) cho list float và literal pgvector.
+Đọc: thời gian giải mã n chuỗi literal bằng json.loads từng dòng (cách cũ)
+so với decode_vectors, cùng sai số lớn nhất / sai lệch cosine do làm tròn.
+
+Usage:
+    python scripts/benchmark_vector_codec.py
+    python scripts/benchmark_vector_codec.py --rows 5000 --precision 4 5 6
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.vector_codec import decode_vectors, encode_vectors
+
+_INSERT_BATCH = 100  # Giống BATCH_SIZE của insert_embeddings
+
+
+def _encode(matrix: np.ndarray, wire_format: str, precision: int) -> tuple[float, int]:
+    """(giây, số byte trung bình mỗi batch insert) khi mã hoá cả ma trận thành payload JSON."""
+    start = perf_counter()
+    vectors = encode_vectors(matrix, wire_format, precision)
+    sizes = [
+        len(json.dumps([{"embedding": vector} for vector in vectors[i:i + _INSERT_BATCH]]))
+        for i in range(0, len(vectors), _INSERT_BATCH)
+    ]
+    return perf_counter() - start, int(np.mean(sizes))
+
+
+def _cosine_error(a: np.ndarray, b: np.ndarray) -> float:
+    cos = np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return float(np.max(np.abs(1.0 - cos)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark vector wire encoding")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--precision", type=int, nargs="+", default=[4, 5, 6])
+    args = parser.parse_args()
+
+    # Phân bố gần giống output mpnet (chưa chuẩn hoá): giá trị cỡ 0.01 - 0.5
+    matrix = (np.random.default_rng(0).standard_normal((args.rows, args.dim)) * 0.15).astype(np.float32)
+
+    print(f"rows={args.rows} dim={args.dim} insert_batch={_INSERT_BATCH}")
+    print(f"{'format':<10}{'encode s':>10}{'KB/batch':>10}{'decode s (json)':>17}{'decode s (fast)':>17}"
+          f"{'max |Δ|':>10}{'max Δcos':>10}")
+
+    seconds, size = _encode(matrix, "json", 0)
+    literals = [json.dumps(vector) for vector in matrix.tolist()]
+    start = perf_counter()
+    np.array([json.loads(s) for s in literals], dtype=np.float32)
+    json_decode_s = perf_counter() - start
+    print(f"{'json':<10}{seconds:>10.3f}{size / 1024:>10.1f}{json_decode_s:>17.3f}{'-':>17}{0.0:>10.1e}{0.0:>10.1e}")
+
+    for precision in args.precision:
+        seconds, size = _encode(matrix, "text", precision)
+        literals = encode_vectors(matrix, "text", precision)
+
+        start = perf_counter()
+        np.array([json.loads(s) for s in literals], dtype=np.float32)
+        json_decode_s = perf_counter() - start
+
+        start = perf_counter()
+        decoded, kept = decode_vectors(literals, args.dim)
+        fast_decode_s = perf_counter() - start
+        assert len(kept) == args.rows
+
+        print(f"{f'text/{precision}':<10}{seconds:>10.3f}{size / 1024:>10.1f}{json_decode_s:>17.3f}"
+              f"{fast_decode_s:>17.3f}{float(np.max(np.abs(decoded - matrix))):>10.1e}"
+              f"{_cosine_error(decoded, matrix):>10.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,7 +21,8 @@ except Exception:
     # dotenv là tuỳ chọn; config.py có thể đọc env từ process
     pass
 
-from src.pipeline import process_document
+from src.pipeline import process_document, remove_document
+from src.validators import DocumentIngestRequest
 
 
 def parse_args() -> argparse.Namespace:
@@ -30,12 +31,26 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument("document_id", help="Định danh tài liệu trong Supabase")
     parser.add_argument("job_id", nargs='?', default=None, help="ID của embedding job để tracking progress")
+    parser.add_argument(
+        "--force-refresh",
+        action="store_true",
+        help="Embed lại toàn bộ dù file và tham số ingest không đổi",
+    )
+    parser.add_argument(
+        "--delete",
+        action="store_true",
+        help="Tài liệu đã/đang bị xoá: gỡ embedding và index từ khoá thay vì ingest",
+    )
     return parser.parse_args()
 
 
 def main() -> None:
     args = parse_args()
-    process_document(args.document_id, args.job_id)
+    request = DocumentIngestRequest(document_id=args.document_id, force_refresh=args.force_refresh)
+    if args.delete:
+        remove_document(request.document_id)
+        return
+    process_document(request.document_id, args.job_id, force_refresh=request.force_refresh)
 
 
 if __name__ == "__main__":
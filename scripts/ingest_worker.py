@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+"""
+Ingestion worker chạy lâu dài: load model một lần và xử lý các document_id
+được đưa vào hàng đợi SQLite (thay cho việc spawn ingest_document.py cho mỗi tài liệu).
+
+Usage:
+    # Chạy worker (progress JSON mỗi dòng trên stdout, log trên stderr)
+    python scripts/ingest_worker.py run --concurrency 2
+    # Dòng PROGRESS:<phần trăm>:<đã xử lý>:<tổng> như ingest_document.py, kèm EVENT:<json> (có job_id);
+    # luôn xử lý từng tài liệu một để các dòng PROGRESS không xen kẽ giữa các job
+    python scripts/ingest_worker.py run --progress legacy
+    # Đưa tài liệu vào hàng đợi (không import torch, chạy nhanh)
+    python scripts/ingest_worker.py enqueue <document_id> [job_id] [--force-refresh]
+    python scripts/ingest_worker.py status
+"""
+
+import argparse
+import json
+import logging
+import signal
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src.config import settings
+from src.ingest_queue import open_queue
+from src.validators import DocumentIngestRequest
+
+
+def _run(args: argparse.Namespace) -> None:
+    # Import muộn: chỉ lệnh run cần model/torch
+    from src.ingest_worker import IngestWorker, json_lines, progress_lines
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    concurrency = args.concurrency
+    if args.progress == "legacy" and concurrency > 1:
+        # Dòng PROGRESS: ba trường không có job_id: nhiều job song song sẽ xen kẽ, không phân biệt được
+        logging.getLogger(__name__).warning(f"--progress legacy: chạy một tài liệu mỗi lần (bỏ qua --concurrency {concurrency})")
+        concurrency = 1
+    worker = IngestWorker(
+        open_queue(),
+        concurrency=concurrency,
+        poll_interval=args.poll_seconds,
+        emit=progress_lines if args.progress == "legacy" else json_lines,
+    )
+
+    def _shutdown(signum, frame) -> None:  # noqa: ARG001 - chữ ký signal handler
+        logging.getLogger(__name__).info("Stopping after running jobs finish...")
+        worker.stop()
+
+    signal.signal(signal.SIGINT, _shutdown)
+    signal.signal(signal.SIGTERM, _shutdown)
+    worker.run(drain=args.drain)
+
+
+def _enqueue(args: argparse.Namespace) -> None:
+    request = DocumentIngestRequest(document_id=args.document_id, force_refresh=args.force_refresh)
+    queue_id = open_queue().enqueue(request.document_id, args.job_id, request.force_refresh)
+    print(json.dumps({"queue_id": queue_id, "document_id": request.document_id, "job_id": args.job_id}))
+
+
+def _status(args: argparse.Namespace) -> None:
+    queue = open_queue()
+    print(json.dumps({
+        "counts": queue.stats(),
+        "recent": [
+            {"queue_id": job.id, "document_id": job.document_id, "job_id": job.job_id, "status": job.status,
+             "attempts": job.attempts, "error": job.error, "result": job.result}
+            for job in queue.recent(args.limit)
+        ],
+    }, ensure_ascii=False, indent=2))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Worker ingest nhiều tài liệu với hàng đợi bền vững")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Chạy worker")
+    run.add_argument("--concurrency", type=int, default=settings.ingest_worker_concurrency,
+                     help="Số tài liệu xử lý đồng thời")
+    run.add_argument("--poll-seconds", type=float, default=settings.ingest_worker_poll_seconds)
+    run.add_argument("--progress", choices=["json", "legacy"], default="json",
+                     help="json: event JSON mỗi dòng; legacy: dòng PROGRESS: như ingest_document.py + EVENT:<json> "
+                          "(concurrency 1)")
+    run.add_argument("--drain", action="store_true", help="Thoát khi hàng đợi rỗng")
+    run.set_defaults(func=_run)
+
+    enqueue = sub.add_parser("enqueue", help="Đưa tài liệu vào hàng đợi")
+    enqueue.add_argument("document_id", help="Định danh tài liệu trong Supabase")
+    enqueue.add_argument("job_id", nargs="?", default=None, help="ID của embedding job để tracking progress")
+    enqueue.add_argument("--force-refresh", action="store_true",
+                         help="Embed lại toàn bộ dù file và tham số ingest không đổi")
+    enqueue.set_defaults(func=_enqueue)
+
+    status = sub.add_parser("status", help="Thống kê hàng đợi")
+    status.add_argument("--limit", type=int, default=20)
+    status.set_defaults(func=_status)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
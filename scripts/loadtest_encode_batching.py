@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Load test encode câu hỏi: gọi model.encode từng câu vs. qua EncodeBatcher.
+
+Mỗi mức concurrency chạy C thread, mỗi thread gửi --requests câu hỏi khác nhau
+(không đi qua query cache) và đo latency từng lời gọi. In p50/p99 và QPS.
+
+Usage:
+    python scripts/loadtest_encode_batching.py
+    python scripts/loadtest_encode_batching.py --concurrency 1 8 32 128 --max-batch 64 --max-wait-ms 3
+"""
+
+import argparse
+import sys
+import threading
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src.embedder import _get_model
+from src.encode_batcher import EncodeBatcher, _encode_with_model
+
+
+def _run_level(encode, concurrency: int, requests_per_thread: int) -> tuple[list[float], float]:
+    """Chạy concurrency thread gọi encode; trả về (latencies, wall_time)."""
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def worker(worker_id: int) -> None:
+        local: list[float] = []
+        for i in range(requests_per_thread):
+            query = f"Câu hỏi số {worker_id}-{i}: khái niệm lập trình hướng đối tượng là gì?"
+            start = perf_counter()
+            encode(query)
+            local.append(perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(concurrency)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, perf_counter() - start
+
+
+def _report(label: str, concurrency: int, latencies: list[float], wall: float) -> None:
+    p50 = np.percentile(latencies, 50) * 1000
+    p99 = np.percentile(latencies, 99) * 1000
+    print(f"{label:<10}{concurrency:>6}{p50:>10.1f}{p99:>10.1f}{len(latencies) / wall:>10.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test micro-batching encode câu hỏi")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64], help="Các mức concurrency")
+    parser.add_argument("--requests", type=int, default=20, help="Số request mỗi thread (default: 20)")
+    parser.add_argument("--max-batch", type=int, default=32, help="max_batch của batcher (default: 32)")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="max_wait_ms của batcher (default: 5)")
+    args = parser.parse_args()
+
+    model = _get_model()
+    model.encode(["warm up"])
+
+    batcher = EncodeBatcher(_encode_with_model, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    batcher.start()
+
+    print(f"max_batch={args.max_batch} max_wait_ms={args.max_wait_ms} requests/thread={args.requests}")
+    print(f"{'mode':<10}{'conc':>6}{'p50 ms':>10}{'p99 ms':>10}{'QPS':>10}")
+    try:
+        for concurrency in args.concurrency:
+            latencies, wall = _run_level(lambda q: model.encode([q]), concurrency, args.requests)
+            _report("direct", concurrency, latencies, wall)
+            latencies, wall = _run_level(batcher.encode, concurrency, args.requests)
+            _report("batched", concurrency, latencies, wall)
+    finally:
+        batcher.stop()
+    print(f"batcher stats: {batcher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
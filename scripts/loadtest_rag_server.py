@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""
+Load test RAG server (api/rag_server.py) với Supabase RPC và Ollama giả lập cục bộ.
+
+Server giả lập trả /rest/v1/rpc/match_embeddings_by_user sau --db-latency-ms và
+/api/generate sau --llm-latency-ms (HTTP/1.1 keep-alive). RAG server chạy bằng
+uvicorn trong cùng process (model embedding thật, load một lần).
+
+So sánh ở mỗi mức concurrency:
+    blocking: handler async gọi rag_query sync (cách cũ, chặn event loop)
+    async:    POST /rag/query (arag_query: encode trên thread riêng, RPC + LLM async)
+
+Usage:
+    python scripts/loadtest_rag_server.py
+    python scripts/loadtest_rag_server.py --concurrency 1 8 32 --requests 64 --llm-latency-ms 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+_USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class _StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, db_latency_s: float, llm_latency_s: float) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.db_latency_s = db_latency_s
+        self.llm_latency_s = llm_latency_s
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: _StandIn
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self) -> None:  # noqa: N802 - API của BaseHTTPRequestHandler
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.endswith("/api/generate"):
+            time.sleep(self.server.llm_latency_s)
+            body = {"model": payload.get("model"), "response": "Câu trả lời.", "done": True}
+        else:  # RPC match_embeddings_by_user
+            time.sleep(self.server.db_latency_s)
+            body = [
+                {"content": f"Đoạn văn bản {i}", "chunk_index": i, "page_number": 1, "similarity": 0.9 - i * 0.01}
+                for i in range(payload.get("match_count", 5))
+            ]
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _run_level(base_url: str, path: str, concurrency: int, n_requests: int, offset: int) -> tuple[list[float], float, int]:
+    """Gửi n_requests với tối đa concurrency request đồng thời; trả về (latencies, wall, số lỗi)."""
+    import httpx
+
+    slots = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def one(client: httpx.AsyncClient, i: int) -> float:
+        nonlocal errors
+        async with slots:
+            start = perf_counter()
+            # Câu hỏi khác nhau để không trúng query cache
+            response = await client.post(path, json={"query": f"Câu hỏi số {offset + i}?", "user_id": _USER_ID})
+            if response.status_code != 200:
+                errors += 1
+            return perf_counter() - start
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        start = perf_counter()
+        latencies = await asyncio.gather(*(one(client, i) for i in range(n_requests)))
+        return list(latencies), perf_counter() - start, errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test RAG server event-loop concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--requests", type=int, default=64, help="Số request mỗi mức concurrency")
+    parser.add_argument("--db-latency-ms", type=float, default=30.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    args = parser.parse_args()
+
+    stand_in = _StandIn(args.db_latency_ms / 1000, args.llm_latency_ms / 1000)
+    threading.Thread(target=stand_in.serve_forever, daemon=True).start()
+    stand_in_url = f"http://127.0.0.1:{stand_in.server_address[1]}"
+    os.environ.update({"SUPABASE_URL": stand_in_url, "SUPABASE_SERVICE_KEY": "loadtest", "OLLAMA_URL": stand_in_url})
+    os.environ["RETRIEVAL_BACKEND"] = "rpc"
+
+    import uvicorn
+    from api.rag_server import RAGRequest, app
+    from src.rag_service import rag_query
+
+    @app.post("/bench/blocking-query")
+    async def blocking_query(request: RAGRequest):
+        # Cách cũ: gọi pipeline sync ngay trong handler async
+        return rag_query(query=request.query, user_id=request.user_id, top_k=request.top_k)
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.1)
+
+    base_url = f"http://127.0.0.1:{port}"
+    print(f"requests={args.requests} db={args.db_latency_ms}ms llm={args.llm_latency_ms}ms")
+    print(f"{'mode':<10}{'conc':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    offset = 0
+    for concurrency in args.concurrency:
+        for label, path in (("blocking", "/bench/blocking-query"), ("async", "/rag/query")):
+            latencies, wall, errors = asyncio.run(_run_level(base_url, path, concurrency, args.requests, offset))
+            offset += args.requests
+            ms = np.array(latencies) * 1000
+            print(
+                f"{label:<10}{concurrency:>6}{args.requests / wall:>9.1f}"
+                f"{np.percentile(ms, 50):>10.1f}{np.percentile(ms, 95):>10.1f}{errors:>8}"
+            )
+
+    server.should_exit = True
+    stand_in.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Load test cache kết quả web (src/web_cache.py) với Tavily giả lập cục bộ (offline).
+
+Tavily giả lập (có k và ainvoke như TavilySearchAPIRetriever) trả kết quả
+sau --latency-ms và đếm số lời gọi upstream. Mỗi lượt gửi --requests câu hỏi từ
+--distinct câu hỏi khác nhau theo phân phối Zipf (vài câu "trending" chiếm phần
+lớn), khác nhau về hoa thường/khoảng trắng, với tối đa --concurrency request
+đồng thời. So sánh:
+    no cache:       mỗi request gọi Tavily (cách cũ)
+    single-flight:  WEB_CACHE_TTL=0, chỉ gộp lời gọi trùng đang chạy
+    ttl cache:      single-flight + cache TTL (--ttl)
+
+Usage:
+    python scripts/loadtest_web_cache.py
+    python scripts/loadtest_web_cache.py --requests 2000 --distinct 50 --concurrency 64 --latency-ms 800
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+from collections import Counter
+from pathlib import Path
+from time import perf_counter
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv(dotenv_path=PROJECT_ROOT / ".env")
+except Exception:
+    pass
+
+from src.hybrid_retriever import HybridRetriever
+from src.web_cache import WebResultCache
+
+
+class _StandInTavily:
+    """Thay cho TavilySearchAPIRetriever: latency cố định, đếm lời gọi theo câu hỏi."""
+
+    def __init__(self, latency_s: float, k: int = 3) -> None:
+        self.latency_s = latency_s
+        self.k = k
+        self.calls: Counter = Counter()
+
+    def _docs(self, query: str) -> List[SimpleNamespace]:
+        self.calls[query.casefold()] += 1
+        return [
+            SimpleNamespace(
+                page_content=f"Kết quả {i} cho '{query}'",
+                metadata={"source": f"https://example.com/{i}", "title": f"Web {i}"},
+            )
+            for i in range(self.k)
+        ]
+
+    async def ainvoke(self, query: str) -> List[SimpleNamespace]:
+        await asyncio.sleep(self.latency_s)
+        return self._docs(query)
+
+
+def _workload(n_requests: int, distinct: int, seed: int) -> List[str]:
+    """Câu hỏi theo Zipf (s=1.1) với biến thể hoa thường/khoảng trắng của cùng câu."""
+    rng = random.Random(seed)
+    weights = [1 / (rank ** 1.1) for rank in range(1, distinct + 1)]
+    picks = rng.choices(range(distinct), weights=weights, k=n_requests)
+    variants = (str, str.upper, lambda q: f"  {q} ", lambda q: q.replace(" ", "  "))
+    return [rng.choice(variants)(f"Tin tức công nghệ số {i} hôm nay?") for i in picks]
+
+
+async def _run(queries: List[str], concurrency: int, tavily: _StandInTavily, cache: WebResultCache | None, k: int) -> tuple[List[float], float]:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(query: str) -> float:
+        async with slots:
+            start = perf_counter()
+            if cache is None:
+                await tavily.ainvoke(query)
+            else:
+                await cache.aget_or_fetch(HybridRetriever._web_cache_key(query, k), lambda: tavily.ainvoke(query))
+            return perf_counter() - start
+
+    start = perf_counter()
+    latencies = await asyncio.gather(*(one(query) for query in queries))
+    return list(latencies), perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test TTL + single-flight web result cache offline")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--distinct", type=int, default=40, help="Số câu hỏi khác nhau")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="Latency giả lập mỗi lời gọi Tavily")
+    parser.add_argument("--ttl", type=float, default=900.0)
+    parser.add_argument("--k", type=int, default=3, help="web_max_results")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    queries = _workload(args.requests, args.distinct, args.seed)
+    modes = [
+        ("no cache", None),
+        ("single-flight", WebResultCache(max_size=512, ttl=0)),
+        ("ttl cache", WebResultCache(max_size=512, ttl=args.ttl)),
+    ]
+
+    print(
+        f"requests={args.requests} distinct={args.distinct} concurrency={args.concurrency} "
+        f"latency={args.latency_ms}ms"
+    )
+    print(f"{'mode':<15}{'tavily calls':>13}{'max/query':>11}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'shared':>8}{'hits':>7}")
+    for label, cache in modes:
+        tavily = _StandInTavily(args.latency_ms / 1000, args.k)
+        latencies, wall = asyncio.run(_run(queries, args.concurrency, tavily, cache, args.k))
+        ms = np.array(latencies) * 1000
+        stats = cache.stats() if cache is not None else {"shared": "-", "hits": "-"}
+        print(
+            f"{label:<15}{sum(tavily.calls.values()):>13}{max(tavily.calls.values()):>11}"
+            f"{args.requests / wall:>9.1f}{np.percentile(ms, 50):>9.1f}{np.percentile(ms, 95):>9.1f}"
+            f"{stats['shared']:>8}{stats['hits']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
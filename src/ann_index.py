@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import logging
+import threading
+from dataclasses import dataclass
+from time import monotonic
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .config import settings
+from .corpus_epoch import corpus_epoch
+from .retriever import RetrievedChunk, _build_embedding_matrix, _normalize_rows
+from .supabase_client import get_supabase_client
+from .vector_codec import decode_vector
+
+logger = logging.getLogger(__name__)
+
+"""
+Index ANN (HNSW) in-process theo từng user, thay cho RPC match_embeddings_by_user.
+
+Index được build từ các row document_embeddings của user, giữ trong RAM và
+truy vấn cục bộ. Index được build lại sau ANN_INDEX_TTL giây hoặc khi tài liệu
+của user được ingest lại hoặc bị xoá: pipeline bump epoch corpus của user
+(corpus_epoch, dùng chung với answer_cache) nên RAG server thấy cả ingest chạy ở process khác.
+Cần cài hnswlib (tuỳ chọn): pip install hnswlib
+"""
+
+_PAGE_SIZE = 1000  # PostgREST mặc định giới hạn 1000 rows mỗi request
+
+
+@dataclass(frozen=True)
+class AnnParams:
+    """Tham số HNSW: đánh đổi recall ↔ latency/bộ nhớ."""
+
+    m: int = settings.ann_m                              # Số cạnh mỗi node (↑ recall, ↑ RAM)
+    ef_construction: int = settings.ann_ef_construction  # Độ rộng tìm kiếm khi build (↑ chất lượng graph)
+    ef_search: int = settings.ann_ef_search              # Độ rộng tìm kiếm khi query (↑ recall, ↑ latency)
+
+
+def _import_hnswlib():
+    """Import hnswlib khi cần, báo lỗi rõ ràng nếu chưa cài."""
+    try:
+        import hnswlib  # type: ignore
+    except ImportError as exc:
+        raise RuntimeError("RETRIEVAL_BACKEND=hnsw cần thư viện hnswlib: pip install hnswlib") from exc
+    return hnswlib
+
+
+class UserAnnIndex:
+    """HNSW index trên embedding đã chuẩn hoá L2 (inner product == cosine)."""
+
+    def __init__(self, matrix: np.ndarray, rows: List[Dict[str, Any]], params: AnnParams | None = None) -> None:
+        """
+        Args:
+            matrix: Ma trận float32 (n, dim) ĐÃ chuẩn hoá L2, hàng i ứng với rows[i]
+            rows: Payload của từng chunk (content, chunk_index, page_number, document_id, ...)
+            params: Tham số HNSW (mặc định lấy từ settings)
+        """
+        hnswlib = _import_hnswlib()
+        self.params = params or AnnParams()
+        self.rows = rows
+        self.size = matrix.shape[0]
+        self.built_at = monotonic()
+        self.epoch = 0  # Epoch corpus của user lúc đọc rows (get_user_index gán)
+        self._ef = self.params.ef_search
+        self._lock = threading.Lock()  # set_ef là state chung của index
+
+        self._index = None
+        if self.size:
+            self._index = hnswlib.Index(space="ip", dim=matrix.shape[1])
+            self._index.init_index(
+                max_elements=self.size,
+                ef_construction=self.params.ef_construction,
+                M=self.params.m,
+            )
+            self._index.add_items(matrix, np.arange(self.size))
+            self._index.set_ef(self._ef)
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]], params: AnnParams | None = None) -> "UserAnnIndex":
+        """Build index từ rows Supabase (embedding dạng chuỗi JSON hoặc list)."""
+        dim = _infer_dim(rows)
+        matrix, kept_rows = _build_embedding_matrix(rows, dim)
+        return cls(_normalize_rows(matrix), kept_rows, params)
+
+    def search(self, query_vector: np.ndarray, top_k: int = 5, ef_search: Optional[int] = None) -> List[RetrievedChunk]:
+        """Tìm top_k chunks gần nhất; ef_search ghi đè độ rộng tìm kiếm cho riêng lần gọi này."""
+        if self._index is None:
+            return []
+
+        query_vector = np.asarray(query_vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query_vector)
+        if norm > 0:
+            query_vector = query_vector / norm
+
+        k = min(max(top_k, 1), self.size)
+        ef = max(ef_search or self.params.ef_search, k)  # HNSW yêu cầu ef >= k
+        with self._lock:
+            if ef != self._ef:
+                self._index.set_ef(ef)
+                self._ef = ef
+            labels, distances = self._index.knn_query(query_vector, k=k)
+
+        chunks: list[RetrievedChunk] = []
+        for label, distance in zip(labels[0], distances[0]):
+            row = self.rows[int(label)]
+            document = row.get("documents") or {}
+            chunks.append(
+                RetrievedChunk(
+                    content=row.get("content", ""),
+                    chunk_index=row.get("chunk_index", 0) or 0,
+                    page_number=row.get("page_number"),
+                    similarity=float(1.0 - distance),  # space "ip": distance = 1 - <q, v>
+                    metadata={
+                        "document_id": row.get("document_id"),
+                        "document_title": document.get("title"),
+                        "source": "internal",
+                    },
+                )
+            )
+        return chunks
+
+
+def _infer_dim(rows: List[Dict[str, Any]]) -> int:
+    """Lấy số chiều embedding từ row hợp lệ đầu tiên."""
+    for row in rows:
+        vector = decode_vector(row.get("embedding"))
+        if vector is not None:
+            return vector.shape[0]
+    return 0
+
+
+def _fetch_user_rows(user_id: str) -> List[Dict[str, Any]]:
+    """Đọc toàn bộ embedding của user (JOIN documents, lọc created_by), phân trang theo _PAGE_SIZE."""
+    client = get_supabase_client()
+    rows: List[Dict[str, Any]] = []
+    start = 0
+    while True:
+        response = (
+            client.table("document_embeddings")
+            .select("document_id, content, chunk_index, page_number, embedding, documents!inner(title, created_by)")
+            .eq("documents.created_by", user_id)
+            .order("document_id")
+            .order("chunk_index")
+            .range(start, start + _PAGE_SIZE - 1)
+            .execute()
+        )
+        batch = response.data or []
+        rows.extend(batch)
+        if len(batch) < _PAGE_SIZE:
+            return rows
+        start += _PAGE_SIZE
+
+
+_indexes: Dict[str, UserAnnIndex] = {}
+_registry_lock = threading.Lock()
+_build_locks: Dict[str, threading.Lock] = {}
+
+
+def _is_fresh(index: UserAnnIndex | None, epoch: int) -> bool:
+    return index is not None and index.epoch == epoch and monotonic() - index.built_at < settings.ann_index_ttl
+
+
+def get_user_index(user_id: str, params: AnnParams | None = None) -> UserAnnIndex:
+    """
+    Lấy (hoặc build) index của user. Index hết hạn sau settings.ann_index_ttl giây
+    hoặc khi epoch corpus của user đổi (tài liệu vừa được ingest lại hoặc bị xoá).
+
+    Mỗi user có lock build riêng để nhiều request đồng thời chỉ build một lần.
+    """
+    # Đọc epoch TRƯỚC khi đọc rows: ingest xong trong lúc build thì lần sau build lại
+    epoch = corpus_epoch(user_id)
+    with _registry_lock:
+        index = _indexes.get(user_id)
+        if _is_fresh(index, epoch):
+            return index
+        build_lock = _build_locks.setdefault(user_id, threading.Lock())
+
+    with build_lock:
+        index = _indexes.get(user_id)
+        if _is_fresh(index, epoch):
+            return index
+
+        start = monotonic()
+        index = UserAnnIndex.from_rows(_fetch_user_rows(user_id), params)
+        index.epoch = epoch
+        logger.info(f"Built HNSW index for user {user_id}: {index.size} chunks in {monotonic() - start:.2f}s")
+        with _registry_lock:
+            _indexes[user_id] = index
+        return index
+
+
+def invalidate_user_index(user_id: str | None = None) -> None:
+    """Xoá index của một user (hoặc tất cả nếu user_id=None) trong process hiện tại."""
+    with _registry_lock:
+        if user_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(user_id, None)
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .config import settings
+from .corpus_epoch import corpus_epoch
+from .retriever import RetrievedChunk
+
+"""
+Cache câu trả lời theo ngữ nghĩa cho rag_query.
+
+Câu hỏi mới được trả lời từ cache khi (1) cùng phạm vi (user, mode, model,
+system prompt), (2) retrieval trả về ĐÚNG tập nguồn như lần trước và (3)
+embedding câu hỏi có cosine >= ANSWER_CACHE_THRESHOLD với câu hỏi đã cache.
+
+Mỗi entry ghi lại epoch corpus của user (corpus_epoch) lúc lưu. Ingest lại
+hoặc xoá tài liệu của user (pipeline) bump epoch đó, nên các process khác
+trên cùng máy (RAG server, ingest worker) bỏ entry cũ ở lần tra cứu sau, và
+gọi invalidate_user để giải phóng entry trong process hiện tại ngay.
+"""
+
+Scope = Tuple[str, str, str, str]  # (user_id, mode, model, system_prompt)
+
+
+@dataclass
+class CachedAnswer:
+    """Một câu trả lời đã cache kèm thời gian LLM đã tốn để sinh ra nó."""
+
+    vector: np.ndarray          # Embedding câu hỏi, đã chuẩn hoá L2
+    answer: str
+    model: str
+    raw: Dict[str, Any]
+    llm_ms: float
+    epoch: int                  # Epoch corpus của user lúc ghi
+    created_at: float
+
+
+def source_signature(chunks: Iterable[RetrievedChunk]) -> str:
+    """Khoá của tập nguồn retrieval (không phụ thuộc thứ tự, không tính similarity)."""
+    parts = sorted(
+        f"{(chunk.metadata or {}).get('document_id', '')}:{chunk.chunk_index}:{chunk.content}"
+        for chunk in chunks
+    )
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class SemanticAnswerCache:
+    """LRU (tổng số entry) + TTL, nhóm entry theo (scope, tập nguồn); an toàn đa luồng."""
+
+    def __init__(self, max_size: int, ttl: float, threshold: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._groups: OrderedDict[Tuple[Scope, str], List[CachedAnswer]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_llm_ms = 0.0
+
+    def lookup(self, scope: Scope, sources: str, vector: np.ndarray) -> Optional[Tuple[CachedAnswer, float]]:
+        """Trả về (entry, cosine) gần nhất đạt ngưỡng, hoặc None (tính là miss)."""
+        query = _unit(vector)
+        epoch = corpus_epoch(scope[0])
+        now = monotonic()
+        with self._lock:
+            key = (scope, sources)
+            entries = self._groups.get(key)
+            best: Optional[Tuple[CachedAnswer, float]] = None
+            if entries:
+                alive = [e for e in entries if e.epoch == epoch and now - e.created_at < self.ttl]
+                self._size -= len(entries) - len(alive)
+                if alive:
+                    self._groups[key] = alive
+                    for entry in alive:
+                        similarity = float(np.dot(query, entry.vector))
+                        if similarity >= self.threshold and (best is None or similarity > best[1]):
+                            best = (entry, similarity)
+                else:
+                    del self._groups[key]
+            if best is None:
+                self.misses += 1
+                return None
+            self._groups.move_to_end(key)
+            self.hits += 1
+            self.saved_llm_ms += best[0].llm_ms
+            return best
+
+    def store(
+        self,
+        scope: Scope,
+        sources: str,
+        vector: np.ndarray,
+        answer: str,
+        model: str,
+        raw: Dict[str, Any],
+        llm_ms: float,
+    ) -> None:
+        """Ghi câu trả lời mới và loại nhóm ít dùng nhất nếu vượt max_size."""
+        entry = CachedAnswer(
+            vector=_unit(vector),
+            answer=answer,
+            model=model,
+            raw=raw,
+            llm_ms=llm_ms,
+            epoch=corpus_epoch(scope[0]),
+            created_at=monotonic(),
+        )
+        with self._lock:
+            key = (scope, sources)
+            self._groups.setdefault(key, []).append(entry)
+            self._groups.move_to_end(key)
+            self._size += 1
+            while self._size > self.max_size and self._groups:
+                _, evicted = self._groups.popitem(last=False)
+                self._size -= len(evicted)
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Bỏ mọi câu trả lời của user trong process này (process khác thấy epoch corpus đổi)."""
+        with self._lock:
+            for key in [key for key in self._groups if key[0][0] == user_id]:
+                self._size -= len(self._groups.pop(key))
+
+    def clear(self) -> None:
+        """Xoá toàn bộ entry (giữ nguyên bộ đếm)."""
+        with self._lock:
+            self._groups.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Số liệu hit/miss và thời gian LLM tiết kiệm được (hiển thị ở metadata và /health)."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "saved_llm_ms": round(self.saved_llm_ms, 2),
+                "size": self._size,
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+            }
+
+
+answer_cache = SemanticAnswerCache(
+    max_size=settings.answer_cache_size,
+    ttl=settings.answer_cache_ttl,
+    threshold=settings.answer_cache_threshold,
+)
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .retry_utils import retry_with_backoff
+
+logger = logging.getLogger(__name__)
+
+"""
+Ghi nhiều batch song song có giới hạn, retry từng batch và ghi tiếp được sau lỗi.
+
+Row được gom thành batch theo số byte payload ước lượng (và số row tối đa).
+Tối đa max_in_flight batch được gửi cùng lúc; submit() chờ khi đủ (back-pressure).
+Mỗi batch retry độc lập với exponential backoff; batch đã ghi được đánh dấu
+trong WriteCursor nên lần ghi lại với cùng cursor sẽ bỏ qua chúng thay vì ghi lại từ đầu.
+"""
+
+_LIST_ITEM_BYTES = 20  # Một float trong JSON list (repr đầy đủ + dấu phẩy)
+_FIELD_OVERHEAD_BYTES = 16  # Tên field, dấu ngoặc, dấu phẩy
+
+
+def estimate_row_bytes(row: Dict[str, Any]) -> int:
+    """Ước lượng kích thước JSON của một row (không serialize thật)."""
+    size = 2
+    for key, value in row.items():
+        size += len(key) + _FIELD_OVERHEAD_BYTES
+        if isinstance(value, str):
+            size += len(value.encode("utf-8"))
+        elif isinstance(value, (list, tuple)):
+            size += len(value) * _LIST_ITEM_BYTES
+    return size
+
+
+@dataclass
+class WriteCursor:
+    """Các batch (row bắt đầu, row kết thúc) đã ghi thành công; truyền lại cho BatchWriter để ghi tiếp."""
+
+    done: Set[Tuple[int, int]] = field(default_factory=set)
+
+    @property
+    def committed_rows(self) -> int:
+        """Số row liên tục từ đầu đã chắc chắn được ghi."""
+        end = 0
+        for start, stop in sorted(self.done):
+            if start != end:
+                break
+            end = stop
+        return end
+
+
+@dataclass
+class WriteStats:
+    """Thống kê một lần ghi."""
+
+    rows: int = 0
+    batches: int = 0
+    skipped_batches: int = 0  # Batch đã có trong cursor, không ghi lại
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+class BatchWriteError(RuntimeError):
+    """Một batch vẫn lỗi sau khi hết lượt retry; cursor cho biết các batch đã ghi."""
+
+    def __init__(self, message: str, cursor: WriteCursor) -> None:
+        super().__init__(message)
+        self.cursor = cursor
+
+
+class BatchWriter:
+    """Gom row thành batch theo byte và ghi song song (tối đa max_in_flight batch)."""
+
+    def __init__(
+        self,
+        write_batch: Callable[[List[Dict[str, Any]]], None],
+        max_in_flight: int = 4,
+        max_batch_bytes: int = 1024 * 1024,
+        max_batch_rows: int = 100,
+        max_retries: int = 3,
+        initial_delay: float = 1.0,
+        cursor: Optional[WriteCursor] = None,
+        on_batch: Optional[Callable[[int, int], None]] = None,
+    ) -> None:
+        """
+        Args:
+            write_batch: Hàm ghi MỘT batch (không tự retry)
+            max_in_flight: Số batch gửi đồng thời tối đa
+            max_batch_bytes: Kích thước payload ước lượng tối đa mỗi batch
+            max_batch_rows: Số row tối đa mỗi batch
+            max_retries: Số lần retry mỗi batch
+            initial_delay: Delay retry đầu tiên (giây), nhân đôi mỗi lần
+            cursor: Cursor của lần ghi trước (cùng danh sách row) để bỏ qua batch đã ghi
+            on_batch: Gọi (số row, số byte) sau mỗi batch ghi thành công (từ thread ghi)
+        """
+        self._write = retry_with_backoff(max_retries=max_retries, initial_delay=initial_delay)(write_batch)
+        self.max_in_flight = max(max_in_flight, 1)
+        self.max_batch_bytes = max(max_batch_bytes, 1)
+        self.max_batch_rows = max(max_batch_rows, 1)
+        self.cursor = cursor or WriteCursor()
+        self.stats = WriteStats()
+        self._on_batch = on_batch
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="batch-writer")
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._lock = threading.Lock()
+        self._futures: List[Future] = []
+        self._error: BaseException | None = None
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_bytes = 0
+        self._offset = 0  # Chỉ số (toàn cục) của row đầu tiên trong _pending
+        self._started: float | None = None
+
+    def __enter__(self) -> "BatchWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=True)
+
+    def submit(self, rows: List[Dict[str, Any]]) -> None:
+        """Thêm row; gửi batch ngay khi đủ byte/row. Chờ nếu đã có max_in_flight batch đang gửi."""
+        if self._started is None:
+            self._started = perf_counter()
+        for row in rows:
+            row_bytes = estimate_row_bytes(row)
+            if self._pending and (
+                self._pending_bytes + row_bytes > self.max_batch_bytes or len(self._pending) >= self.max_batch_rows
+            ):
+                self._dispatch()
+            self._pending.append(row)
+            self._pending_bytes += row_bytes
+
+    def flush(self) -> WriteStats:
+        """Gửi phần còn lại, chờ mọi batch xong; raise BatchWriteError nếu có batch lỗi."""
+        if self._pending:
+            self._dispatch()
+        for future in self._futures:
+            future.exception()  # Chờ, lỗi được ghi nhận trong _run
+        self._futures = []
+        if self._started is not None:
+            self.stats.seconds = perf_counter() - self._started
+        self._raise_if_failed()
+        return self.stats
+
+    def close(self) -> WriteStats:
+        """flush() rồi dừng thread pool."""
+        try:
+            return self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def write(self, rows: List[Dict[str, Any]]) -> WriteStats:
+        """Ghi toàn bộ rows (submit + close)."""
+        self.submit(rows)
+        return self.close()
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise BatchWriteError(
+                f"Batch write failed after retries ({self.cursor.committed_rows} leading rows committed): {self._error}",
+                self.cursor,
+            ) from self._error
+
+    def _dispatch(self) -> None:
+        batch, batch_bytes = self._pending, self._pending_bytes
+        span = (self._offset, self._offset + len(batch))
+        self._pending, self._pending_bytes, self._offset = [], 0, span[1]
+
+        if span in self.cursor.done:
+            self.stats.skipped_batches += 1
+            return
+        self._raise_if_failed()
+        self._futures = [future for future in self._futures if not future.done()]
+        self._slots.acquire()  # Back-pressure: tối đa max_in_flight batch đang gửi
+        if self._error is not None:
+            self._slots.release()
+            self._raise_if_failed()
+        self._futures.append(self._executor.submit(self._run, span, batch, batch_bytes))
+
+    def _run(self, span: Tuple[int, int], batch: List[Dict[str, Any]], batch_bytes: int) -> None:
+        try:
+            if self._error is not None:
+                return  # Đã có batch lỗi: không gửi thêm
+            self._write(batch)
+            with self._lock:
+                self.cursor.done.add(span)
+                self.stats.rows += len(batch)
+                self.stats.batches += 1
+                self.stats.bytes += batch_bytes
+            if self._on_batch is not None:
+                self._on_batch(len(batch), batch_bytes)
+        except Exception as exc:  # noqa: BLE001 - ghi nhận lỗi đầu tiên, flush() sẽ raise
+            with self._lock:
+                if self._error is None:
+                    self._error = exc
+            logger.error(f"Batch rows {span[0]}-{span[1]} failed: {exc}")
+        finally:
+            self._slots.release()
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from typing import Iterable, Iterator
+import hashlib
+import threading
+from typing import Any, Iterable, Iterator, List, Sequence, Tuple
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
@@ -8,7 +10,13 @@ from .config import settings
 from .text_extractor import DocumentChunk
 
 
-"""Chia văn bản dài thành các đoạn nhỏ dựa trên cấu hình chunk size."""
+"""
+Chia văn bản dài thành các đoạn nhỏ dựa trên cấu hình chunk size.
+
+Mặc định chia theo số ký tự (CHUNK_SIZE). Khi bật CHUNK_TOKENS, chunk được chia
+theo token của chính tokenizer model embedding để không chunk nào vượt
+max_seq_length (phần vượt sẽ bị model cắt bỏ khi encode).
+"""
 
 
 class TextChunk(DocumentChunk):
@@ -26,6 +34,10 @@ class TextChunk(DocumentChunk):
         super().__init__(text=text, page_number=page_number, source_file=source_file)
         self.chunk_index = chunk_index
 
+    def content_hash(self) -> str:
+        """Hash nội dung chunk, dùng để so khớp với chunk đã lưu khi re-ingest."""
+        return chunk_content_hash(self.text)
+
     def to_dict(self) -> dict:
         """Kế thừa từ cha và thêm chunk_index."""
         base = super().to_dict()
@@ -33,6 +45,11 @@ class TextChunk(DocumentChunk):
         return base
 
 
+def chunk_content_hash(text: str) -> str:
+    """sha256 của nội dung chunk (áp dụng được cho cả cột content đã lưu trên Supabase)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
 _splitter = RecursiveCharacterTextSplitter(
     chunk_size=settings.chunk_size,
     chunk_overlap=settings.chunk_overlap,
@@ -42,28 +59,161 @@ _splitter = RecursiveCharacterTextSplitter(
 )
 
 
+_TOKEN_PAGE_BATCH = 16  # Số trang tokenize trong một lần gọi tokenizer (batch)
+_SENTENCE_END = ".!?;:…"
+_MAX_REFIT_DEPTH = 2
+
+_tokenizer_lock = threading.Lock()
+_tokenizer_info: Tuple[Any, int] | None = None
+
+
+def _get_tokenizer() -> Tuple[Any, int]:
+    """Tokenizer và max_seq_length của model embedding (load model một lần)."""
+    global _tokenizer_info
+    with _tokenizer_lock:
+        if _tokenizer_info is None:
+            from .embedder import _get_model  # Import muộn: embedder import module này
+
+            model = _get_model()
+            tokenizer = model.tokenizer
+            if not getattr(tokenizer, "is_fast", False):
+                raise RuntimeError("CHUNK_TOKENS requires a fast (Rust) tokenizer with offset mapping")
+            _tokenizer_info = (tokenizer, int(model.max_seq_length))
+        return _tokenizer_info
+
+
+def token_budget() -> Tuple[int, int] | None:
+    """(số token tối đa, số token chồng lấn) mỗi chunk; None nếu chia theo ký tự."""
+    if not settings.chunk_tokens:
+        return None
+    tokenizer, max_seq_length = _get_tokenizer()
+    model_budget = max_seq_length - tokenizer.num_special_tokens_to_add()
+    if settings.chunk_tokens == "auto":
+        budget = model_budget
+    else:
+        budget = min(int(settings.chunk_tokens), model_budget)  # Vượt model_budget thì sẽ bị cắt khi encode
+    if settings.chunk_token_overlap >= 0:
+        overlap = settings.chunk_token_overlap
+    else:
+        overlap = round(budget * settings.chunk_overlap / settings.chunk_size)
+    return max(budget, 1), min(max(overlap, 0), budget // 2)
+
+
+def _is_word_start(text: str, offsets: Sequence[Tuple[int, int]], i: int) -> bool:
+    """Token thứ i bắt đầu một từ mới (cắt trước nó không làm gãy từ)."""
+    start = offsets[i][0]
+    return i == 0 or start == 0 or text[start - 1].isspace() or (start < len(text) and text[start].isspace())
+
+
+def _snap_end(text: str, offsets: Sequence[Tuple[int, int]], start: int, end: int) -> int:
+    """Lùi điểm cắt về cuối câu gần nhất, nếu không có thì về ranh giới từ (không lùi quá nửa cửa sổ)."""
+    floor = start + max((end - start) // 2, 1)
+    word_end = None
+    for i in range(end, floor - 1, -1):
+        if not _is_word_start(text, offsets, i):
+            continue
+        prev_end = offsets[i - 1][1]
+        if prev_end and text[prev_end - 1] in _SENTENCE_END:
+            return i
+        if word_end is None:
+            word_end = i
+    return word_end if word_end is not None else end
+
+
+def _token_windows(text: str, offsets: Sequence[Tuple[int, int]], budget: int, overlap: int) -> List[str]:
+    """Cắt text thành các cửa sổ <= budget token, chồng lấn overlap token, cắt ở ranh giới câu/từ."""
+    n = len(offsets)
+    pieces: List[str] = []
+    start = 0
+    while start < n:
+        end = min(start + budget, n)
+        if end < n:
+            end = _snap_end(text, offsets, start, end)
+        piece = text[offsets[start][0]:offsets[end - 1][1]].strip()
+        if piece:
+            pieces.append(piece)
+        if end >= n:
+            break
+        next_start = max(end - overlap, start + 1)
+        while next_start < end and not _is_word_start(text, offsets, next_start):
+            next_start += 1
+        start = next_start
+    return pieces
+
+
+def _fit_budget(tokenizer: Any, pieces: List[str], budget: int, depth: int = 0) -> List[str]:
+    """Tokenize lại (batch) các chunk đã cắt; chia tiếp chunk nào vượt budget do biên token thay đổi."""
+    if not pieces:
+        return pieces
+    encoded = tokenizer(pieces, add_special_tokens=False, return_offsets_mapping=True)
+    fitted: List[str] = []
+    for piece, ids, offsets in zip(pieces, encoded["input_ids"], encoded["offset_mapping"]):
+        if len(ids) <= budget or depth >= _MAX_REFIT_DEPTH:
+            fitted.append(piece)
+            continue
+        fitted.extend(_fit_budget(tokenizer, _token_windows(piece, offsets, budget, 0), budget, depth + 1))
+    return fitted
+
+
+def _split_pages_by_tokens(pages: List[DocumentChunk], budget: int, overlap: int) -> Iterator[Tuple[DocumentChunk, str]]:
+    """Tokenize một lô trang trong một lần gọi rồi cắt từng trang theo token."""
+    from .embedder import model_lock
+
+    tokenizer, _ = _get_tokenizer()
+    with model_lock:
+        encoded = tokenizer([page.text for page in pages], add_special_tokens=False, return_offsets_mapping=True)
+        split = [
+            (page, _fit_budget(tokenizer, _token_windows(page.text, offsets, budget, overlap), budget))
+            for page, offsets in zip(pages, encoded["offset_mapping"])
+        ]
+    for page, pieces in split:
+        for piece in pieces:
+            yield page, piece
+
+
+def _iter_token_pieces(chunks: Iterable[DocumentChunk], budget: int, overlap: int) -> Iterator[Tuple[DocumentChunk, str]]:
+    """Chia theo token, gom _TOKEN_PAGE_BATCH trang mỗi lần tokenize (vẫn streaming)."""
+    batch: List[DocumentChunk] = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= _TOKEN_PAGE_BATCH:
+            yield from _split_pages_by_tokens(batch, budget, overlap)
+            batch = []
+    if batch:
+        yield from _split_pages_by_tokens(batch, budget, overlap)
+
+
+def _iter_char_pieces(chunks: Iterable[DocumentChunk]) -> Iterator[Tuple[DocumentChunk, str]]:
+    """Chia theo số ký tự (CHUNK_SIZE / CHUNK_OVERLAP)."""
+    for chunk in chunks:
+        for piece in _splitter.split_text(chunk.text):
+            yield chunk, piece
+
+
 def split_chunks(chunks: Iterable[DocumentChunk]) -> Iterator[TextChunk]:
     """
     Tách lần lượt từng DocumentChunk thành các TextChunk nhỏ hơn.
     Sử dụng YIELD để tiết kiệm bộ nhớ (Streaming).
     """
+    budget = token_budget()
+    if budget is None:
+        pieces = _iter_char_pieces(chunks)
+    else:
+        pieces = _iter_token_pieces(chunks, *budget)
+
     global_chunk_index = 0  # Biến đếm tổng số chunk đã tạo ra
-    
-    for chunk in chunks:
-        # Tách văn bản của trang hiện tại
-        pieces = _splitter.split_text(chunk.text)
-        
-        for piece in pieces:
-            text = piece.strip()
-            if not text:
-                continue
-            
-            global_chunk_index += 1
-            
-            # Trả về ngay lập tức từng mảnh nhỏ
-            yield TextChunk(
-                text=text,
-                page_number=chunk.page_number,
-                chunk_index=global_chunk_index,
-                source_file=getattr(chunk, 'source_file', None)  # Lấy tên file từ cha
-            )
\ No newline at end of file
+
+    for chunk, piece in pieces:
+        text = piece.strip()
+        if not text:
+            continue
+
+        global_chunk_index += 1
+
+        # Trả về ngay lập tức từng mảnh nhỏ
+        yield TextChunk(
+            text=text,
+            page_number=chunk.page_number,
+            chunk_index=global_chunk_index,
+            source_file=getattr(chunk, 'source_file', None)  # Lấy tên file từ cha
+        )
@@ -17,6 +17,18 @@ def _get_env(name: str, default: str | None = None, required: bool = True) -> st
     return value if value is not None else ""
 
 
+def _get_bool_env(name: str, default: bool) -> bool:
+    """Đọc biến môi trường dạng bool ("1", "true", "yes" → True)."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Thư mục gốc của state cục bộ; đường dẫn cache / hàng đợi không khai báo riêng nằm trong thư mục này
+_CACHE_DIR = Path(_get_env("CACHE_DIR", ".cache", required=False) or ".cache")
+
+
 @dataclass(frozen=True)
 class Settings:
     supabase_url: str = _get_env("SUPABASE_URL")
@@ -28,10 +40,101 @@ class Settings:
     hf_api_token: str = _get_env("HF_API_TOKEN", required=False)
     chunk_size: int = int(_get_env("CHUNK_SIZE", "900", required=False) or 900)
     chunk_overlap: int = int(_get_env("CHUNK_OVERLAP", "200", required=False) or 200)
+    # Chia chunk theo token của tokenizer model: "" = theo ký tự (CHUNK_SIZE), "auto" = max_seq_length của model, hoặc số token
+    chunk_tokens: str = (_get_env("CHUNK_TOKENS", "", required=False) or "").strip().lower()
+    # Số token chồng lấn giữa hai chunk (-1 = suy ra theo tỉ lệ CHUNK_OVERLAP / CHUNK_SIZE)
+    chunk_token_overlap: int = int(_get_env("CHUNK_TOKEN_OVERLAP", "-1", required=False) or -1)
+    # Ingest dạng streaming: extract → chunk → embed → insert chạy song song qua hàng đợi có giới hạn
+    ingest_streaming: bool = _get_bool_env("INGEST_STREAMING", True)
+    # Re-ingest chỉ embed/ghi chunk thay đổi (so khớp hash nội dung), thay vì xoá hết rồi ghi lại
+    ingest_incremental: bool = _get_bool_env("INGEST_INCREMENTAL", True)
+    ingest_embed_batch_size: int = int(_get_env("INGEST_EMBED_BATCH_SIZE", "64", required=False) or 64)
+    ingest_insert_batch_size: int = int(_get_env("INGEST_INSERT_BATCH_SIZE", "100", required=False) or 100)
+    # Ghi embedding: số batch gửi song song và kích thước payload tối đa mỗi batch (INGEST_INSERT_BATCH_SIZE là số row tối đa)
+    insert_max_in_flight: int = int(_get_env("INSERT_MAX_IN_FLIGHT", "4", required=False) or 4)
+    insert_batch_max_kb: int = int(_get_env("INSERT_BATCH_MAX_KB", "1024", required=False) or 1024)
+    ingest_memory_budget_mb: int = int(_get_env("INGEST_MEMORY_BUDGET_MB", "256", required=False) or 256)
+    # Ingestion worker chạy lâu dài (scripts/ingest_worker.py): hàng đợi SQLite và số tài liệu xử lý đồng thời
+    ingest_queue_path: Path = Path(
+        _get_env("INGEST_QUEUE_PATH", required=False) or _CACHE_DIR / "ingest_queue.sqlite"
+    )
+    ingest_worker_concurrency: int = int(_get_env("INGEST_WORKER_CONCURRENCY", "2", required=False) or 2)
+    ingest_worker_poll_seconds: float = float(_get_env("INGEST_WORKER_POLL_SECONDS", "1", required=False) or 1)
+    ingest_job_max_attempts: int = int(_get_env("INGEST_JOB_MAX_ATTEMPTS", "3", required=False) or 3)
+    # Progress theo stage (download/extract/chunk/embed/insert): khoảng cách tối thiểu giữa hai event của một stage;
+    # INGEST_PROGRESS_EVENTS=true thì ingest_document.py in thêm dòng EVENT:<json> bên cạnh PROGRESS:
+    ingest_progress_interval_ms: int = int(_get_env("INGEST_PROGRESS_INTERVAL_MS", "500", required=False) or 500)
+    ingest_progress_events: bool = _get_bool_env("INGEST_PROGRESS_EVENTS", False)
+    # Định dạng vector gửi lên Supabase: "text" = literal pgvector làm tròn EMBEDDING_WIRE_PRECISION chữ số, "json" = list float
+    embedding_wire_format: str = (_get_env("EMBEDDING_WIRE_FORMAT", "text", required=False) or "text").lower()
+    embedding_wire_precision: int = int(_get_env("EMBEDDING_WIRE_PRECISION", "6", required=False) or 6)
+    # Pool nhiều process encode trên CPU (opt-in: EMBED_WORKERS > 1; 0 thread = chia đều số core)
+    embed_workers: int = int(_get_env("EMBED_WORKERS", "0", required=False) or 0)
+    embed_worker_threads: int = int(_get_env("EMBED_WORKER_THREADS", "0", required=False) or 0)
+    embed_shard_size: int = int(_get_env("EMBED_SHARD_SIZE", "16", required=False) or 16)
+    # Gom batch encode theo độ dài token (giảm padding); budget = số token (kể cả padding) mỗi batch, 0 = batch_size * max_seq_length
+    embed_length_bucketing: bool = _get_bool_env("EMBED_LENGTH_BUCKETING", True)
+    embed_batch_tokens: int = int(_get_env("EMBED_BATCH_TOKENS", "0", required=False) or 0)
+    # Trích xuất PDF song song (process pool) cho file nhiều trang; 1 = tuần tự
+    pdf_extract_workers: int = int(_get_env("PDF_EXTRACT_WORKERS", str(min(os.cpu_count() or 1, 8)), required=False) or 1)
+    pdf_pages_per_task: int = int(_get_env("PDF_PAGES_PER_TASK", "16", required=False) or 16)
+    pdf_parallel_min_pages: int = int(_get_env("PDF_PARALLEL_MIN_PAGES", "64", required=False) or 64)
     temp_dir: Path = Path(_get_env("TEMP_DIR", "tmp", required=False) or "tmp")
+    cache_dir: Path = _CACHE_DIR
+    # Cache embedding theo nội dung chunk (SQLite trên đĩa, LRU theo dung lượng)
+    embedding_cache_enabled: bool = _get_bool_env("EMBEDDING_CACHE", True)
+    embedding_cache_max_mb: int = int(_get_env("EMBEDDING_CACHE_MAX_MB", "512", required=False) or 512)
+    # Cache embedding câu hỏi (in-memory, LRU + TTL)
+    query_cache_size: int = int(_get_env("QUERY_CACHE_SIZE", "2048", required=False) or 2048)
+    query_cache_ttl: float = float(_get_env("QUERY_CACHE_TTL", "3600", required=False) or 3600)
+    # Cache câu trả lời theo ngữ nghĩa: cùng user/mode/model, cùng tập nguồn và cosine câu hỏi >= ngưỡng
+    answer_cache_enabled: bool = _get_bool_env("ANSWER_CACHE", True)
+    answer_cache_threshold: float = float(_get_env("ANSWER_CACHE_THRESHOLD", "0.92", required=False) or 0.92)
+    answer_cache_size: int = int(_get_env("ANSWER_CACHE_SIZE", "1024", required=False) or 1024)
+    answer_cache_ttl: float = float(_get_env("ANSWER_CACHE_TTL", "86400", required=False) or 86400)
+    # Cache kết quả Tavily theo (câu hỏi chuẩn hoá, số kết quả); WEB_CACHE_TTL=0 = chỉ gộp lời gọi trùng đang chạy
+    web_cache_size: int = int(_get_env("WEB_CACHE_SIZE", "512", required=False) or 512)
+    web_cache_ttl: float = float(_get_env("WEB_CACHE_TTL", "900", required=False) or 0)
+    # Hybrid retrieval: executor dùng chung cho retrieve sync, timeout từng nguồn và deadline chung (giây, 0 = không giới hạn)
+    hybrid_executor_workers: int = int(_get_env("HYBRID_EXECUTOR_WORKERS", "8", required=False) or 8)
+    hybrid_internal_timeout: float = float(_get_env("HYBRID_INTERNAL_TIMEOUT", "10", required=False) or 0)
+    hybrid_web_timeout: float = float(_get_env("HYBRID_WEB_TIMEOUT", "5", required=False) or 0)
+    hybrid_retrieval_deadline: float = float(_get_env("HYBRID_RETRIEVAL_DEADLINE", "10", required=False) or 0)
+    # Rerank ứng viên hybrid bằng cross-encoder (tuỳ chọn); quá RERANK_BUDGET_MS thì giữ thứ tự cũ (0 = không giới hạn)
+    rerank_enabled: bool = _get_bool_env("RERANK_ENABLED", False)
+    rerank_model: str = _get_env("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1", required=False)
+    rerank_batch_size: int = int(_get_env("RERANK_BATCH_SIZE", "32", required=False) or 32)
+    rerank_budget_ms: float = float(_get_env("RERANK_BUDGET_MS", "300", required=False) or 0)
+    rerank_cache_size: int = int(_get_env("RERANK_CACHE_SIZE", "8192", required=False) or 8192)
+    # Index từ khoá BM25 build lúc ingest (segment .npz theo tài liệu) và fuse (RRF) với kết quả dense trong HybridRetriever
+    lexical_index_enabled: bool = _get_bool_env("LEXICAL_INDEX", True)
+    lexical_index_dir: Path = Path(_get_env("LEXICAL_INDEX_DIR", required=False) or _CACHE_DIR / "lexical")
+    bm25_k1: float = float(_get_env("BM25_K1", "1.2", required=False) or 1.2)
+    bm25_b: float = float(_get_env("BM25_B", "0.75", required=False) or 0.75)
+    lexical_fusion_k: int = int(_get_env("LEXICAL_FUSION_K", "60", required=False) or 60)
+    # Micro-batching encode câu hỏi trong RAG server
+    encode_batching: bool = _get_bool_env("ENCODE_BATCHING", True)
+    encode_batch_max_size: int = int(_get_env("ENCODE_BATCH_MAX_SIZE", "32", required=False) or 32)
+    encode_batch_max_wait_ms: float = float(_get_env("ENCODE_BATCH_MAX_WAIT_MS", "5", required=False) or 5)
+    # Back-pressure: số câu hỏi tối đa chờ encode (quá thì server trả 503); số thread encode khi tắt batching
+    encode_max_pending: int = int(_get_env("ENCODE_MAX_PENDING", "256", required=False) or 256)
+    encode_workers: int = int(_get_env("ENCODE_WORKERS", "1", required=False) or 1)
     ollama_url: str = _get_env("OLLAMA_URL", "http://localhost:11434", required=False)
     ollama_model: str = _get_env("OLLAMA_MODEL", "llama3", required=False)
+    # Connection pool keep-alive tới Ollama; OLLAMA_TOTAL_TIMEOUT = giới hạn cả lời gọi (0 = tắt)
+    ollama_connect_timeout: float = float(_get_env("OLLAMA_CONNECT_TIMEOUT", "5", required=False) or 5)
+    ollama_read_timeout: float = float(_get_env("OLLAMA_READ_TIMEOUT", "120", required=False) or 120)
+    ollama_total_timeout: float = float(_get_env("OLLAMA_TOTAL_TIMEOUT", "300", required=False) or 0)
+    ollama_max_connections: int = int(_get_env("OLLAMA_MAX_CONNECTIONS", "16", required=False) or 16)
+    ollama_keepalive_seconds: float = float(_get_env("OLLAMA_KEEPALIVE_SECONDS", "60", required=False) or 60)
+    # Backend cho retrieve_similar_chunks_by_user: "rpc" (pgvector, chính xác) hoặc "hnsw" (ANN in-process)
+    retrieval_backend: str = (_get_env("RETRIEVAL_BACKEND", "rpc", required=False) or "rpc").lower()
+    ann_m: int = int(_get_env("ANN_M", "16", required=False) or 16)
+    ann_ef_construction: int = int(_get_env("ANN_EF_CONSTRUCTION", "200", required=False) or 200)
+    ann_ef_search: int = int(_get_env("ANN_EF_SEARCH", "64", required=False) or 64)
+    ann_index_ttl: float = float(_get_env("ANN_INDEX_TTL", "300", required=False) or 300)
 
 
 settings = Settings()
 settings.temp_dir.mkdir(parents=True, exist_ok=True)
+settings.cache_dir.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+from time import time_ns
+
+from .config import settings
+
+"""
+Epoch corpus theo user, dùng chung giữa các process trên cùng máy.
+
+Mỗi user có một file rỗng trong CACHE_DIR/corpus_epoch/; epoch là mtime (ns)
+của file. Pipeline bump epoch sau khi tài liệu của user được ingest lại hoặc
+bị xoá; các cache dẫn xuất từ corpus (answer_cache, index HNSW) ghi lại epoch
+lúc build và coi dữ liệu của mình là cũ khi epoch đổi.
+"""
+
+_EPOCH_DIR = settings.cache_dir / "corpus_epoch"
+
+
+def _epoch_path(user_id: str) -> Path:
+    return _EPOCH_DIR / hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+
+
+def corpus_epoch(user_id: str) -> int:
+    """Epoch corpus hiện tại của user, 0 nếu tài liệu của user chưa từng đổi."""
+    try:
+        return _epoch_path(user_id).stat().st_mtime_ns
+    except OSError:
+        return 0
+
+
+def bump_corpus_epoch(user_id: str) -> bool:
+    """Đổi epoch corpus của user; False nếu không ghi được file (chỉ cache trong process hiện tại được bỏ)."""
+    path = _epoch_path(user_id)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+        now = time_ns()  # mtime theo ns: hai lần bump liên tiếp luôn cho epoch khác nhau
+        os.utime(path, ns=(now, now))
+    except OSError:
+        return False
+    return True
@@ -1,12 +1,16 @@
 from __future__ import annotations
 
-from typing import Iterable, List
+import threading
+from time import perf_counter
+from typing import Iterable, Iterator, List, Sequence
 
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
 from .config import settings
 from .chunker import TextChunk
+from .embedding_cache import cache_key, get_embedding_cache
+from .embedding_pool import get_embedding_pool
 
 
 """Sinh vector embedding cho từng đoạn văn bản đã được chunk."""
@@ -21,43 +25,189 @@ class EmbeddingResult:
         self.vector = vector
 
 
+class EmbeddingBatch:
+    """
+    Kết quả embed dạng cột: một ma trận float32 (n, dim) liền khối cùng các mảng
+    song song text / page_number / chunk_index. Truy cập từng dòng trả về view
+    của ma trận (không copy).
+    """
+    __slots__ = ("vectors", "texts", "page_numbers", "chunk_indexes")
+
+    def __init__(self, chunks: Sequence[TextChunk], vectors: np.ndarray) -> None:
+        if len(chunks) != len(vectors):
+            raise ValueError(f"EmbeddingBatch: {len(chunks)} chunks but {len(vectors)} vectors")
+        self.vectors = vectors
+        self.texts: List[str] = [chunk.text for chunk in chunks]
+        self.page_numbers: List[int | None] = [chunk.page_number for chunk in chunks]
+        self.chunk_indexes = np.fromiter((chunk.chunk_index for chunk in chunks), dtype=np.int64, count=len(chunks))
+
+    @classmethod
+    def empty(cls) -> "EmbeddingBatch":
+        return cls([], np.zeros((0, 0), dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, i: int) -> EmbeddingResult:
+        """Một dòng dưới dạng EmbeddingResult (vector là view của ma trận)."""
+        chunk = TextChunk(text=self.texts[i], page_number=self.page_numbers[i], chunk_index=int(self.chunk_indexes[i]))
+        return EmbeddingResult(chunk=chunk, vector=self.vectors[i])
+
+    def __iter__(self) -> Iterator[EmbeddingResult]:
+        return (self[i] for i in range(len(self)))
+
+
 _model: SentenceTransformer | None = None
+# Tuần tự hoá việc load/dùng model và tokenizer (fast tokenizer không an toàn khi gọi song song)
+# khi nhiều tài liệu được ingest đồng thời trong cùng process
+model_lock = threading.RLock()
 
 
 def _get_model() -> SentenceTransformer:
     """Khởi tạo model và move to GPU nếu có."""
     global _model
-    if _model is None:
+    if _model is not None:
+        return _model
+    with model_lock:
+        if _model is not None:
+            return _model
         import torch
-        _model = SentenceTransformer(settings.hf_model_name)
-        
+        model = SentenceTransformer(settings.hf_model_name)
+
         # Auto-detect và sử dụng GPU
         if torch.cuda.is_available():
-            _model = _model.to('cuda')
+            model = model.to('cuda')
             print(f"✅ Model on GPU: {torch.cuda.get_device_name(0)}")
         else:
             print("⚠️ GPU not available, using CPU")
+        _model = model
     return _model
 
 
-def embed_chunks(chunks: Iterable[TextChunk]) -> List[EmbeddingResult]:
-    """Sinh embedding với GPU acceleration nếu có."""
+_MAX_BATCH_FACTOR = 8  # Batch chunk ngắn tối đa gấp 8 lần batch_size mặc định
+
+
+def _token_lengths(model: SentenceTransformer, texts: Sequence[str]) -> np.ndarray:
+    """Số token (kể cả special token, đã cắt theo max_seq_length) của từng text; lỗi thì ước lượng theo ký tự."""
+    max_len = int(model.max_seq_length)
+    try:
+        ids = model.tokenizer(list(texts), add_special_tokens=True, truncation=True, max_length=max_len)["input_ids"]
+        return np.fromiter((len(row) for row in ids), dtype=np.int64, count=len(texts))
+    except Exception:
+        return np.minimum(np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts)) // 4 + 2, max_len)
+
+
+def plan_length_batches(lengths: np.ndarray, token_budget: int, max_batch: int) -> List[np.ndarray]:
+    """
+    Sắp xếp theo độ dài token rồi gom batch sao cho số token sau padding
+    (số phần tử x độ dài dài nhất) không vượt token_budget.
+
+    Returns:
+        Danh sách mảng chỉ số (theo thứ tự đầu vào) của từng batch
+    """
+    order = np.argsort(lengths, kind="stable")
+    batches: List[np.ndarray] = []
+    start = 0
+    for pos in range(1, len(order)):
+        count = pos - start + 1  # Số phần tử nếu thêm order[pos] (dài nhất batch vì đã sắp xếp tăng dần)
+        if count > max_batch or count * int(lengths[order[pos]]) > token_budget:
+            batches.append(order[start:pos])
+            start = pos
+    if len(order):
+        batches.append(order[start:])
+    return batches
+
+
+def _encode_bucketed(
+    model: SentenceTransformer, texts: List[str], batch_size: int, token_budget: int = 0
+) -> np.ndarray:
+    """Encode theo batch cùng độ dài token với batch size thích ứng, trả về đúng thứ tự đầu vào."""
+    lengths = _token_lengths(model, texts)
+    token_budget = token_budget or settings.embed_batch_tokens or batch_size * int(model.max_seq_length)
+    result: np.ndarray | None = None
+    for batch in plan_length_batches(lengths, token_budget, batch_size * _MAX_BATCH_FACTOR):
+        vectors = model.encode(
+            [texts[i] for i in batch],
+            batch_size=len(batch),
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+        if result is None:
+            result = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+        result[batch] = vectors
+    return result
+
+
+def _encode_pool_sorted(pool, texts: List[str], batch_size: int) -> np.ndarray:
+    """Gửi text cho pool theo thứ tự độ dài (shard đồng đều độ dài), rồi trả lại thứ tự ban đầu."""
+    # Sắp theo số ký tự để process chính không phải load model chỉ để lấy tokenizer
+    order = np.argsort(np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts)), kind="stable")
+    vectors = pool.encode([texts[i] for i in order], batch_size=batch_size)
+    result = np.empty_like(vectors)
+    result[order] = vectors
+    return result
+
+
+def embed_chunks(chunks: Iterable[TextChunk]) -> EmbeddingBatch:
+    """
+    Sinh embedding với GPU acceleration nếu có.
+
+    Tra cache embedding (theo hash model + text) trước; chỉ các chunk miss
+    mới được gom batch gửi vào model.encode, kết quả được ghi lại vào cache.
+    Trên CPU với EMBED_WORKERS > 1, các chunk miss được encode song song bởi EmbeddingPool.
+    Với EMBED_LENGTH_BUCKETING, chunk được gom batch theo độ dài token để giảm padding.
+    Vector được ghi thẳng vào một ma trận (n, dim) của EmbeddingBatch, không tạo mảng riêng cho từng chunk.
+    """
     chunk_list = list(chunks)
     if not chunk_list:
-        return []
-    
-    model = _get_model()
-    
-    # Optimize batch size cho GPU (GTX 1650 4GB VRAM)
-    import torch
-    batch_size = 64 if torch.cuda.is_available() else 32
-    
-    embeddings = model.encode(
-        [chunk.text for chunk in chunk_list],
-        batch_size=batch_size,
-        show_progress_bar=True,
-        convert_to_numpy=True
-    )
-    
-    return [EmbeddingResult(chunk=chunk, vector=np.array(vector, dtype=np.float32)) 
-            for chunk, vector in zip(chunk_list, embeddings)]
+        return EmbeddingBatch.empty()
+
+    texts = [chunk.text for chunk in chunk_list]
+    cache = get_embedding_cache()
+    keys = [cache_key(settings.hf_model_name, text) for text in texts] if cache else []
+    cached = cache.get_many(keys) if cache else {}
+
+    hits = {i: cached[key] for i, key in enumerate(keys) if key in cached}
+    missing = [i for i in range(len(texts)) if i not in hits]
+    matrix: np.ndarray | None = None
+    if hits:
+        matrix = np.empty((len(texts), len(next(iter(hits.values())))), dtype=np.float32)
+        for i, vector in hits.items():
+            matrix[i] = vector
+
+    if missing:
+        # Optimize batch size cho GPU (GTX 1650 4GB VRAM)
+        import torch
+        use_gpu = torch.cuda.is_available()
+        batch_size = 64 if use_gpu else 32
+
+        # CPU + EMBED_WORKERS > 1: chia shard cho pool nhiều process
+        pool = None if use_gpu else get_embedding_pool()
+
+        start = perf_counter()
+        missing_texts = [texts[i] for i in missing]
+        if pool is not None and len(missing) > pool.shard_size:
+            if settings.embed_length_bucketing:
+                embeddings = _encode_pool_sorted(pool, missing_texts, batch_size)
+            else:
+                embeddings = pool.encode(missing_texts, batch_size=batch_size)
+        elif settings.embed_length_bucketing:
+            with model_lock:
+                embeddings = _encode_bucketed(_get_model(), missing_texts, batch_size)
+        else:
+            with model_lock:
+                embeddings = _get_model().encode(
+                    missing_texts,
+                    batch_size=batch_size,
+                    show_progress_bar=True,
+                    convert_to_numpy=True
+                )
+        if matrix is None:
+            matrix = np.empty((len(texts), embeddings.shape[1]), dtype=np.float32)
+        matrix[missing] = embeddings
+
+        if cache:
+            cache.record_encode_time(len(missing), perf_counter() - start)
+            cache.put_many((keys[i], matrix[i]) for i in missing)
+
+    return EmbeddingBatch(chunk_list, matrix)
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from time import time
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+"""
+Cache embedding trên đĩa, đánh địa chỉ theo nội dung (hash(model + text)).
+
+Vector lưu dạng float32 bytes trong SQLite, giới hạn dung lượng và loại bỏ
+entry ít dùng nhất (LRU) khi vượt ngưỡng. Dùng cho re-ingest cùng một PDF và
+các trang lặp lại giữa nhiều tài liệu (header, license, references).
+"""
+
+_SQLITE_MAX_VARS = 500  # Giới hạn số tham số trong một câu IN (...)
+
+
+def cache_key(model_name: str, text: str) -> str:
+    """Khoá content-addressed: sha256 của tên model + nội dung chunk."""
+    return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Key-value store (key → vector float32) trên SQLite với LRU theo dung lượng."""
+
+    def __init__(self, path: Path, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+        # Bộ đếm thống kê
+        self.hits = 0
+        self.misses = 0
+        self.time_saved_s = 0.0
+        self._encode_s_per_item = 0.0  # Thời gian encode trung bình 1 chunk (đo từ các lần miss)
+
+    def _select_in_locked(self, columns: str, keys: List[str]) -> List[tuple]:
+        """SELECT columns ... WHERE key IN (keys), chia nhỏ theo giới hạn tham số của SQLite."""
+        rows: List[tuple] = []
+        for i in range(0, len(keys), _SQLITE_MAX_VARS):
+            batch = keys[i:i + _SQLITE_MAX_VARS]
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(
+                self._conn.execute(f"SELECT {columns} FROM embeddings WHERE key IN ({placeholders})", batch)
+            )
+        return rows
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Lấy các vector có trong cache, cập nhật last_access cho các key trúng."""
+        with self._lock:
+            found = {
+                key: np.frombuffer(blob, dtype=np.float32)
+                for key, blob in self._select_in_locked("key, vector", list(dict.fromkeys(keys)))
+            }
+            if found:
+                now = time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+            self.time_saved_s += hits * self._encode_s_per_item
+        return found
+
+    def put_many(self, items: Iterable[tuple[str, np.ndarray]]) -> None:
+        """Ghi các vector mới rồi loại bỏ entry LRU nếu vượt max_bytes."""
+        now = time()
+        payload = {key: np.asarray(vector, dtype=np.float32).tobytes() for key, vector in items}
+        if not payload:
+            return
+        with self._lock:
+            replaced = sum(size for (size,) in self._select_in_locked("LENGTH(vector)", list(payload)))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, blob, now) for key, blob in payload.items()],
+            )
+            self._total_bytes += sum(len(blob) for blob in payload.values()) - replaced
+            self._evict_locked()
+            self._conn.commit()
+
+    def record_encode_time(self, n_items: int, seconds: float) -> None:
+        """Cập nhật thời gian encode trung bình/chunk để ước lượng thời gian tiết kiệm khi hit."""
+        if n_items <= 0:
+            return
+        per_item = seconds / n_items
+        with self._lock:
+            if self._encode_s_per_item == 0.0:
+                self._encode_s_per_item = per_item
+            else:
+                self._encode_s_per_item = 0.8 * self._encode_s_per_item + 0.2 * per_item
+
+    def _evict_locked(self) -> None:
+        """Xoá entry có last_access cũ nhất tới khi tổng dung lượng <= max_bytes."""
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access ASC LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            evicted: list[str] = []
+            for key, size in rows:
+                evicted.append(key)
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key in evicted])
+            logger.info(f"Embedding cache evicted {len(evicted)} entries")
+
+    def stats(self) -> Dict[str, float]:
+        """Số liệu hit/miss, hit rate, thời gian encode tiết kiệm được và dung lượng."""
+        with self._lock:
+            total = self.hits + self.misses
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "time_saved_s": round(self.time_saved_s, 3),
+                "entries": entries,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def close(self) -> None:
+        """Đóng kết nối SQLite."""
+        with self._lock:
+            self._conn.close()
+
+
+_cache: EmbeddingCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Tạo (hoặc tái sử dụng) cache dùng chung; trả về None nếu EMBEDDING_CACHE bị tắt."""
+    global _cache
+    if not settings.embedding_cache_enabled:
+        return None
+    if _cache is None:
+        # Nhiều job ingest / thread encode gọi lần đầu cùng lúc: chỉ một kết nối SQLite được tạo
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    path=settings.cache_dir / "embeddings.sqlite",
+                    max_bytes=settings.embedding_cache_max_mb * 1024 * 1024,
+                )
+    return _cache
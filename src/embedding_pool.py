@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+
+import numpy as np
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+"""
+Pool nhiều process encode embedding trên CPU cho ingest khối lượng lớn (opt-in: EMBED_WORKERS > 1).
+
+Mỗi worker load model một lần và giới hạn số thread torch để tổng số thread
+không vượt số core. Pool được khởi động một lần và tái sử dụng cho mọi tài liệu
+trong cùng process. Module này KHÔNG import torch ở top-level để worker (spawn)
+kịp đặt biến môi trường thread trước khi torch được import.
+"""
+
+_worker_model = None  # Model trong từng process worker
+
+
+def _init_worker(model_name: str, torch_threads: int) -> None:
+    """Initializer của worker: giới hạn thread BLAS/torch rồi load model."""
+    global _worker_model
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(torch_threads)
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_shard(texts: List[str], batch_size: int) -> np.ndarray:
+    """Encode một shard trong worker."""
+    return np.asarray(
+        _worker_model.encode(texts, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True),
+        dtype=np.float32,
+    )
+
+
+class EmbeddingPool:
+    """Chia văn bản thành shard, encode song song trên các worker và ghép lại đúng thứ tự."""
+
+    def __init__(self, workers: int, torch_threads: int = 0, shard_size: int = 16) -> None:
+        """
+        Args:
+            workers: Số process worker
+            torch_threads: Số thread torch mỗi worker (0 = tự chia đều số core cho các worker)
+            shard_size: Số văn bản mỗi task gửi cho worker
+        """
+        self.workers = max(workers, 1)
+        self.torch_threads = torch_threads or max((os.cpu_count() or 1) // self.workers, 1)
+        self.shard_size = max(shard_size, 1)
+        self.broken = False  # Worker đã chết: pool không dùng được nữa, get_embedding_pool tạo pool mới
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(settings.hf_model_name, self.torch_threads),
+        )
+        logger.info(f"Embedding pool: {self.workers} workers x {self.torch_threads} torch threads")
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Encode texts, trả về ma trận float32 (len(texts), dim) theo đúng thứ tự đầu vào."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        shards = [texts[i:i + self.shard_size] for i in range(0, len(texts), self.shard_size)]
+        try:
+            results = self._executor.map(_encode_shard, shards, [batch_size] * len(shards))
+            return np.vstack(list(results))
+        except BrokenProcessPool:
+            self.broken = True
+            raise
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Dừng các worker."""
+        self._executor.shutdown(wait=wait)
+
+
+_pool: EmbeddingPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_embedding_pool() -> EmbeddingPool | None:
+    """Pool dùng chung (tạo lần đầu khi cần, tạo lại nếu pool cũ đã hỏng); None nếu EMBED_WORKERS <= 1."""
+    global _pool
+    if settings.embed_workers <= 1:
+        return None
+    with _pool_lock:
+        if _pool is not None and _pool.broken:
+            logger.warning("Embedding pool is broken (a worker died), starting a new one")
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            _pool = EmbeddingPool(
+                workers=settings.embed_workers,
+                torch_threads=settings.embed_worker_threads,
+                shard_size=settings.embed_shard_size,
+            )
+        return _pool
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from time import monotonic
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from .config import settings
+from .embedder import _get_model, model_lock
+
+logger = logging.getLogger(__name__)
+
+"""
+Micro-batching cho encode câu hỏi trong RAG server.
+
+Các request đồng thời gửi câu hỏi vào hàng đợi; một thread nền gom tối đa
+max_batch câu (hoặc chờ tối đa max_wait_ms kể từ câu đầu tiên), gọi model.encode
+MỘT lần cho cả batch rồi trả vector về đúng caller đang chờ.
+
+Thread này là executor riêng cho encode (model dùng chung, tuần tự theo model_lock);
+hàng đợi có giới hạn max_pending: thread caller chờ chỗ trống, còn caller async
+(aencode) nhận EncodeQueueFull ngay để server trả 503 thay vì dồn request vô hạn.
+"""
+
+EncodeFn = Callable[[List[str]], np.ndarray]
+
+
+class EncodeQueueFull(RuntimeError):
+    """Hàng đợi encode đã đầy (quá tải); caller nên trả lỗi tạm thời (503) để client thử lại."""
+
+
+def _encode_with_model(texts: List[str]) -> np.ndarray:
+    """Encode một batch câu hỏi bằng model embedding dùng chung."""
+    model = _get_model()
+    with model_lock:
+        return model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+
+class EncodeBatcher:
+    """Gom các lời gọi encode đồng thời thành batch; an toàn khi gọi từ nhiều thread."""
+
+    def __init__(
+        self, encode_fn: EncodeFn, max_batch: int = 32, max_wait_ms: float = 5.0, max_pending: int = 0
+    ) -> None:
+        self.encode_fn = encode_fn
+        self.max_batch = max(max_batch, 1)
+        self.max_wait_s = max(max_wait_ms, 0.0) / 1000
+        self.max_pending = max(max_pending, 0)  # 0 = không giới hạn
+        self._queue: queue.Queue[tuple[str, Future] | None] = queue.Queue(self.max_pending)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> bool:
+        """True nếu thread gom batch đang chạy."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Khởi động thread gom batch (gọi lúc server startup)."""
+        with self._lock:
+            if self.running:
+                return
+            self._thread = threading.Thread(target=self._run, name="encode-batcher", daemon=True)
+            self._thread.start()
+        logger.info(f"Encode batcher started (max_batch={self.max_batch}, max_wait={self.max_wait_s * 1000:.1f}ms)")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Dừng thread sau khi xử lý hết các câu đã nhận (gọi lúc server shutdown)."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+        # Request lọt vào hàng đợi sau lệnh dừng: báo lỗi thay vì để caller chờ mãi
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("EncodeBatcher đã dừng"))
+
+    def submit(self, text: str, block: bool = True, timeout: float | None = None) -> Future:
+        """
+        Đưa một câu vào hàng đợi, trả về Future chứa vector float32.
+
+        Hàng đợi đầy: block=True chờ tối đa timeout giây, block=False hoặc hết
+        thời gian chờ thì raise EncodeQueueFull.
+        """
+        if not self.running:
+            raise RuntimeError("EncodeBatcher chưa được start()")
+        future: Future = Future()
+        try:
+            self._queue.put((text, future), block, timeout)
+        except queue.Full:
+            self.rejected += 1
+            raise EncodeQueueFull(f"Hàng đợi encode đã đầy ({self.max_pending} câu đang chờ)") from None
+        return future
+
+    def encode(self, text: str, timeout: float | None = None) -> np.ndarray:
+        """Encode một câu qua batcher (block tới khi batch chứa câu này chạy xong)."""
+        return self.submit(text).result(timeout)
+
+    async def aencode(self, text: str) -> np.ndarray:
+        """Encode từ event loop: không chiếm thread nào trong lúc chờ; hàng đợi đầy → EncodeQueueFull."""
+        return await asyncio.wrap_future(self.submit(text, block=False))
+
+    def _collect(self, first: tuple[str, Future]) -> tuple[List[tuple[str, Future]], bool]:
+        """Gom thêm request cho tới khi đủ max_batch hoặc hết max_wait; trả về (batch, có_lệnh_dừng)."""
+        batch = [first]
+        deadline = monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stopping = self._collect(first)
+            self._process(batch)
+            if stopping:
+                return
+
+    def _process(self, batch: Sequence[tuple[str, Future]]) -> None:
+        """Encode các câu (khử trùng lặp trong batch) và trả kết quả cho từng Future."""
+        # Bỏ request đã bị huỷ khi còn trong hàng đợi (caller async quá hạn / ngắt kết nối)
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = np.asarray(self.encode_fn(texts), dtype=np.float32)
+        except Exception as exc:  # noqa: BLE001 - chuyển lỗi cho tất cả caller trong batch
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            future.set_result(by_text[text])
+        self.batches += 1
+        self.items += len(batch)
+
+    def stats(self) -> Dict[str, float]:
+        """Số batch đã chạy và kích thước batch trung bình."""
+        return {
+            "running": self.running,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "pending": self._queue.qsize(),
+            "rejected": self.rejected,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait_s * 1000,
+        }
+
+
+encode_batcher = EncodeBatcher(
+    _encode_with_model,
+    max_batch=settings.encode_batch_max_size,
+    max_wait_ms=settings.encode_batch_max_wait_ms,
+    max_pending=settings.encode_max_pending,
+)
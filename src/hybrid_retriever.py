@@ -1,14 +1,28 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
 import re
+import threading
 from dataclasses import dataclass
-from typing import List, Optional, Dict, Any, Literal
-from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Awaitable, List, Optional, Dict, Any, Literal, Tuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 
 from langchain_community.retrievers import TavilySearchAPIRetriever
-from .retriever import RetrievedChunk, retrieve_similar_chunks_by_user
+from .config import settings
+from .encode_batcher import EncodeQueueFull
+from .lexical_index import fuse_rankings, lexical_index
+from .query_cache import normalize_query
+from .reranker import reranker
+from .retriever import (
+    RetrievedChunk,
+    aretrieve_similar_chunks_by_document,
+    aretrieve_similar_chunks_by_user,
+    retrieve_similar_chunks_by_user,
+)
+from .web_cache import web_result_cache
 
 # Thiết lập logging
 logger = logging.getLogger(__name__)
@@ -21,6 +35,27 @@ class HybridRetrievalResult:
 
 WebSearchMode = Literal["auto", "force-on", "force-off"]
 
+_retrieval_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_retrieval_executor() -> ThreadPoolExecutor:
+    """Executor dùng chung (HYBRID_EXECUTOR_WORKERS thread) cho các nguồn của retrieve sync."""
+    global _retrieval_executor
+    if _retrieval_executor is None:
+        with _executor_lock:
+            if _retrieval_executor is None:
+                _retrieval_executor = ThreadPoolExecutor(
+                    max_workers=max(settings.hybrid_executor_workers, 1), thread_name_prefix="hybrid-retrieve"
+                )
+    return _retrieval_executor
+
+
+def _source_deadline(start: float, source_timeout: float) -> Optional[float]:
+    """Mốc perf_counter mà nguồn phải xong: min(timeout riêng, deadline chung); None = không giới hạn."""
+    limits = [t for t in (source_timeout, settings.hybrid_retrieval_deadline) if t > 0]
+    return start + min(limits) if limits else None
+
 class HybridRetriever:
     """
     Hybrid Retriever kết hợp:
@@ -65,6 +100,28 @@ class HybridRetriever:
                 api_key=self.tavily_api_key,
                 search_depth="advanced"
             )
+        # Bản sao retriever theo k: tham số từng request không sửa retriever dùng chung
+        self._web_retrievers: Dict[int, TavilySearchAPIRetriever] = {}
+
+    def _web_retriever(self, k: int) -> TavilySearchAPIRetriever:
+        """Retriever Tavily với k kết quả (copy nông từ retriever gốc, tạo một lần cho mỗi k)."""
+        retriever = self._web_retrievers.get(k)
+        if retriever is None:
+            retriever = self.tavily_retriever.model_copy(update={"k": k})
+            self._web_retrievers.setdefault(k, retriever)
+        return retriever
+
+    @staticmethod
+    def _new_metadata(web_search_mode: WebSearchMode, enable_web: bool) -> Dict[str, Any]:
+        return {
+            "internal_results": 0,
+            "web_results": 0,
+            "total_results": 0,
+            "web_search_mode": web_search_mode,
+            "web_enabled": enable_web,
+            "lexical_results": 0,
+            "timed_out_sources": [],  # Nguồn không xong trước deadline (kết quả bị bỏ qua)
+        }
 
     def _should_enable_web_search(
         self,
@@ -123,7 +180,7 @@ class HybridRetriever:
             user_id: ID người dùng (cho tìm kiếm nội bộ)
             document_id: Nếu có, CHỈ tìm trong tài liệu này (khóa tài liệu)
             web_search_mode: ⭐ MỚI - "auto" (thông minh), "force-on", "force-off"
-            top_k: Tổng số kết quả mong muốn (sau khi gộp)
+            top_k: Tổng số kết quả mong muốn (sau khi gộp và rerank nếu RERANK_ENABLED)
             web_max_results: Số kết quả web tối đa
             internal_max_results: Số kết quả nội bộ tối đa
             
@@ -132,19 +189,11 @@ class HybridRetriever:
         """
         # Resolve web search based on mode
         enable_web = self._should_enable_web_search(web_search_mode, query, document_id)
-        
-        all_chunks: List[RetrievedChunk] = []
-        metadata = {
-            "internal_results": 0,
-            "web_results": 0,
-            "total_results": 0,
-            "web_search_mode": web_search_mode,
-            "web_enabled": enable_web,
-        }
+        metadata = self._new_metadata(web_search_mode, enable_web)
 
         # --- HÀM HỖ TRỢ cho thực thi song song ---
-        def _retrieve_internal():
-            """Hàm tìm kiếm nội bộ"""
+        def _retrieve_dense():
+            """Hàm tìm kiếm nội bộ (vector)"""
             try:
                 if document_id:
                     from .retriever import retrieve_similar_chunks_by_document
@@ -162,6 +211,8 @@ class HybridRetriever:
                     )
                     logger.info(f"📚 Tìm kiếm nội bộ: tìm thấy {len(chunks)} đoạn")
                 return chunks
+            except EncodeQueueFull:
+                raise  # Quá tải: báo cho server trả 503 thay vì im lặng bỏ nguồn nội bộ
             except Exception as e:
                 logger.error(f"❌ Tìm kiếm nội bộ thất bại: {e}")
                 return []
@@ -171,58 +222,221 @@ class HybridRetriever:
             if not enable_web or not self.tavily_retriever:
                 return []
             
+            def _search():
+                return self._web_retriever(web_max_results).invoke(query)
+
+            try:
+                web_docs = web_result_cache.get_or_fetch(self._web_cache_key(query, web_max_results), _search)
+                web_chunks = self._web_docs_to_chunks(web_docs)
+                logger.info(f"🌐 Tìm kiếm web: tìm thấy {len(web_chunks)} kết quả")
+                return web_chunks
+            except Exception as e:
+                logger.error(f"❌ Tìm kiếm web thất bại: {e}")
+                return []
+
+        # --- ⚡ THỰC THI SONG SONG: Vector + từ khoá (BM25 cục bộ) + Web đồng thời, mỗi nguồn có deadline riêng ---
+        start = perf_counter()
+        executor = _get_retrieval_executor()
+        futures = {"internal": executor.submit(_retrieve_dense)}
+        if settings.lexical_index_enabled:
+            futures["lexical"] = executor.submit(
+                self._lexical_search, query, user_id, document_id, internal_max_results
+            )
+        if enable_web and self.tavily_retriever:
+            futures["web"] = executor.submit(_retrieve_web)
+        timeouts = {
+            "internal": settings.hybrid_internal_timeout,
+            "lexical": settings.hybrid_internal_timeout,
+            "web": settings.hybrid_web_timeout,
+        }
+
+        results: Dict[str, List[RetrievedChunk]] = {"internal": [], "lexical": [], "web": []}
+        for source, future in futures.items():
+            deadline = _source_deadline(start, timeouts[source])
+            try:
+                # Nguồn quá hạn vẫn chạy nốt trong executor (web vẫn ghi vào web cache)
+                results[source] = future.result(timeout=None if deadline is None else max(deadline - perf_counter(), 0))
+            except FuturesTimeout:
+                self._record_timeout(metadata, source, start)
+
+        internal = self._fuse_internal(results["internal"], results["lexical"], internal_max_results, metadata)
+        candidates = self._merge(internal, results["web"], metadata)
+        if settings.rerank_enabled:
+            candidates, metadata["rerank"] = reranker.rerank(query, candidates)
+        return self._top_k(candidates, top_k, metadata)
+
+    async def aretrieve(
+        self,
+        query: str,
+        user_id: str,
+        document_id: Optional[str] = None,
+        web_search_mode: WebSearchMode = "auto",
+        top_k: int = 5,
+        web_max_results: int = 3,
+        internal_max_results: int = 5
+    ) -> HybridRetrievalResult:
+        """
+        Như retrieve nhưng chạy trên event loop: nguồn nội bộ dùng retrieval async
+        (encode trên thread encode riêng, RPC qua Supabase AsyncClient), web search
+        chạy đồng thời qua ainvoke của Tavily retriever.
+        """
+        enable_web = self._should_enable_web_search(web_search_mode, query, document_id)
+        metadata = self._new_metadata(web_search_mode, enable_web)
+
+        async def _retrieve_dense() -> List[RetrievedChunk]:
             try:
-                self.tavily_retriever.k = web_max_results
-                web_docs = self.tavily_retriever.invoke(query)
-                
-                web_chunks = []
-                for i, doc in enumerate(web_docs):
-                    sim_score = 0.45 - (i * 0.05)  # Lower than internal to prioritize docs
-                    
-                    source_url = doc.metadata.get('source', 'Unknown URL')
-                    title = doc.metadata.get('title', 'Web Result')
-                    
-                    chunk = RetrievedChunk(
-                        content=doc.page_content,
-                        chunk_index=i,
-                        page_number=None,
-                        similarity=sim_score,
-                        metadata={
-                            'source': 'web',
-                            'url': source_url,
-                            'title': title
-                        }
+                if document_id:
+                    chunks = await aretrieve_similar_chunks_by_document(
+                        query=query, document_id=document_id, top_k=internal_max_results
                     )
-                    web_chunks.append(chunk)
-                
+                    logger.info(f"📄 Tìm kiếm trong tài liệu cụ thể: tìm thấy {len(chunks)} đoạn từ tài liệu {document_id}")
+                else:
+                    chunks = await aretrieve_similar_chunks_by_user(
+                        query=query, user_id=user_id, top_k=internal_max_results
+                    )
+                    logger.info(f"📚 Tìm kiếm nội bộ: tìm thấy {len(chunks)} đoạn")
+                return chunks
+            except EncodeQueueFull:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Tìm kiếm nội bộ thất bại: {e}")
+                return []
+
+        async def _retrieve_internal() -> List[RetrievedChunk]:
+            # BM25 chạy trên thread (lần đầu phải đọc segment từ đĩa) song song với vector search
+            dense, lexical = await asyncio.gather(
+                _retrieve_dense(),
+                asyncio.to_thread(self._lexical_search, query, user_id, document_id, internal_max_results),
+            )
+            return self._fuse_internal(dense, lexical, internal_max_results, metadata)
+
+        async def _retrieve_web() -> List[RetrievedChunk]:
+            if not enable_web or not self.tavily_retriever:
+                return []
+            async def _search():
+                return await self._web_retriever(web_max_results).ainvoke(query)
+
+            try:
+                web_docs = await web_result_cache.aget_or_fetch(self._web_cache_key(query, web_max_results), _search)
+                web_chunks = self._web_docs_to_chunks(web_docs)
                 logger.info(f"🌐 Tìm kiếm web: tìm thấy {len(web_chunks)} kết quả")
                 return web_chunks
             except Exception as e:
                 logger.error(f"❌ Tìm kiếm web thất bại: {e}")
                 return []
 
-        # --- ⚡ THỰC THI SONG SONG: Nội bộ + Web đồng thời ---
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            future_internal = executor.submit(_retrieve_internal)
-            future_web = executor.submit(_retrieve_web)
-            
-            internal_chunks = future_internal.result()
-            web_chunks = future_web.result()
-            
-            all_chunks.extend(internal_chunks)
-            all_chunks.extend(web_chunks)
-            
-            metadata["internal_results"] = len(internal_chunks)
-            metadata["web_results"] = len(web_chunks)
-
-        # 3. Re-ranking / Sorting (Simple merge based on similarity)
-        # Internal chunks có cosine similarity thực (0-1).
-        # Web chunks có giả lập similarity (0.85 xuống).
-        # Sort lại toàn bộ list
-        all_chunks.sort(key=lambda x: x.similarity, reverse=True)
-        
-        # Cắt top_k
-        final_chunks = all_chunks[:top_k]
+        start = perf_counter()
+
+        async def _bounded(source: str, pending: Awaitable[List[RetrievedChunk]], timeout: float) -> List[RetrievedChunk]:
+            deadline = _source_deadline(start, timeout)
+            if deadline is None:
+                return await pending
+            try:
+                return await asyncio.wait_for(pending, max(deadline - perf_counter(), 0))
+            except asyncio.TimeoutError:
+                self._record_timeout(metadata, source, start)
+                return []
+
+        # Web search được shield: quá hạn thì request không chờ nữa nhưng lời gọi vẫn chạy
+        # nốt và ghi vào web cache (các request đang chờ cùng câu hỏi không bị huỷ theo)
+        web_task = asyncio.ensure_future(_retrieve_web())
+        internal_chunks, web_chunks = await asyncio.gather(
+            _bounded("internal", _retrieve_internal(), settings.hybrid_internal_timeout),
+            _bounded("web", asyncio.shield(web_task), settings.hybrid_web_timeout),
+        )
+        candidates = self._merge(internal_chunks, web_chunks, metadata)
+        if settings.rerank_enabled:
+            candidates, metadata["rerank"] = await reranker.arerank(query, candidates)
+        return self._top_k(candidates, top_k, metadata)
+
+    @staticmethod
+    def _lexical_search(query: str, user_id: str, document_id: Optional[str], top_k: int) -> List[RetrievedChunk]:
+        """Tìm theo từ khoá trong index BM25 build lúc ingest; tắt hoặc lỗi thì trả về []."""
+        if not settings.lexical_index_enabled:
+            return []
+        try:
+            return lexical_index.search(query, user_id, top_k=top_k, document_id=document_id)
+        except Exception as e:
+            logger.error(f"❌ Tìm kiếm từ khoá thất bại: {e}")
+            return []
+
+    @staticmethod
+    def _fuse_internal(
+        dense: List[RetrievedChunk], lexical: List[RetrievedChunk], limit: int, metadata: Dict[str, Any]
+    ) -> List[RetrievedChunk]:
+        """Gộp kết quả vector + BM25 (RRF), giữ tối đa limit chunk nội bộ."""
+        metadata["lexical_results"] = len(lexical)
+        if lexical:
+            logger.info(f"🔤 Tìm kiếm từ khoá: tìm thấy {len(lexical)} đoạn")
+        return fuse_rankings(dense, lexical, limit, settings.lexical_fusion_k)
+
+    @staticmethod
+    def _record_timeout(metadata: Dict[str, Any], source: str, start: float) -> None:
+        """Ghi nguồn quá hạn vào metadata; retrieval trả về kết quả của các nguồn đã xong."""
+        logger.warning(f"⏱️ Nguồn {source} quá hạn sau {(perf_counter() - start) * 1000:.0f}ms, bỏ qua kết quả")
+        metadata["timed_out_sources"].append(source)
+
+    @staticmethod
+    def _web_cache_key(query: str, web_max_results: int) -> tuple[str, int]:
+        """Khoá cache web: câu hỏi chuẩn hoá (NFC, khoảng trắng, hoa thường) + số kết quả."""
+        return normalize_query(query), web_max_results
+
+    @staticmethod
+    def _web_docs_to_chunks(web_docs: List[Any]) -> List[RetrievedChunk]:
+        """Chuyển Document của Tavily thành RetrievedChunk với similarity giả lập giảm dần."""
+        web_chunks = []
+        for i, doc in enumerate(web_docs):
+            sim_score = 0.45 - (i * 0.05)  # Lower than internal to prioritize docs
+
+            source_url = doc.metadata.get('source', 'Unknown URL')
+            title = doc.metadata.get('title', 'Web Result')
+
+            chunk = RetrievedChunk(
+                content=doc.page_content,
+                chunk_index=i,
+                page_number=None,
+                similarity=sim_score,
+                metadata={
+                    'source': 'web',
+                    'url': source_url,
+                    'title': title
+                }
+            )
+            web_chunks.append(chunk)
+        return web_chunks
+
+    @staticmethod
+    def _merge(
+        internal_chunks: List[RetrievedChunk],
+        web_chunks: List[RetrievedChunk],
+        metadata: Dict[str, Any],
+    ) -> List[RetrievedChunk]:
+        """
+        Gộp kết quả nội bộ + web theo similarity (thứ tự dự phòng khi không rerank).
+
+        Chunk nội bộ giữ nguyên thứ tự fusion (vector + BM25). Chunk chỉ có từ
+        BM25 (similarity = 0, không có cosine) được xếp ngay sau chunk nội bộ
+        đứng trước nó, nên không bị đẩy xuống dưới kết quả web.
+        """
+        metadata["internal_results"] = len(internal_chunks)
+        metadata["web_results"] = len(web_chunks)
+
+        # Khoá sắp xếp của chunk nội bộ: cosine, không tăng theo thứ tự fusion
+        ranked: List[Tuple[float, int, int, RetrievedChunk]] = []
+        key = float("inf")
+        for i, chunk in enumerate(internal_chunks):
+            if (chunk.metadata or {}).get("retrieval") != "bm25":
+                key = min(key, chunk.similarity)
+            ranked.append((key, 0, i, chunk))
+        # Web chunks có similarity giả lập (0.45 trở xuống), nội bộ được ưu tiên khi bằng điểm
+        ranked.extend((chunk.similarity, 1, i, chunk) for i, chunk in enumerate(web_chunks))
+        ranked.sort(key=lambda item: (-item[0], item[1], item[2]))
+        return [chunk for _, _, _, chunk in ranked]
+
+    @staticmethod
+    def _top_k(candidates: List[RetrievedChunk], top_k: int, metadata: Dict[str, Any]) -> HybridRetrievalResult:
+        """Cắt top_k ứng viên (đã sort hoặc đã rerank)."""
+        final_chunks = candidates[:top_k]
         metadata["total_results"] = len(final_chunks)
 
         return HybridRetrievalResult(
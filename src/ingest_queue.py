@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from time import time
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+"""
+Hàng đợi job ingest bền vững trên đĩa (SQLite) cho ingestion worker.
+
+Node backend (hoặc CLI) chỉ cần enqueue; worker chạy lâu dài claim job theo
+thứ tự FIFO (các job của cùng một tài liệu chạy lần lượt). Job đang chạy khi worker bị dừng đột ngột được đưa lại hàng đợi
+khi worker khởi động lại; job lỗi được thử lại tối đa max_attempts lần.
+"""
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    document_id TEXT NOT NULL,
+    job_id TEXT,
+    force_refresh INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    worker TEXT,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs (status, id);
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_document ON ingest_jobs (document_id, status);
+"""
+
+
+@dataclass
+class IngestJob:
+    """Một job trong hàng đợi."""
+
+    id: int
+    document_id: str
+    job_id: Optional[str]
+    force_refresh: bool
+    status: str
+    attempts: int
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "IngestJob":
+        return cls(
+            id=row["id"],
+            document_id=row["document_id"],
+            job_id=row["job_id"],
+            force_refresh=bool(row["force_refresh"]),
+            status=row["status"],
+            attempts=row["attempts"],
+            error=row["error"],
+            result=json.loads(row["result"]) if row["result"] else None,
+        )
+
+
+class IngestQueue:
+    """Hàng đợi FIFO trên SQLite (WAL), dùng được từ nhiều process và thread."""
+
+    def __init__(self, path: Path, max_attempts: int = 3) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max(max_attempts, 1)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def enqueue(self, document_id: str, job_id: str | None = None, force_refresh: bool = False) -> int:
+        """Thêm job, trả về id trong hàng đợi."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO ingest_jobs (document_id, job_id, force_refresh, status, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                (document_id, job_id, int(force_refresh), QUEUED, time()),
+            )
+            return int(cursor.lastrowid)
+
+    def claim(self, worker: str) -> Optional[IngestJob]:
+        """
+        Lấy job cũ nhất đang chờ và đánh dấu running (nguyên tử giữa các process).
+
+        Bỏ qua job của tài liệu đang có job running: hai job cùng tài liệu không
+        bao giờ chạy song song (ghi/xoá embedding, fingerprint, index từ khoá).
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM ingest_jobs WHERE status = ? AND document_id NOT IN "
+                    "(SELECT document_id FROM ingest_jobs WHERE status = ?) ORDER BY id LIMIT 1",
+                    (QUEUED, RUNNING),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE ingest_jobs SET status = ?, attempts = attempts + 1, worker = ?, started_at = ? WHERE id = ?",
+                    (RUNNING, worker, time(), row["id"]),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = IngestJob.from_row(row)
+        job.status, job.attempts = RUNNING, job.attempts + 1
+        return job
+
+    def complete(self, job: IngestJob, result: Dict[str, Any]) -> None:
+        """Đánh dấu job thành công kèm thống kê."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingest_jobs SET status = ?, result = ?, error = NULL, finished_at = ? WHERE id = ?",
+                (DONE, json.dumps(result), time(), job.id),
+            )
+
+    def fail(self, job: IngestJob, error: str) -> bool:
+        """Ghi nhận lỗi; đưa lại hàng đợi nếu còn lượt thử. Trả về True nếu sẽ thử lại."""
+        retry = job.attempts < self.max_attempts
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingest_jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (QUEUED if retry else FAILED, error, None if retry else time(), job.id),
+            )
+        return retry
+
+    def requeue_running(self, worker: str | None = None) -> int:
+        """Đưa các job đang running (của worker đã chết) về lại hàng đợi; trả về số job."""
+        with self._lock:
+            if worker is None:
+                cursor = self._conn.execute("UPDATE ingest_jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING))
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE ingest_jobs SET status = ? WHERE status = ? AND worker = ?", (QUEUED, RUNNING, worker)
+                )
+            return cursor.rowcount
+
+    def get(self, queue_id: int) -> Optional[IngestJob]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM ingest_jobs WHERE id = ?", (queue_id,)).fetchone()
+        return IngestJob.from_row(row) if row else None
+
+    def recent(self, limit: int = 20) -> List[IngestJob]:
+        """Các job mới nhất (mọi trạng thái)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM ingest_jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [IngestJob.from_row(row) for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        """Số job theo trạng thái."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM ingest_jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_queue() -> IngestQueue:
+    """IngestQueue theo cấu hình INGEST_QUEUE_PATH / INGEST_JOB_MAX_ATTEMPTS."""
+    return IngestQueue(settings.ingest_queue_path, max_attempts=settings.ingest_job_max_attempts)
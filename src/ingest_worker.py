@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from time import perf_counter
+from typing import Any, Callable, Dict, Optional
+
+from .embedder import _get_model
+from .ingest_queue import IngestJob, IngestQueue
+from .pipeline import process_document
+from .progress import ProgressEvent
+
+logger = logging.getLogger(__name__)
+
+"""
+Worker ingest chạy lâu dài: load model một lần, lấy job từ IngestQueue và xử lý
+nhiều tài liệu đồng thời (tối đa `concurrency`).
+
+Mỗi job phát ra event có cấu trúc (dict) qua `emit`: started / progress /
+stage (số item, byte, throughput của từng stage ingest) / completed / failed. Hai cách in ra stdout: JSON mỗi dòng (json_lines) hoặc
+giao thức PROGRESS: cũ kèm dòng EVENT:<json> (có queue_id/job_id) cho mọi event (progress_lines).
+Mỗi file hàng đợi chỉ nên có một worker: khi khởi động, worker đưa các job
+còn "running" (do lần chạy trước bị dừng đột ngột) về lại hàng đợi.
+"""
+
+JobEventCallback = Callable[[Dict[str, Any]], None]
+
+_print_lock = threading.Lock()
+
+
+def json_lines(event: Dict[str, Any]) -> None:
+    """In event dạng JSON một dòng."""
+    line = json.dumps(event, ensure_ascii=False)
+    with _print_lock:
+        print(line, flush=True)
+
+
+def progress_lines(event: Dict[str, Any]) -> None:
+    """
+    Tương thích giao thức cũ: PROGRESS:<phần trăm>:<đã xử lý>:<tổng> (đúng ba trường như
+    ingest_document.py) cho event progress, và EVENT:<json> cho mọi event (job nằm trong JSON).
+    """
+    line = f"EVENT:{json.dumps(event, ensure_ascii=False)}"
+    with _print_lock:
+        if event["event"] == "progress":
+            print(f"PROGRESS:{event['percent']}:{event['processed']}:{event['total']}", flush=True)
+        print(line, flush=True)
+
+
+class IngestWorker:
+    """Xử lý job từ hàng đợi với số tài liệu chạy đồng thời có giới hạn."""
+
+    def __init__(
+        self,
+        queue: IngestQueue,
+        concurrency: int = 2,
+        poll_interval: float = 1.0,
+        emit: Optional[JobEventCallback] = None,
+        worker_id: Optional[str] = None,
+    ) -> None:
+        self.queue = queue
+        self.concurrency = max(concurrency, 1)
+        self.poll_interval = max(poll_interval, 0.05)
+        self.emit = emit or json_lines
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        """Ngừng nhận job mới; các job đang chạy vẫn được chạy xong."""
+        self._stop.set()
+
+    def run(self, drain: bool = False) -> None:
+        """
+        Vòng lặp chính: claim job khi còn slot, chờ khi hàng đợi rỗng.
+
+        Args:
+            drain: True = thoát khi hàng đợi rỗng và không còn job đang chạy
+        """
+        requeued = self.queue.requeue_running()
+        if requeued:
+            logger.warning(f"Requeued {requeued} job(s) left running by a previous worker")
+
+        _get_model()  # Load model một lần cho mọi job
+        logger.info(f"Ingest worker {self.worker_id} started (concurrency={self.concurrency})")
+
+        active: Dict[Future, IngestJob] = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ingest-job") as executor:
+            while not self._stop.is_set():
+                while len(active) < self.concurrency and not self._stop.is_set():
+                    job = self.queue.claim(self.worker_id)
+                    if job is None:
+                        break
+                    active[executor.submit(self._run_job, job)] = job
+
+                if not active:
+                    if drain:
+                        break
+                    self._stop.wait(self.poll_interval)
+                    continue
+
+                # Có slot trống thì poll hàng đợi định kỳ; đủ slot thì chờ một job xong
+                timeout = self.poll_interval if len(active) < self.concurrency else None
+                done, _ = wait(list(active), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    active.pop(future)
+
+            if active:
+                logger.info(f"Waiting for {len(active)} running job(s) to finish")
+                wait(list(active))
+        logger.info(f"Ingest worker {self.worker_id} stopped")
+
+    def _event(self, job: IngestJob, event: str, **fields: Any) -> None:
+        payload = {"event": event, "queue_id": job.id, "document_id": job.document_id, "job_id": job.job_id}
+        payload.update(fields)
+        try:
+            self.emit(payload)
+        except Exception as exc:  # noqa: BLE001 - lỗi báo progress không làm hỏng job
+            logger.warning(f"Progress callback failed: {exc}")
+
+    def _run_job(self, job: IngestJob) -> None:
+        start = perf_counter()
+        self._event(job, "started", attempt=job.attempts)
+
+        def on_progress(percent: int, processed: int, total: int) -> None:
+            self._event(job, "progress", percent=percent, processed=processed, total=total,
+                        elapsed_s=round(perf_counter() - start, 3))
+
+        def on_event(event: ProgressEvent) -> None:
+            self._event(job, "stage", **event.to_dict())
+
+        try:
+            result = process_document(
+                job.document_id, job.job_id, job.force_refresh, on_progress=on_progress, on_event=on_event
+            )
+        except Exception as exc:  # noqa: BLE001 - ghi nhận lỗi vào hàng đợi, worker tiếp tục
+            will_retry = self.queue.fail(job, str(exc))
+            logger.error(f"Job {job.id} ({job.document_id}) failed: {exc}")
+            self._event(job, "failed", error=str(exc), will_retry=will_retry,
+                        elapsed_s=round(perf_counter() - start, 3))
+            return
+
+        stats = {
+            "added": result.added,
+            "reused": result.reused,
+            "removed": result.removed,
+            "moved": result.moved,
+            "skipped": result.skipped,
+            "total": result.total,
+        }
+        self.queue.complete(job, stats)
+        self._event(job, "completed", elapsed_s=round(perf_counter() - start, 3), **stats)
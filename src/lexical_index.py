@@ -0,0 +1,343 @@
+"""
+Index từ khoá (inverted index, chấm điểm BM25) cục bộ, build lúc ingest.
+
+Mỗi tài liệu là một segment riêng (build lại khi tài liệu được ingest lại, các
+segment khác không đổi), lưu dạng .npz nén trong LEXICAL_INDEX_DIR/<user>/:
+từ điển term + postings dạng CSR (chunk id uint32, tf uint16) + độ dài chunk +
+nội dung chunk. Truy vấn không cần model: tách từ câu hỏi rồi cộng điểm BM25
+trên các segment của user (thống kê N, avgdl, df tính trên toàn bộ segment).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .chunker import TextChunk
+from .config import settings
+from .retriever import RetrievedChunk
+
+logger = logging.getLogger(__name__)
+
+
+_FORMAT_VERSION = 1
+_MAX_CACHED_SEGMENTS = 512  # Segment đã load giữ trong RAM (LRU), tải lại khi file đổi mtime
+_TOKEN_RE = re.compile(r"\w+(?:[.\-/:]\w+)*")
+_SPLIT_RE = re.compile(r"[.\-/:_]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tách từ cho BM25: Unicode NFC, không phân biệt hoa thường, giữ nguyên token
+    ghép như mã lỗi / số mục ("e-1042", "3.2.1", "http_404") và thêm từng phần của chúng.
+    """
+    tokens: List[str] = []
+    for match in _TOKEN_RE.finditer(unicodedata.normalize("NFC", text).casefold()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _SPLIT_RE.split(token) if part)
+    return tokens
+
+
+class LexicalSegment:
+    """Inverted index của một tài liệu (CSR: postings của term i nằm ở offsets[i]:offsets[i+1])."""
+
+    def __init__(
+        self,
+        document_id: str,
+        terms: List[str],
+        offsets: np.ndarray,
+        chunk_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_len: np.ndarray,
+        chunk_index: np.ndarray,
+        page_number: np.ndarray,
+        contents: List[str],
+    ) -> None:
+        self.document_id = document_id
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.chunk_ids = chunk_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.chunk_index = chunk_index
+        self.page_number = page_number  # -1 = không có số trang
+        self.contents = contents
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(chunk ids, tf) của term, None nếu term không có trong tài liệu."""
+        i = self.term_ids.get(term)
+        if i is None:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.chunk_ids[start:end], self.tfs[start:end]
+
+    def save(self, path: Path) -> None:
+        """Ghi segment (nén) bằng file tạm + os.replace để reader không bao giờ đọc file dở."""
+        terms = sorted(self.term_ids, key=self.term_ids.get)
+        encoded = [text.encode("utf-8") for text in self.contents]
+        text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=text_offsets[1:])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with tmp.open("wb") as handle:
+            np.savez_compressed(
+                handle,
+                version=np.array([_FORMAT_VERSION], dtype=np.int32),
+                document_id=np.frombuffer(self.document_id.encode("utf-8"), dtype=np.uint8),
+                vocab=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+                offsets=self.offsets,
+                chunk_ids=self.chunk_ids,
+                tfs=self.tfs,
+                doc_len=self.doc_len,
+                chunk_index=self.chunk_index,
+                page_number=self.page_number,
+                text=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+                text_offsets=text_offsets,
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "LexicalSegment":
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"][0]) != _FORMAT_VERSION:
+                raise ValueError(f"Unsupported lexical segment version in {path}")
+            vocab = data["vocab"].tobytes().decode("utf-8")
+            text = data["text"].tobytes()
+            text_offsets = data["text_offsets"]
+            return cls(
+                document_id=data["document_id"].tobytes().decode("utf-8"),
+                terms=vocab.split("\n") if vocab else [],
+                offsets=data["offsets"],
+                chunk_ids=data["chunk_ids"],
+                tfs=data["tfs"],
+                doc_len=data["doc_len"],
+                chunk_index=data["chunk_index"],
+                page_number=data["page_number"],
+                contents=[
+                    text[text_offsets[i]:text_offsets[i + 1]].decode("utf-8") for i in range(len(text_offsets) - 1)
+                ],
+            )
+
+
+class LexicalSegmentBuilder:
+    """Gom chunk của một tài liệu trong lúc ingest (stage chunk) rồi build LexicalSegment."""
+
+    def __init__(self, document_id: str) -> None:
+        self.document_id = document_id
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._doc_len: List[int] = []
+        self._chunk_index: List[int] = []
+        self._page_number: List[int] = []
+        self._contents: List[str] = []
+
+    def add(self, chunk: TextChunk) -> None:
+        position = len(self._contents)
+        counts = Counter(tokenize(chunk.text))
+        for term, tf in counts.items():
+            self._postings[term].append((position, tf))
+        self._doc_len.append(sum(counts.values()))
+        self._chunk_index.append(chunk.chunk_index)
+        self._page_number.append(chunk.page_number if chunk.page_number is not None else -1)
+        self._contents.append(chunk.text)
+
+    def build(self) -> LexicalSegment:
+        terms = sorted(self._postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(self._postings[term]) for term in terms], out=offsets[1:])
+        pairs = [pair for term in terms for pair in self._postings[term]]
+        return LexicalSegment(
+            document_id=self.document_id,
+            terms=terms,
+            offsets=offsets,
+            chunk_ids=np.fromiter((p for p, _ in pairs), dtype=np.uint32, count=len(pairs)),
+            tfs=np.fromiter((min(tf, 65535) for _, tf in pairs), dtype=np.uint16, count=len(pairs)),
+            doc_len=np.asarray(self._doc_len, dtype=np.uint32),
+            chunk_index=np.asarray(self._chunk_index, dtype=np.int32),
+            page_number=np.asarray(self._page_number, dtype=np.int32),
+            contents=list(self._contents),
+        )
+
+
+def _checked_document_id(document_id: str) -> str:
+    """document_id nằm trong tên file / pattern glob: chỉ chấp nhận UUID."""
+    try:
+        uuid.UUID(document_id)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"document_id phải là UUID hợp lệ: {document_id!r}") from exc
+    return document_id
+
+
+class LexicalIndex:
+    """Tập segment BM25 theo user trên đĩa, segment đã load được cache trong RAM (an toàn đa luồng)."""
+
+    def __init__(self, root: Path, k1: float = 1.2, b: float = 0.75) -> None:
+        self.root = root
+        self.k1 = k1
+        self.b = b
+        self._cache: OrderedDict[Path, Tuple[int, LexicalSegment]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _user_dir(self, user_id: str) -> Path:
+        return self.root / hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+
+    def _segment_path(self, user_id: str, document_id: str) -> Path:
+        return self._user_dir(user_id) / f"{_checked_document_id(document_id)}.npz"
+
+    def has_document(self, user_id: str, document_id: str) -> bool:
+        return self._segment_path(user_id, document_id).exists()
+
+    def write_document(self, user_id: str, document_id: str, segment: LexicalSegment) -> None:
+        """Thay segment của tài liệu (các tài liệu khác của user không bị build lại)."""
+        segment.save(self._segment_path(user_id, document_id))
+
+    def remove_document(self, user_id: Optional[str], document_id: str) -> None:
+        """Xoá segment của tài liệu; user_id=None (không còn biết chủ tài liệu) thì tìm trong mọi user."""
+        if user_id:
+            paths: Iterable[Path] = [self._segment_path(user_id, document_id)]
+        else:
+            paths = list(self.root.glob(f"*/{_checked_document_id(document_id)}.npz"))
+        for path in paths:
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self._cache.pop(path, None)
+
+    def _segment(self, path: Path) -> Optional[LexicalSegment]:
+        """Segment từ cache, tải lại nếu file đã đổi; None nếu file không còn hoặc hỏng."""
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == mtime:
+                self._cache.move_to_end(path)
+                return cached[1]
+        try:
+            segment = LexicalSegment.load(path)
+        except Exception as exc:  # noqa: BLE001 - segment hỏng chỉ làm mất kết quả từ khoá của tài liệu đó
+            logger.warning(f"Cannot load lexical segment {path}: {exc}")
+            return None
+        with self._lock:
+            self._cache[path] = (mtime, segment)
+            self._cache.move_to_end(path)
+            while len(self._cache) > _MAX_CACHED_SEGMENTS:
+                self._cache.popitem(last=False)
+        return segment
+
+    def _segments(self, user_id: str, document_id: Optional[str]) -> List[LexicalSegment]:
+        if document_id:
+            paths: Iterable[Path] = [self._segment_path(user_id, document_id)]
+        else:
+            paths = sorted(self._user_dir(user_id).glob("*.npz"))
+        return [segment for segment in map(self._segment, paths) if segment is not None and len(segment)]
+
+    def search(
+        self, query: str, user_id: str, top_k: int = 5, document_id: Optional[str] = None
+    ) -> List[RetrievedChunk]:
+        """Top-k chunk theo BM25 trong các tài liệu của user (hoặc chỉ document_id)."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        segments = self._segments(user_id, document_id)
+        if not terms or not segments:
+            return []
+
+        n_chunks = sum(len(segment) for segment in segments)
+        avgdl = max(sum(float(segment.doc_len.sum()) for segment in segments) / n_chunks, 1.0)
+        postings = [[segment.postings(term) for term in terms] for segment in segments]
+        df = [sum(len(p[t][0]) for p in postings if p[t] is not None) for t in range(len(terms))]
+        idf = [math.log(1 + (n_chunks - d + 0.5) / (d + 0.5)) for d in df]
+
+        best: List[Tuple[float, int, int]] = []  # (score, segment, chunk) của từng segment, gộp bằng nlargest
+        for s, segment in enumerate(segments):
+            scores = np.zeros(len(segment), dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * segment.doc_len.astype(np.float32) / avgdl)
+            for t, found in enumerate(postings[s]):
+                if found is None:
+                    continue
+                ids, tfs = found
+                tf = tfs.astype(np.float32)
+                scores[ids] += idf[t] * tf * (self.k1 + 1) / (tf + norm[ids])
+            hit = np.flatnonzero(scores)
+            if len(hit) > top_k:
+                hit = hit[np.argpartition(scores[hit], -top_k)[-top_k:]]
+            best.extend((float(scores[i]), s, int(i)) for i in hit)
+
+        chunks: List[RetrievedChunk] = []
+        for score, s, i in heapq.nlargest(top_k, best):
+            segment = segments[s]
+            page = int(segment.page_number[i])
+            chunks.append(
+                RetrievedChunk(
+                    content=segment.contents[i],
+                    chunk_index=int(segment.chunk_index[i]),
+                    page_number=page if page >= 0 else None,
+                    similarity=0.0,  # BM25 không cùng thang với cosine; điểm nằm ở metadata
+                    metadata={
+                        "document_id": segment.document_id,
+                        "source": "internal",
+                        "retrieval": "bm25",
+                        "bm25_score": round(score, 4),
+                    },
+                )
+            )
+        return chunks
+
+
+def fuse_rankings(
+    dense: List[RetrievedChunk], lexical: List[RetrievedChunk], limit: int, k: int = 60
+) -> List[RetrievedChunk]:
+    """
+    Reciprocal Rank Fusion của kết quả dense và BM25, xếp theo điểm RRF và cắt còn limit chunk.
+
+    Chunk trùng được gộp theo nội dung (kết quả RPC dense không có
+    document_id). similarity giữ nguyên cosine thật của dense; chunk chỉ có
+    từ BM25 có similarity = 0 và metadata retrieval = "bm25". Điểm BM25 và RRF
+    (fusion_score) nằm ở metadata.
+    """
+    if not lexical:
+        return dense[:limit]
+
+    fused: Dict[str, Tuple[float, RetrievedChunk, Dict]] = {}
+    for ranking in (dense, lexical):
+        for rank, chunk in enumerate(ranking):
+            key = hashlib.sha1(chunk.content.encode("utf-8")).hexdigest()
+            score, kept, extra = fused.get(key, (0.0, chunk, {}))
+            if ranking is lexical:
+                extra["bm25_score"] = (chunk.metadata or {}).get("bm25_score")
+                extra.setdefault("document_id", (chunk.metadata or {}).get("document_id"))
+            fused[key] = (score + 1.0 / (k + rank + 1), kept, extra)
+
+    ordered = sorted(fused.values(), key=lambda item: item[0], reverse=True)[:limit]
+    results: List[RetrievedChunk] = []
+    for score, chunk, extra in ordered:
+        metadata = {**(chunk.metadata or {}), **extra, "fusion_score": round(score, 5)}
+        metadata.setdefault("source", "internal")
+        results.append(
+            RetrievedChunk(
+                content=chunk.content,
+                chunk_index=chunk.chunk_index,
+                page_number=chunk.page_number,
+                similarity=chunk.similarity,
+                metadata=metadata,
+            )
+        )
+    return results
+
+
+lexical_index = LexicalIndex(settings.lexical_index_dir, k1=settings.bm25_k1, b=settings.bm25_b)
@@ -1,14 +1,35 @@
 from __future__ import annotations
 
+import asyncio
+import json
+import threading
 from dataclasses import dataclass
-from typing import Any
+from time import perf_counter
+from typing import Any, AsyncIterator, Iterator
 
-import requests
+import httpx
 
 from .config import settings
-from .retry_utils import retry_with_backoff
+from .retry_utils import async_retry_with_backoff, retry_with_backoff
 
-"""Gọi Ollama local để sinh câu trả lời dựa trên prompt đã chuẩn bị."""
+"""
+Gọi Ollama local để sinh câu trả lời dựa trên prompt đã chuẩn bị.
+
+Mọi request đi qua OllamaClient dùng chung (ollama_client): connection pool
+keep-alive cho cả giao diện sync (httpx.Client) và async (httpx.AsyncClient),
+timeout kết nối / đọc / tổng cấu hình qua OLLAMA_*_TIMEOUT. Chỉ lỗi khi Ollama
+chưa nhận request (không kết nối được, kết nối keep-alive đã bị đóng) được retry
+với backoff (3 lần, 2s → 4s → 8s); timeout đọc không retry vì Ollama có thể vẫn
+đang sinh câu trả lời. Mọi lời gọi, kể cả các lần retry, nằm trong OLLAMA_TOTAL_TIMEOUT.
+"""
+
+# Retry khi request chưa tới được Ollama; timeout đọc và mã lỗi HTTP không retry
+_RETRY_POLICY = dict(
+    max_retries=3,
+    initial_delay=2.0,
+    backoff_factor=2.0,
+    exceptions=(httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError),
+)
 
 
 @dataclass(slots=True)
@@ -24,14 +45,8 @@ class LLMClientError(RuntimeError):
     """Báo lỗi khi gọi Ollama thất bại."""
 
 
-@retry_with_backoff(
-    max_retries=3,
-    initial_delay=2.0,
-    backoff_factor=2.0,
-    exceptions=(requests.RequestException, requests.Timeout)
-)
-def generate_answer(prompt: str, model: str | None = None, timeout: int = 120) -> LLMResponse:
-    """Gọi Ollama generate API và trả về câu trả lời."""
+def _generate_payload(prompt: str, model: str | None, stream: bool) -> dict[str, Any]:
+    """Kiểm tra input, trả về payload cho Ollama generate API."""
     if not prompt.strip():
         raise ValueError("Prompt không được để trống")
 
@@ -39,25 +54,316 @@ def generate_answer(prompt: str, model: str | None = None, timeout: int = 120) -
     if not target_model:
         raise ValueError("Chưa cấu hình OLLAMA_MODEL")
 
-    url = settings.ollama_url.rstrip("/") + "/api/generate"
-    payload = {
-        "model": target_model,
-        "prompt": prompt,
-        "stream": False,
-    }
+    return {"model": target_model, "prompt": prompt, "stream": stream}
 
-    try:
-        response = requests.post(url, json=payload, timeout=timeout)
-    except requests.RequestException as exc:  # noqa: BLE001 - wrap lỗi request
-        raise LLMClientError(f"Không thể kết nối tới Ollama tại {url}: {exc}") from exc
 
+def _parse_response(response: httpx.Response, model: str) -> LLMResponse:
     if response.status_code != 200:
-        text = response.text[:500]
-        raise LLMClientError(f"Ollama trả về mã lỗi {response.status_code}: {text}")
+        raise LLMClientError(f"Ollama trả về mã lỗi {response.status_code}: {response.text[:500]}")
 
     data = response.json()
     answer = data.get("response")
     if not isinstance(answer, str):
         raise LLMClientError("Phản hồi từ Ollama không hợp lệ: thiếu trường 'response'")
 
-    return LLMResponse(answer=answer.strip(), model=target_model, raw=data)
+    return LLMResponse(answer=answer.strip(), model=model, raw=data)
+
+
+class _StreamState:
+    """Phần chung của LLMStream / AsyncLLMStream: parse từng dòng NDJSON của Ollama."""
+
+    def __init__(self, model: str, started: float, deadline: float | None) -> None:
+        self.model = model
+        self.raw: dict[str, Any] = {}
+        self.first_token_ms: float | None = None
+        self._started = started
+        self._deadline = deadline
+        self._parts: list[str] = []
+        self._done = False
+
+    @property
+    def answer(self) -> str:
+        return "".join(self._parts).strip()
+
+    def _consume(self, line: str) -> str:
+        """Xử lý một dòng, trả về đoạn text mới ("" nếu không có)."""
+        if self._deadline is not None and perf_counter() > self._deadline:
+            raise LLMClientError(f"Ollama vượt quá OLLAMA_TOTAL_TIMEOUT ({settings.ollama_total_timeout:g}s)")
+        if not line:
+            return ""
+        try:
+            data = json.loads(line)
+        except ValueError as exc:
+            raise LLMClientError(f"Phản hồi streaming từ Ollama không hợp lệ: {line[:200]!r}") from exc
+        if "error" in data:
+            raise LLMClientError(f"Ollama báo lỗi khi sinh câu trả lời: {data['error']}")
+
+        token = data.get("response") or ""
+        if token:
+            if self.first_token_ms is None:
+                self.first_token_ms = (perf_counter() - self._started) * 1000
+            self._parts.append(token)
+        if data.get("done"):
+            self.raw = data
+            self._done = True
+        return token
+
+    def _check_done(self) -> None:
+        if not self._done:
+            raise LLMClientError("Ollama đóng stream trước khi trả về done")
+
+
+class LLMStream(_StreamState):
+    """
+    Câu trả lời streaming từ Ollama: lặp để nhận từng đoạn text ngay khi model sinh ra.
+
+    Sau khi lặp xong: answer là toàn bộ câu trả lời, raw là dòng cuối (done=true,
+    chứa total_duration, eval_count...), first_token_ms là thời gian từ lúc gửi
+    request tới đoạn text đầu tiên.
+    """
+
+    def __init__(self, response: httpx.Response, model: str, started: float, deadline: float | None) -> None:
+        super().__init__(model, started, deadline)
+        self._response = response
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            for line in self._response.iter_lines():
+                token = self._consume(line)
+                if token:
+                    yield token
+                if self._done:
+                    return
+        except httpx.HTTPError as exc:  # noqa: BLE001 - wrap lỗi đứt kết nối giữa chừng
+            raise LLMClientError(f"Mất kết nối tới Ollama khi đang stream: {exc}") from exc
+        finally:
+            self._response.close()  # Trả kết nối về pool
+        self._check_done()
+
+    def close(self) -> None:
+        """Đóng response nếu client ngừng đọc giữa chừng."""
+        self._response.close()
+
+
+class AsyncLLMStream(_StreamState):
+    """Như LLMStream nhưng lặp bằng `async for`."""
+
+    def __init__(self, response: httpx.Response, model: str, started: float, deadline: float | None) -> None:
+        super().__init__(model, started, deadline)
+        self._response = response
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        try:
+            async for line in self._response.aiter_lines():
+                token = self._consume(line)
+                if token:
+                    yield token
+                if self._done:
+                    return
+        except httpx.HTTPError as exc:  # noqa: BLE001 - wrap lỗi đứt kết nối giữa chừng
+            raise LLMClientError(f"Mất kết nối tới Ollama khi đang stream: {exc}") from exc
+        finally:
+            await self._response.aclose()
+        self._check_done()
+
+    async def aclose(self) -> None:
+        await self._response.aclose()
+
+
+class OllamaClient:
+    """
+    Client Ollama với connection pool keep-alive, dùng được từ thread và từ event loop.
+
+    httpx.Client (sync) được tạo một lần; httpx.AsyncClient gắn với event loop
+    nên được tạo lại nếu gọi từ loop khác (vd. nhiều lần asyncio.run trong script).
+    """
+
+    def __init__(
+        self,
+        base_url: str | None = None,
+        connect_timeout: float | None = None,
+        read_timeout: float | None = None,
+        total_timeout: float | None = None,
+        max_connections: int | None = None,
+        keepalive_expiry: float | None = None,
+    ) -> None:
+        self.base_url = base_url
+        self.connect_timeout = settings.ollama_connect_timeout if connect_timeout is None else connect_timeout
+        self.read_timeout = settings.ollama_read_timeout if read_timeout is None else read_timeout
+        self.total_timeout = settings.ollama_total_timeout if total_timeout is None else total_timeout
+        max_connections = max_connections or settings.ollama_max_connections
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=settings.ollama_keepalive_seconds if keepalive_expiry is None else keepalive_expiry,
+        )
+        self._lock = threading.Lock()
+        self._sync: httpx.Client | None = None
+        self._async: httpx.AsyncClient | None = None
+        self._async_loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def url(self) -> str:
+        return (self.base_url or settings.ollama_url).rstrip("/") + "/api/generate"
+
+    def _timeout(self, read_timeout: float | None, deadline: float | None = None) -> httpx.Timeout:
+        """Timeout của một lần gửi; không vượt quá thời gian còn lại tới deadline."""
+        read = read_timeout or self.read_timeout
+        connect = self.connect_timeout
+        if deadline is not None:
+            remaining = max(deadline - perf_counter(), 0.001)
+            read, connect = min(read, remaining), min(connect, remaining)
+        # pool: chờ slot trong pool khi đã đủ max_connections request đang chạy
+        return httpx.Timeout(connect=connect, read=read, write=connect, pool=read)
+
+    def _deadline(self, started: float) -> float | None:
+        return started + self.total_timeout if self.total_timeout else None
+
+    def _retrying(self, func):
+        """func kèm retry theo _RETRY_POLICY, không bắt đầu lần thử mới sau OLLAMA_TOTAL_TIMEOUT."""
+        return retry_with_backoff(**_RETRY_POLICY, max_elapsed=self.total_timeout or None)(func)
+
+    def _aretrying(self, func):
+        return async_retry_with_backoff(**_RETRY_POLICY, max_elapsed=self.total_timeout or None)(func)
+
+    def _transport_error(self, exc: httpx.HTTPError, deadline: float | None) -> LLMClientError:
+        if deadline is not None and perf_counter() >= deadline:
+            return LLMClientError(f"Ollama vượt quá OLLAMA_TOTAL_TIMEOUT ({self.total_timeout:g}s)")
+        return LLMClientError(f"Không thể kết nối tới Ollama tại {self.url}: {exc}")
+
+    def _client(self) -> httpx.Client:
+        if self._sync is None:
+            with self._lock:
+                if self._sync is None:
+                    self._sync = httpx.Client(limits=self._limits)
+        return self._sync
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async is None or self._async_loop is not loop:
+            # Client của loop cũ (đã đóng) không dùng lại được; kết nối của nó bị bỏ
+            self._async = httpx.AsyncClient(limits=self._limits)
+            self._async_loop = loop
+        return self._async
+
+    # --- Sync ---
+
+    def _post(self, payload: dict[str, Any], read_timeout: float | None, deadline: float | None) -> httpx.Response:
+        return self._client().post(self.url, json=payload, timeout=self._timeout(read_timeout, deadline))
+
+    def _open_stream(
+        self, payload: dict[str, Any], read_timeout: float | None, deadline: float | None
+    ) -> httpx.Response:
+        client = self._client()
+        request = client.build_request("POST", self.url, json=payload, timeout=self._timeout(read_timeout, deadline))
+        return client.send(request, stream=True)
+
+    def generate(self, prompt: str, model: str | None = None, timeout: float | None = None) -> LLMResponse:
+        """Sinh câu trả lời (stream=False). timeout ghi đè OLLAMA_READ_TIMEOUT; cả lời gọi nằm trong total timeout."""
+        payload = _generate_payload(prompt, model, stream=False)
+        deadline = self._deadline(perf_counter())
+        try:
+            response = self._retrying(self._post)(payload, timeout, deadline)
+        except httpx.HTTPError as exc:  # noqa: BLE001 - wrap lỗi request
+            raise self._transport_error(exc, deadline) from exc
+        return _parse_response(response, payload["model"])
+
+    def stream(self, prompt: str, model: str | None = None, timeout: float | None = None) -> LLMStream:
+        """Mở stream câu trả lời; chỉ bước mở kết nối được retry."""
+        payload = _generate_payload(prompt, model, stream=True)
+        started = perf_counter()
+        deadline = self._deadline(started)
+        try:
+            response = self._retrying(self._open_stream)(payload, timeout, deadline)
+        except httpx.HTTPError as exc:  # noqa: BLE001 - wrap lỗi request
+            raise self._transport_error(exc, deadline) from exc
+
+        if response.status_code != 200:
+            text = response.read()[:500].decode("utf-8", "replace")
+            response.close()
+            raise LLMClientError(f"Ollama trả về mã lỗi {response.status_code}: {text}")
+        return LLMStream(response, payload["model"], started, deadline)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._sync is not None:
+                self._sync.close()
+                self._sync = None
+
+    # --- Async ---
+
+    async def _apost(
+        self, payload: dict[str, Any], read_timeout: float | None, deadline: float | None
+    ) -> httpx.Response:
+        return await self._async_client().post(self.url, json=payload, timeout=self._timeout(read_timeout, deadline))
+
+    async def _aopen_stream(
+        self, payload: dict[str, Any], read_timeout: float | None, deadline: float | None
+    ) -> httpx.Response:
+        client = self._async_client()
+        request = client.build_request("POST", self.url, json=payload, timeout=self._timeout(read_timeout, deadline))
+        return await client.send(request, stream=True)
+
+    async def agenerate(self, prompt: str, model: str | None = None, timeout: float | None = None) -> LLMResponse:
+        """Như generate nhưng không chặn event loop; toàn bộ lời gọi (kể cả retry) bị giới hạn bởi total timeout."""
+        payload = _generate_payload(prompt, model, stream=False)
+        deadline = self._deadline(perf_counter())
+        try:
+            response = await asyncio.wait_for(
+                self._aretrying(self._apost)(payload, timeout, deadline), self.total_timeout or None
+            )
+        except asyncio.TimeoutError as exc:
+            raise LLMClientError(f"Ollama vượt quá OLLAMA_TOTAL_TIMEOUT ({self.total_timeout:g}s)") from exc
+        except httpx.HTTPError as exc:  # noqa: BLE001 - wrap lỗi request
+            raise self._transport_error(exc, deadline) from exc
+        return _parse_response(response, payload["model"])
+
+    async def astream(self, prompt: str, model: str | None = None, timeout: float | None = None) -> AsyncLLMStream:
+        """Như stream nhưng dùng `async for`."""
+        payload = _generate_payload(prompt, model, stream=True)
+        started = perf_counter()
+        deadline = self._deadline(started)
+        try:
+            response = await self._aretrying(self._aopen_stream)(payload, timeout, deadline)
+        except httpx.HTTPError as exc:  # noqa: BLE001 - wrap lỗi request
+            raise self._transport_error(exc, deadline) from exc
+
+        if response.status_code != 200:
+            text = (await response.aread())[:500].decode("utf-8", "replace")
+            await response.aclose()
+            raise LLMClientError(f"Ollama trả về mã lỗi {response.status_code}: {text}")
+        return AsyncLLMStream(response, payload["model"], started, deadline)
+
+    async def aclose(self) -> None:
+        if self._async is not None and self._async_loop is asyncio.get_running_loop():
+            await self._async.aclose()
+        self._async = self._async_loop = None
+
+
+# Client dùng chung trong process
+ollama_client = OllamaClient()
+
+
+def generate_answer(prompt: str, model: str | None = None, timeout: float | None = None) -> LLMResponse:
+    """Gọi Ollama generate API và trả về câu trả lời."""
+    return ollama_client.generate(prompt, model, timeout)
+
+
+def stream_answer(prompt: str, model: str | None = None, timeout: float | None = None) -> LLMStream:
+    """
+    Gọi Ollama generate API ở chế độ stream.
+
+    Chỉ bước mở kết nối được retry; timeout đọc áp dụng cho từng lần đọc nên câu
+    trả lời dài không bị cắt miễn là token vẫn tiếp tục tới (trong OLLAMA_TOTAL_TIMEOUT).
+    """
+    return ollama_client.stream(prompt, model, timeout)
+
+
+async def agenerate_answer(prompt: str, model: str | None = None, timeout: float | None = None) -> LLMResponse:
+    """generate_answer cho async handler (không chặn event loop)."""
+    return await ollama_client.agenerate(prompt, model, timeout)
+
+
+async def astream_answer(prompt: str, model: str | None = None, timeout: float | None = None) -> AsyncLLMStream:
+    """stream_answer cho async handler."""
+    return await ollama_client.astream(prompt, model, timeout)
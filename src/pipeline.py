@@ -1,48 +1,457 @@
 from __future__ import annotations
 
+import hashlib
+import logging
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
 
-from .chunker import split_chunks, TextChunk
-from .embedder import embed_chunks, EmbeddingResult
+from .ann_index import invalidate_user_index
+from .answer_cache import answer_cache
+from .batch_writer import BatchWriter
+from .chunker import chunk_content_hash, split_chunks, TextChunk
+from .embedder import embed_chunks, EmbeddingBatch
 from .config import settings
+from .corpus_epoch import bump_corpus_epoch
+from .lexical_index import LexicalSegmentBuilder, lexical_index
 from .supabase_client import (
+    delete_embeddings_by_ids,
     delete_existing_embeddings,
     download_file,
     fetch_document_metadata,
-    insert_embeddings,
+    fetch_existing_chunks,
+    fetch_ingest_fingerprint,
+    insert_embedding_batch,
+    save_ingest_fingerprint,
+    update_chunk_positions,
     upsert_embedding_status,
 )
-from .text_extractor import extract_pdf_text
+from .progress import ProgressCallback, ProgressEventCallback, ProgressTracker, StageProgress, stdout_events, stdout_progress
+from .stages import StageRunner
+from .text_extractor import DocumentChunk, extract_pdf_text
+from .vector_codec import encode_vectors
 
+logger = logging.getLogger(__name__)
 
 """Chuỗi tác vụ ingest tài liệu: tải, tách đoạn, sinh embedding và lưu Supabase."""
 
+# Ước lượng bộ nhớ (bytes) cho từng loại item trong hàng đợi, dùng để chia memory budget
+_PAGE_BYTES = 16 * 1024
+_CHUNK_BYTES_PER_CHAR = 4
+_RECORD_BYTES = 32 * 1024  # dict + list 768 float Python
 
-def _load_document(document_path: Path) -> Iterable[TextChunk]:
-    """Đọc file PDF đã tải và trả về danh sách TextChunk."""
-    document_chunks = extract_pdf_text(document_path)
-    return split_chunks(document_chunks)
-
-
-def _prepare_records(document_id: str, embeddings: List[EmbeddingResult]) -> List[dict[str, object]]:
-    """Chuyển danh sách embedding thành payload ghi vào bảng document_embeddings."""
-    records: List[dict[str, object]] = []
-    for item in embeddings:
-        records.append(
-            {
-                "document_id": document_id,
-                "content": item.chunk.text,
-                "page_number": item.chunk.page_number,
-                "chunk_index": item.chunk.chunk_index,
-                "embedding": item.vector.tolist(),
-            }
+
+@dataclass(frozen=True)
+class IngestParams:
+    """Cấu hình batch từng stage và memory budget cho ingest streaming."""
+
+    embed_batch_size: int = settings.ingest_embed_batch_size
+    insert_batch_size: int = settings.ingest_insert_batch_size
+    insert_max_in_flight: int = settings.insert_max_in_flight
+    memory_budget_mb: int = settings.ingest_memory_budget_mb
+
+    def queue_depths(self) -> tuple[int, int, int]:
+        """Chia memory budget thành độ sâu hàng đợi (pages, chunk batches, record batches)."""
+        budget = self.memory_budget_mb * 1024 * 1024
+        pages = int(budget * 0.1 // _PAGE_BYTES)
+        chunks = int(budget * 0.3 // (self.embed_batch_size * settings.chunk_size * _CHUNK_BYTES_PER_CHAR))
+        records = int(budget * 0.6 // (self.embed_batch_size * _RECORD_BYTES))
+        return max(pages, 1), max(chunks, 1), max(records, 1)
+
+
+@dataclass
+class IngestResult:
+    """Thống kê một lần ingest: số chunk thêm mới, tái sử dụng, xoá và đổi vị trí."""
+
+    added: int = 0
+    reused: int = 0
+    removed: int = 0
+    moved: int = 0  # Chunk tái sử dụng nhưng chunk_index/page_number thay đổi
+    skipped: bool = False  # File và tham số ingest không đổi → bỏ qua toàn bộ
+
+    @property
+    def total(self) -> int:
+        """Tổng số chunk của tài liệu sau ingest."""
+        return self.added + self.reused
+
+
+class EmbeddingSink:
+    """Nơi đọc/ghi embedding của tài liệu (mặc định: bảng document_embeddings trên Supabase)."""
+
+    def fetch_existing(self, document_id: str) -> List[Dict[str, Any]]:
+        """Các chunk đã lưu của tài liệu (id, content, chunk_index, page_number)."""
+        return fetch_existing_chunks(document_id)
+
+    def fetch_ids(self, document_id: str) -> List[Any]:
+        """Id các chunk đã lưu của tài liệu."""
+        return [row["id"] for row in fetch_existing_chunks(document_id, columns="id")]
+
+    def insert_batch(self, rows: List[dict[str, object]]) -> None:
+        """Ghi MỘT batch record embedding (một request, không retry)."""
+        insert_embedding_batch(rows)
+
+    def open_writer(self, params: IngestParams | None = None, progress: StageProgress | None = None) -> BatchWriter:
+        """BatchWriter ghi qua insert_batch: batch theo byte, song song có giới hạn, retry từng batch."""
+        params = params or IngestParams()
+        return BatchWriter(
+            self.insert_batch,
+            max_in_flight=params.insert_max_in_flight,
+            max_batch_bytes=settings.insert_batch_max_kb * 1024,
+            max_batch_rows=params.insert_batch_size,
+            on_batch=progress.advance if progress is not None else None,
+        )
+
+    def insert(self, rows: List[dict[str, object]], progress: StageProgress | None = None) -> None:
+        """Ghi toàn bộ record embedding."""
+        self.open_writer(progress=progress).write(rows)
+
+    def delete_document(self, document_id: str) -> None:
+        """Xoá toàn bộ embedding của tài liệu."""
+        delete_existing_embeddings(document_id)
+
+    def delete_ids(self, ids: List[Any]) -> None:
+        """Xoá các chunk theo id."""
+        delete_embeddings_by_ids(ids)
+
+    def update_positions(self, document_id: str, updates: List[Dict[str, Any]]) -> None:
+        """Cập nhật chunk_index/page_number của các chunk tái sử dụng (theo batch)."""
+        update_chunk_positions(document_id, updates)
+
+
+class _ChunkDiff:
+    """So khớp chunk mới với chunk đã lưu theo hash nội dung để tái sử dụng embedding."""
+
+    def __init__(self, existing_rows: List[Dict[str, Any]]) -> None:
+        self._by_hash: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for row in existing_rows:
+            self._by_hash[chunk_content_hash(row.get("content") or "")].append(row)
+        self.updates: List[Dict[str, Any]] = []
+
+    def claim(self, chunk: TextChunk) -> Optional[Dict[str, Any]]:
+        """Lấy một row đã lưu có cùng nội dung (ưu tiên cùng chunk_index); ghi nhận nếu đổi vị trí."""
+        candidates = self._by_hash.get(chunk.content_hash())
+        if not candidates:
+            return None
+        row = next((r for r in candidates if r.get("chunk_index") == chunk.chunk_index), candidates[0])
+        candidates.remove(row)
+        if row.get("chunk_index") != chunk.chunk_index or row.get("page_number") != chunk.page_number:
+            self.updates.append(
+                {"id": row["id"], "chunk_index": chunk.chunk_index, "page_number": chunk.page_number}
+            )
+        return row
+
+    def stale_ids(self) -> List[Any]:
+        """Id các row đã lưu không còn khớp chunk nào (cần xoá)."""
+        return [row["id"] for rows in self._by_hash.values() for row in rows]
+
+
+def _finish_incremental(document_id: str, diff: _ChunkDiff, sink: EmbeddingSink, result: IngestResult) -> None:
+    """Sau khi ghi chunk mới: cập nhật vị trí chunk tái sử dụng và xoá chunk cũ."""
+    if diff.updates:
+        sink.update_positions(document_id, diff.updates)
+    stale_ids = diff.stale_ids()
+    if stale_ids:
+        sink.delete_ids(stale_ids)
+    result.moved = len(diff.updates)
+    result.removed = len(stale_ids)
+
+
+def _replace_all(document_id: str, sink: EmbeddingSink, write: Callable[[], None]) -> int:
+    """
+    Thay toàn bộ embedding của tài liệu: write() ghi row mới trước, row cũ chỉ bị
+    xoá (theo id) sau khi ghi xong. Lỗi giữa chừng → xoá các row vừa ghi, tài
+    liệu giữ nguyên embedding cũ. Trả về số row cũ đã xoá.
+
+    Trong lúc ghi, retrieval có thể thấy cả chunk cũ lẫn chunk mới của tài liệu.
+    """
+    old_ids = sink.fetch_ids(document_id)
+    try:
+        write()
+    except BaseException:
+        _discard_new_rows(document_id, sink, set(old_ids))
+        raise
+    if old_ids:
+        sink.delete_ids(old_ids)
+    return len(old_ids)
+
+
+def _discard_new_rows(document_id: str, sink: EmbeddingSink, old_ids: set) -> None:
+    """Xoá các row ghi dở của lần ingest lỗi (mọi row không thuộc old_ids); lỗi chỉ được log."""
+    try:
+        new_ids = [row_id for row_id in sink.fetch_ids(document_id) if row_id not in old_ids]
+        if new_ids:
+            sink.delete_ids(new_ids)
+    except Exception as exc:  # noqa: BLE001 - không che lỗi gốc của ingest
+        logger.error(f"Could not remove partially written embeddings of {document_id}: {exc}")
+
+
+def _ingest_fingerprint(file_path: Path) -> Dict[str, Any]:
+    """Checksum nội dung file cùng model và tham số chunk đã dùng để ingest."""
+    digest = hashlib.sha256()
+    with file_path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    fingerprint = {
+        "checksum": digest.hexdigest(),
+        "model": settings.hf_model_name,
+        "chunk_size": settings.chunk_size,
+        "chunk_overlap": settings.chunk_overlap,
+    }
+    if settings.chunk_tokens:  # Chỉ thêm khi bật để fingerprint cũ (chia theo ký tự) vẫn khớp
+        fingerprint["chunk_tokens"] = settings.chunk_tokens
+        fingerprint["chunk_token_overlap"] = settings.chunk_token_overlap
+    return fingerprint
+
+
+def _same_input(previous: Optional[Dict[str, Any]], fingerprint: Dict[str, Any]) -> bool:
+    """So fingerprint đã lưu với file hiện tại, bỏ qua số chunk (fingerprint cũ không có trường này)."""
+    if previous is None:
+        return False
+    return {key: value for key, value in previous.items() if key != "chunks"} == fingerprint
+
+
+def _stored_chunk_count(document_id: str, previous: Dict[str, Any]) -> int:
+    """Số chunk đang lưu của tài liệu: lấy từ fingerprint, hoặc đếm row nếu fingerprint cũ không có."""
+    count = previous.get("chunks")
+    if count is None:
+        count = len(fetch_existing_chunks(document_id, columns="id"))
+    return count
+
+
+def _save_lexical_segment(document_id: str, metadata: Dict[str, Any], lexical: LexicalSegmentBuilder | None) -> None:
+    """Ghi segment BM25 của tài liệu; lỗi chỉ được log (index từ khoá là phần phụ của retrieval)."""
+    owner = metadata.get("created_by")
+    if lexical is None or not owner:
+        return
+    try:
+        lexical_index.write_document(owner, document_id, lexical.build())
+    except Exception as exc:  # noqa: BLE001 - không làm hỏng ingest đã ghi embedding xong
+        logger.warning(f"Could not write lexical index for {document_id}: {exc}")
+
+
+def _remove_lexical_segment(document_id: str, owner: str | None) -> None:
+    """Xoá segment BM25 để index từ khoá không trả về nội dung không còn (hoặc chưa chắc còn) trên Supabase."""
+    try:
+        lexical_index.remove_document(owner, document_id)
+    except (OSError, ValueError) as exc:
+        logger.warning(f"Could not remove lexical index for {document_id}: {exc}")
+
+
+def _invalidate_user_caches(metadata: Dict[str, Any]) -> None:
+    """
+    Embedding của tài liệu đã đổi → bỏ câu trả lời đã cache và index HNSW của chủ tài liệu.
+
+    Bump epoch corpus của user, nên RAG server ở process khác cũng bỏ câu trả
+    lời cũ và build lại index HNSW ở request sau.
+    """
+    owner = metadata.get("created_by")
+    if owner:
+        if not bump_corpus_epoch(owner):
+            logger.warning(f"Could not bump corpus epoch for {owner}: other processes keep cached answers until TTL")
+        answer_cache.invalidate_user(owner)
+        invalidate_user_index(owner)
+
+
+def _tracked_pages(file_path: Path, progress: StageProgress) -> Iterator[DocumentChunk]:
+    """extract_pdf_text kèm đếm số trang đã đọc (kể cả trang rỗng bị bỏ qua) và số byte văn bản."""
+    scanned = 0
+    for page in extract_pdf_text(file_path, on_page_count=progress.set_total):
+        progress.advance(page.page_number - scanned, len(page.text.encode("utf-8")))
+        scanned = page.page_number
+        yield page
+    if progress.total:
+        progress.advance(progress.total - scanned)
+    progress.finish()
+
+
+def _tracked_chunks(
+    chunks: Iterable[TextChunk], progress: StageProgress, lexical: LexicalSegmentBuilder | None = None
+) -> Iterator[TextChunk]:
+    """Đếm chunk (và byte văn bản) khi đi qua stage chunk; đưa mọi chunk (kể cả chunk tái sử dụng) vào index từ khoá."""
+    for text_chunk in chunks:
+        progress.advance(1, len(text_chunk.text.encode("utf-8")))
+        if lexical is not None:
+            lexical.add(text_chunk)
+        yield text_chunk
+    progress.finish()
+
+
+def _prepare_records(document_id: str, batch: EmbeddingBatch) -> List[dict[str, object]]:
+    """Chuyển EmbeddingBatch thành payload ghi vào bảng document_embeddings."""
+    if not len(batch):
+        return []
+    # Mã hoá cả ma trận một lần (literal pgvector hoặc list float) thay vì từng dòng
+    vectors = encode_vectors(batch.vectors, settings.embedding_wire_format, settings.embedding_wire_precision)
+    return [
+        {
+            "document_id": document_id,
+            "content": text,
+            "page_number": page_number,
+            "chunk_index": chunk_index,
+            "embedding": vector,
+        }
+        for text, page_number, chunk_index, vector in zip(
+            batch.texts, batch.page_numbers, batch.chunk_indexes.tolist(), vectors
         )
-    return records
+    ]
+
+
+def _ingest_serial(
+    document_id: str,
+    file_path: Path,
+    tracker: ProgressTracker | None = None,
+    sink: EmbeddingSink | None = None,
+    incremental: bool = False,
+    lexical: LexicalSegmentBuilder | None = None,
+) -> IngestResult:
+    """Ingest tuần tự: đọc hết chunk, embed, rồi ghi (thay toàn bộ hoặc chỉ phần thay đổi)."""
+    tracker = tracker or ProgressTracker()
+    sink = sink or EmbeddingSink()
+    result = IngestResult()
+    pages = _tracked_pages(file_path, tracker.stage("extract"))
+    text_chunks = list(_tracked_chunks(split_chunks(pages), tracker.stage("chunk"), lexical))
+
+    diff = _ChunkDiff(sink.fetch_existing(document_id)) if incremental else None
+    new_chunks = [chunk for chunk in text_chunks if diff is None or diff.claim(chunk) is None]
+    result.reused = tracker.reused = len(text_chunks) - len(new_chunks)
+
+    embed_progress = tracker.stage("embed", total=len(new_chunks))
+    batch = embed_chunks(new_chunks)
+    embed_progress.advance(len(batch), batch.vectors.nbytes)
+    embed_progress.finish()
+
+    records = _prepare_records(document_id, batch)
+    insert_progress = tracker.stage("insert", total=len(records))
+
+    def insert() -> None:
+        if records:
+            sink.insert(records, insert_progress)
+        insert_progress.finish()
+
+    if diff is None:
+        result.removed = _replace_all(document_id, sink, insert)
+    else:
+        insert()
+        _finish_incremental(document_id, diff, sink, result)
+    result.added = len(records)
+    return result
+
+
+def _ingest_streaming(
+    document_id: str,
+    file_path: Path,
+    params: IngestParams | None = None,
+    sink: EmbeddingSink | None = None,
+    incremental: bool = False,
+    tracker: ProgressTracker | None = None,
+    lexical: LexicalSegmentBuilder | None = None,
+) -> IngestResult:
+    """
+    Ingest streaming: extract → chunk → embed → insert chạy đồng thời, nối bằng hàng đợi có giới hạn.
+
+    CPU embed batch sau trong khi batch trước đang được ghi qua mạng; bộ nhớ
+    đỉnh bị chặn bởi params.memory_budget_mb thay vì cả tài liệu.
 
+    incremental=True: chunk có nội dung trùng với chunk đã lưu được giữ nguyên
+    (không embed, không ghi), chỉ chunk mới được insert và chunk cũ không còn
+    dùng bị xoá SAU khi ghi xong. incremental=False: ghi toàn bộ chunk mới rồi
+    mới xoá embedding cũ (_replace_all); lỗi giữa chừng thì các row vừa ghi bị
+    xoá và tài liệu giữ nguyên embedding cũ (status = failed).
 
-def process_document(document_id: str, job_id: str = None) -> None:
-    """Xử lý toàn bộ vòng đời ingest embedding cho một tài liệu duy nhất."""
+    tracker nhận số item/byte của từng stage (extract, chunk, embed, insert).
+    lexical (nếu có) nhận mọi chunk ở stage chunk để build index từ khoá.
+    """
+    params = params or IngestParams()
+    tracker = tracker or ProgressTracker()
+    sink = sink or EmbeddingSink()
+    result = IngestResult()
+    diff = _ChunkDiff(sink.fetch_existing(document_id)) if incremental else None
+
+    runner = StageRunner()
+    pages_depth, chunks_depth, records_depth = params.queue_depths()
+    pages_q = runner.queue(pages_depth)
+    chunks_q = runner.queue(chunks_depth)
+    records_q = runner.queue(records_depth)
+
+    def extract() -> None:
+        for page in _tracked_pages(file_path, tracker.stage("extract")):
+            runner.put(pages_q, page)
+        runner.put(pages_q, runner.DONE)
+
+    def chunk() -> None:
+        batch: List[TextChunk] = []
+        for text_chunk in _tracked_chunks(split_chunks(runner.drain(pages_q)), tracker.stage("chunk"), lexical):
+            if diff is not None and diff.claim(text_chunk) is not None:
+                result.reused += 1
+                tracker.reused += 1
+                continue
+            batch.append(text_chunk)
+            if len(batch) >= params.embed_batch_size:
+                runner.put(chunks_q, batch)
+                batch = []
+        if batch:
+            runner.put(chunks_q, batch)
+        runner.put(chunks_q, runner.DONE)
+
+    def embed() -> None:
+        progress = tracker.stage("embed")
+        for batch in runner.drain(chunks_q):
+            embeddings = embed_chunks(batch)
+            progress.advance(len(embeddings), embeddings.vectors.nbytes)
+            runner.put(records_q, _prepare_records(document_id, embeddings))
+        progress.finish()
+        runner.put(records_q, runner.DONE)
+
+    def insert() -> None:
+        progress = tracker.stage("insert")
+        with sink.open_writer(params, progress) as writer:
+            for records in runner.drain(records_q):
+                writer.submit(records)
+        progress.finish()
+        result.added = writer.stats.rows
+        logger.info(f"Inserted {writer.stats.rows} embeddings ({writer.stats.rows_per_second:.0f} rows/s)")
+
+    def run() -> None:
+        runner.run([extract, chunk, embed, insert])
+
+    if diff is None:
+        result.removed = _replace_all(document_id, sink, run)
+    else:
+        run()
+        _finish_incremental(document_id, diff, sink, result)
+    return result
+
+
+def process_document(
+    document_id: str,
+    job_id: str = None,
+    force_refresh: bool = False,
+    on_progress: ProgressCallback | None = None,
+    on_event: ProgressEventCallback | None = None,
+) -> IngestResult:
+    """
+    Xử lý toàn bộ vòng đời ingest embedding cho một tài liệu duy nhất.
+
+    Progress được gửi tới on_progress; nếu không truyền mà có job_id thì in
+    dòng PROGRESS: ra stdout (giao thức cũ của Node backend). Event chi tiết
+    theo stage (ProgressEvent) được gửi tới on_event; nếu không truyền mà có
+    job_id và bật INGEST_PROGRESS_EVENTS thì in dòng EVENT:<json> ra stdout.
+    Cả hai được giới hạn tần suất theo INGEST_PROGRESS_INTERVAL_MS.
+
+    - File, model và tham số chunk giống lần ingest thành công trước → bỏ qua
+      extract/embed/ghi (trừ khi force_refresh).
+    - Ngược lại ingest incremental (INGEST_INCREMENTAL): chỉ embed/ghi chunk mới
+      hoặc đã sửa, xoá chunk không còn tồn tại. Đổi model, không có fingerprint
+      của lần trước hoặc force_refresh thì embed lại toàn bộ.
+    """
+    report = on_progress or (stdout_progress if job_id else None)
+    tracker = ProgressTracker(
+        on_event=on_event or (stdout_events if job_id and settings.ingest_progress_events else None),
+        on_percent=report,
+        min_interval=settings.ingest_progress_interval_ms / 1000,
+    )
     metadata = fetch_document_metadata(document_id)
     upsert_embedding_status(document_id=document_id, status="processing")
 
@@ -55,32 +464,84 @@ def process_document(document_id: str, job_id: str = None) -> None:
             raise ValueError(f"Document {document_id} is missing file_path in Supabase")
 
         filename = Path(remote_path).name or f"{document_id}.pdf"
-        file_path = settings.temp_dir / filename
+        # Tên file tạm riêng cho từng lần chạy: job khác của cùng tài liệu không ghi đè / xoá mất file này
+        file_path = settings.temp_dir / f"{document_id}_{uuid.uuid4().hex[:8]}_{filename}"
+        previous = fetch_ingest_fingerprint(document_id)
+        # Tổng chunk cho mốc 10% trước khi tách chunk: số chunk của lần ingest trước
+        tracker.expected_total = (previous or {}).get("chunks")
+        download = tracker.stage("download", total=1)
         file_path = download_file(remote_path, file_path)
+        download.advance(1, file_path.stat().st_size)
+        download.finish()  # on_percent nhận mốc 10% (hoãn tới khi biết tổng chunk)
 
-        text_chunks = list(_load_document(file_path))
-        
-        # Gửi progress tracking nếu có job_id
-        if job_id:
-            print(f"PROGRESS:10:0:{len(text_chunks)}")
-        
-        embeddings = embed_chunks(text_chunks)
-        records = _prepare_records(document_id, embeddings)
+        owner = metadata.get("created_by")
+        lexical = LexicalSegmentBuilder(document_id) if settings.lexical_index_enabled and owner else None
 
-        delete_existing_embeddings(document_id)
-        if records:
-            insert_embeddings(records)
+        fingerprint = _ingest_fingerprint(file_path)
+        # Chưa có segment BM25 (mới bật LEXICAL_INDEX, máy khác...) → ingest incremental để build, không embed lại
+        lexical_ready = lexical is None or lexical_index.has_document(owner, document_id)
+        if _same_input(previous, fingerprint) and not force_refresh and lexical_ready:
+            upsert_embedding_status(document_id=document_id, status="completed")
+            logger.info(f"Skipped {document_id}: file and ingest parameters unchanged")
+            if report:
+                existing = _stored_chunk_count(document_id, previous)
+                report(100, existing, existing)
+            return IngestResult(skipped=True)
+
+        # Embedding cũ chỉ tái sử dụng được nếu chắc chắn sinh bởi cùng model; không có
+        # fingerprint (ingest trước khi có cột, lần trước lỗi) → embed lại toàn bộ
+        same_model = previous is not None and previous.get("model") == fingerprint["model"]
+        incremental = settings.ingest_incremental and same_model and not force_refresh
+
+        if settings.ingest_streaming:
+            result = _ingest_streaming(document_id, file_path, incremental=incremental, tracker=tracker, lexical=lexical)
+        else:
+            result = _ingest_serial(document_id, file_path, tracker, incremental=incremental, lexical=lexical)
 
+        save_ingest_fingerprint(document_id, {**fingerprint, "chunks": result.total})
+        _save_lexical_segment(document_id, metadata, lexical)
         upsert_embedding_status(document_id=document_id, status="completed")
+        _invalidate_user_caches(metadata)
+        logger.info(
+            f"Ingested {document_id}: {result.added} added, {result.reused} reused "
+            f"({result.moved} moved), {result.removed} removed"
+        )
         
-        # Gửi progress tracking hoàn thành nếu có job_id
-        if job_id:
-            print(f"PROGRESS:100:{len(text_chunks)}:{len(text_chunks)}")
+        # Gửi progress tracking hoàn thành
+        if report:
+            report(100, result.total, result.total)
+        return result
             
     except Exception as exc:  # noqa: BLE001 - log and re-raise after marking failed
         upsert_embedding_status(document_id=document_id, status="failed", error_message=str(exc))
+        _invalidate_user_caches(metadata)  # Có thể đã ghi/xoá một phần embedding
+        # Segment cũ có thể không còn khớp embedding; lần ingest lại (fingerprint bị xoá) sẽ build lại
+        _remove_lexical_segment(document_id, metadata.get("created_by"))
+        # Lần sau phải ingest lại dù file không đổi
+        try:
+            save_ingest_fingerprint(document_id, None)
+        except Exception:  # noqa: BLE001 - không che lỗi gốc
+            logger.warning(f"Could not clear ingest fingerprint for {document_id}")
         raise
     finally:
         if file_path and file_path.exists():
             # unlink xóa file tạm thời
             file_path.unlink(missing_ok=True)
+
+
+def remove_document(document_id: str) -> None:
+    """
+    Gỡ tài liệu khỏi retrieval khi tài liệu bị xoá: xoá embedding trên Supabase,
+    segment BM25 cục bộ và câu trả lời cache / index HNSW của chủ tài liệu.
+
+    Gọi được cả khi row documents đã bị xoá trước (khi đó segment được tìm theo
+    document_id trong mọi user).
+    """
+    try:
+        metadata = fetch_document_metadata(document_id)
+    except ValueError:
+        metadata = {}
+    EmbeddingSink().delete_document(document_id)
+    _remove_lexical_segment(document_id, metadata.get("created_by"))
+    _invalidate_user_caches(metadata)
+    logger.info(f"Removed embeddings and lexical index of {document_id}")
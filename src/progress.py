@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import json
+import threading
+from dataclasses import asdict, dataclass
+from time import perf_counter
+from typing import Callable, Dict, Optional
+
+"""
+Progress chi tiết theo stage của ingest (download, extract, chunk, embed, insert).
+
+Mỗi stage đếm số item và số byte đã xử lý; event được phát tối đa một lần mỗi
+min_interval giây cho mỗi stage (và luôn phát khi stage kết thúc), nên chi phí
+trên đường nóng chỉ là vài phép cộng dưới lock. Event đi tới callback trong
+process (ProgressEvent) và/hoặc được quy đổi thành phần trăm cho giao thức
+PROGRESS: trên stdout.
+"""
+
+@dataclass
+class ProgressEvent:
+    """Trạng thái một stage tại thời điểm phát event."""
+
+    stage: str
+    count: int  # Số item đã xử lý (trang, chunk, row...) từ đầu stage
+    bytes: int  # Số byte đã xử lý từ đầu stage
+    total: Optional[int]  # Tổng số item nếu biết trước
+    elapsed_s: float  # Thời gian từ lúc stage bắt đầu
+    items_per_s: float  # Throughput tức thời (kể từ event trước của stage)
+    bytes_per_s: float
+    final: bool = False  # Stage đã kết thúc
+
+    def to_dict(self) -> Dict[str, object]:
+        data = asdict(self)
+        data["elapsed_s"] = round(self.elapsed_s, 3)
+        data["items_per_s"] = round(self.items_per_s, 1)
+        data["bytes_per_s"] = round(self.bytes_per_s, 1)
+        return data
+
+
+ProgressEventCallback = Callable[[ProgressEvent], None]
+ProgressCallback = Callable[[int, int, int], None]  # (phần trăm, số chunk đã xử lý, tổng số chunk)
+
+
+def stdout_progress(percent: int, processed: int, total: int) -> None:
+    """Giao thức progress qua stdout mà Node backend đọc: PROGRESS:<phần trăm>:<đã xử lý>:<tổng>."""
+    print(f"PROGRESS:{percent}:{processed}:{total}", flush=True)
+
+
+def stdout_events(event: ProgressEvent) -> None:
+    """In event dạng EVENT:<json> (dòng PROGRESS: cũ vẫn được in riêng)."""
+    print(f"EVENT:{json.dumps(event.to_dict())}", flush=True)
+
+
+class StageProgress:
+    """Bộ đếm của một stage; advance() an toàn giữa các thread."""
+
+    def __init__(self, tracker: "ProgressTracker", name: str, total: Optional[int] = None) -> None:
+        self.name = name
+        self.total = total
+        self.count = 0
+        self.bytes = 0
+        self._tracker = tracker
+        self._started = perf_counter()
+        self._last_emit = self._started
+        self._last_count = 0
+        self._last_bytes = 0
+        self._finished = False
+
+    def set_total(self, total: int) -> None:
+        self.total = total
+
+    def advance(self, count: int = 1, nbytes: int = 0) -> None:
+        """Cộng dồn item/byte; phát event nếu đã qua min_interval kể từ event trước."""
+        tracker = self._tracker
+        with tracker._lock:
+            self.count += count
+            self.bytes += nbytes
+            now = perf_counter()
+            event = self._snapshot_locked(now) if now - self._last_emit >= tracker.min_interval else None
+        if event is not None:
+            tracker._publish(event)
+
+    def finish(self) -> None:
+        """Kết thúc stage: luôn phát event cuối."""
+        tracker = self._tracker
+        with tracker._lock:
+            if self._finished:
+                return
+            self._finished = True
+            event = self._snapshot_locked(perf_counter(), final=True)
+        tracker._publish(event)
+
+    def _snapshot_locked(self, now: float, final: bool = False) -> ProgressEvent:
+        window = now - self._last_emit
+        event = ProgressEvent(
+            stage=self.name,
+            count=self.count,
+            bytes=self.bytes,
+            total=self.total,
+            elapsed_s=now - self._started,
+            items_per_s=(self.count - self._last_count) / window if window > 0 else 0.0,
+            bytes_per_s=(self.bytes - self._last_bytes) / window if window > 0 else 0.0,
+            final=final,
+        )
+        self._last_emit, self._last_count, self._last_bytes = now, self.count, self.bytes
+        return event
+
+
+class ProgressTracker:
+    """
+    Theo dõi các stage của một lần ingest.
+
+    Args:
+        on_event: Nhận ProgressEvent của từng stage
+        on_percent: Nhận (phần trăm, chunk đã xử lý, tổng chunk ước lượng), giới hạn tần suất như event
+        min_interval: Khoảng cách tối thiểu (giây) giữa hai event của cùng một stage
+
+    expected_total: Số chunk của lần ingest trước (nếu biết), dùng làm tổng
+    cho tới khi ước lượng được từ lần chạy hiện tại.
+    """
+
+    def __init__(
+        self,
+        on_event: Optional[ProgressEventCallback] = None,
+        on_percent: Optional[ProgressCallback] = None,
+        min_interval: float = 0.5,
+    ) -> None:
+        self.on_event = on_event
+        self.on_percent = on_percent
+        self.min_interval = max(min_interval, 0.0)
+        self.stages: Dict[str, StageProgress] = {}
+        self.reused = 0  # Chunk tái sử dụng (incremental), được tính là đã xử lý
+        self.expected_total: Optional[int] = None
+        self._lock = threading.Lock()
+        self._percent_lock = threading.Lock()
+        self._last_percent = -1
+        self._last_percent_at = 0.0
+
+    def stage(self, name: str, total: Optional[int] = None) -> StageProgress:
+        """Bắt đầu (hoặc lấy lại) bộ đếm của một stage."""
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = StageProgress(self, name, total)
+            return self.stages[name]
+
+    def percent(self) -> tuple[int, int, int]:
+        """
+        Ước lượng (phần trăm, chunk đã ghi hoặc tái sử dụng, tổng chunk).
+
+        Tổng chunk được ngoại suy từ số chunk / số trang đã tách khi chưa tách xong
+        (trước đó là expected_total). Download xong là 10% (giống mốc PROGRESS:10 cũ),
+        phần còn lại theo tỉ lệ chunk đã ghi.
+        """
+        with self._lock:
+            extract = self.stages.get("extract")
+            chunk = self.stages.get("chunk")
+            insert = self.stages.get("insert")
+            chunks_seen = chunk.count if chunk else 0  # Gồm cả chunk tái sử dụng
+            processed = (insert.count if insert else 0) + self.reused
+            if chunk and chunk._finished:
+                total = chunks_seen
+            elif extract and extract.total and extract.count:
+                total = max(int(chunks_seen * extract.total / extract.count), chunks_seen)
+            else:
+                total = chunks_seen or self.expected_total or 0
+        if "download" not in self.stages or not self.stages["download"]._finished:
+            return 0, processed, total
+        ratio = processed / total if total else 0.0
+        return min(10 + int(89 * ratio), 99), processed, total
+
+    def _publish(self, event: ProgressEvent) -> None:
+        if self.on_event is not None:
+            self.on_event(event)
+        # Stage chunk cập nhật tổng chunk: cần cho mốc 10% khi lúc download xong chưa biết tổng
+        if self.on_percent is not None and event.stage in ("download", "chunk", "insert"):
+            with self._percent_lock:
+                now = perf_counter()
+                if not event.final and now - self._last_percent_at < self.min_interval:
+                    return
+                percent, processed, total = self.percent()
+                # Chưa download xong (giao thức cũ bắt đầu từ mốc 10%) hoặc chưa biết tổng:
+                # hoãn dòng PROGRESS (Node backend đọc tổng chunk từ mốc 10%)
+                if percent == self._last_percent or not percent or not total:
+                    return
+                self._last_percent, self._last_percent_at = percent, now
+                self.on_percent(percent, processed, total)
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Dict
+
+import numpy as np
+
+from .config import settings
+from .embedder import _get_model, model_lock
+from .encode_batcher import EncodeQueueFull, encode_batcher
+
+"""Cache LRU + TTL cho embedding của câu hỏi, dùng chung cho mọi entry point retrieval."""
+
+
+def normalize_query(query: str) -> str:
+    """Chuẩn hoá khoá cache: Unicode NFC (tiếng Việt), gộp khoảng trắng, không phân biệt hoa thường."""
+    text = unicodedata.normalize("NFC", query)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.casefold()
+
+
+class QueryEmbeddingCache:
+    """LRU có giới hạn kích thước và TTL, an toàn khi dùng từ nhiều thread."""
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> np.ndarray | None:
+        """Trả về vector nếu còn hạn (và đánh dấu vừa dùng), ngược lại None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        """Ghi vector (read-only) và loại entry cũ nhất nếu vượt max_size."""
+        vector.setflags(write=False)  # Vector dùng chung giữa các request, không cho sửa
+        with self._lock:
+            self._entries[key] = (monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Xoá toàn bộ entry (giữ nguyên bộ đếm)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Số liệu hit/miss để hiển thị ở /health."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+            }
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    max_size=settings.query_cache_size,
+    ttl=settings.query_cache_ttl,
+)
+
+
+def encode_query(query: str) -> np.ndarray:
+    """Encode câu hỏi thành vector float32, dùng cache nếu câu hỏi (đã chuẩn hoá) từng được hỏi."""
+    key = normalize_query(query)
+    vector = query_embedding_cache.get(key)
+    if vector is not None:
+        return vector
+
+    if encode_batcher.running:
+        # Trong server: gom với các câu hỏi đồng thời khác thành một batch encode
+        vector = encode_batcher.encode(query)
+    else:
+        vector = _encode_one(query)
+    query_embedding_cache.put(key, vector)
+    return vector
+
+
+_encode_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+# Back-pressure cho executor (hàng đợi của ThreadPoolExecutor không giới hạn): tối đa ENCODE_MAX_PENDING câu chờ/đang encode
+_encode_slots = threading.BoundedSemaphore(max(settings.encode_max_pending, 1))
+
+
+def _get_encode_executor() -> ThreadPoolExecutor:
+    """Executor riêng (ENCODE_WORKERS thread) cho encode khi không dùng encode batcher."""
+    global _encode_executor
+    if _encode_executor is None:
+        with _executor_lock:
+            if _encode_executor is None:
+                _encode_executor = ThreadPoolExecutor(
+                    max_workers=max(settings.encode_workers, 1), thread_name_prefix="query-encode"
+                )
+    return _encode_executor
+
+
+def _encode_one(query: str) -> np.ndarray:
+    model = _get_model()
+    with model_lock:
+        vector = model.encode([query])[0]
+    return np.asarray(vector, dtype=np.float32)
+
+
+async def aencode_query(query: str) -> np.ndarray:
+    """
+    Như encode_query nhưng không chặn event loop.
+
+    Encode chạy trên thread của encode batcher hoặc trên executor riêng khi
+    ENCODE_BATCHING tắt, không dùng threadpool mặc định của FastAPI/asyncio.
+    Cả hai đường đều giới hạn ENCODE_MAX_PENDING câu đang chờ: quá thì raise
+    EncodeQueueFull thay vì xếp hàng vô hạn.
+    """
+    key = normalize_query(query)
+    vector = query_embedding_cache.get(key)
+    if vector is not None:
+        return vector
+
+    if encode_batcher.running:
+        vector = await encode_batcher.aencode(query)
+    else:
+        if not _encode_slots.acquire(blocking=False):
+            raise EncodeQueueFull(f"Hàng đợi encode đã đầy ({settings.encode_max_pending} câu đang chờ)")
+        try:
+            future = _get_encode_executor().submit(_encode_one, query)
+        except BaseException:
+            _encode_slots.release()
+            raise
+        # Trả slot khi encode xong hoặc bị huỷ lúc còn trong hàng đợi (caller ngừng chờ)
+        future.add_done_callback(lambda _: _encode_slots.release())
+        vector = await asyncio.wrap_future(future)
+    query_embedding_cache.put(key, vector)
+    return vector
@@ -1,16 +1,30 @@
 from __future__ import annotations
 
+import json
+import logging
 from time import perf_counter
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict, List, Tuple
 from pydantic import ValidationError
 
-from .llm_client import LLMResponse, generate_answer
+from .answer_cache import Scope, answer_cache, source_signature
+from .config import settings
+from .llm_client import LLMResponse, agenerate_answer, astream_answer, generate_answer
 from .prompt_builder import build_rag_prompt
-from .retriever import RetrievedChunk, retrieve_similar_chunks, retrieve_similar_chunks_by_user
+from .query_cache import aencode_query, encode_query
+from .retriever import (
+    RetrievedChunk,
+    aretrieve_similar_chunks_by_user,
+    retrieve_similar_chunks,
+    retrieve_similar_chunks_by_user,
+)
 from .validators import RAGQueryRequest
 
+logger = logging.getLogger(__name__)
+
 """Orchestrator kết hợp retrieval + prompt + LLM để tạo câu trả lời cuối."""
 
+StreamEvent = Tuple[str, Dict[str, Any]]  # (tên event SSE, payload JSON)
+
 
 def _serialize_chunk(chunk: RetrievedChunk) -> Dict[str, Any]:
     """Chuyển RetrievedChunk thành dict đơn giản để trả về cho client."""
@@ -22,6 +36,20 @@ def _serialize_chunk(chunk: RetrievedChunk) -> Dict[str, Any]:
     }
 
 
+def _validate(query: str, user_id: str, top_k: int, system_prompt: str | None, mode: str) -> RAGQueryRequest:
+    """Validate input với Pydantic, lỗi được chuyển thành ValueError."""
+    try:
+        return RAGQueryRequest(
+            query=query,
+            user_id=user_id,
+            top_k=top_k,
+            system_prompt=system_prompt,
+            mode=mode
+        )
+    except ValidationError as e:
+        raise ValueError(f"Invalid input parameters: {e}") from e
+
+
 def rag_query(
     query: str,
     user_id: str,  # ĐÃ ĐỔI: Từ document_id → user_id để search toàn bộ documents của user
@@ -59,29 +87,62 @@ def rag_query(
     Raises:
         ValueError: Nếu input validation thất bại
     """
-    # Validate input với Pydantic
-    try:
-        validated = RAGQueryRequest(
-            query=query,
-            user_id=user_id,
-            top_k=top_k,
-            system_prompt=system_prompt,
-            mode=mode
-        )
-    except ValidationError as e:
-        raise ValueError(f"Invalid input parameters: {e}") from e
-    
+    validated = _validate(query, user_id, top_k, system_prompt, mode)
+
     # Đo thời gian xử lý toàn bộ pipeline
     start = perf_counter()
+    retrieved_chunks, prompt = _retrieve_and_prompt(validated)
+
+    # Câu hỏi gần giống (cùng tập nguồn) đã được trả lời → bỏ qua LLM
+    # (encode_query trúng cache embedding vì retrieval vừa encode câu hỏi này)
+    vector = encode_query(validated.query) if settings.answer_cache_enabled else None
+    cached = _cached_result(validated, model, retrieved_chunks, prompt, vector, start)
+    if cached is not None:
+        return cached
+
+    # Bước 3: LLM GENERATION - Gửi prompt tới Ollama để sinh câu trả lời
+    # Model: llama3 (local), temperature=0.7, max_tokens=1000
+    llm_start = perf_counter()
+    llm_response: LLMResponse = generate_answer(prompt=prompt, model=model)
+    cache_info = _store_answer(validated, model, retrieved_chunks, vector, llm_response, llm_start)
+    return _build_result(llm_response, retrieved_chunks, prompt, start, cache_info)
 
+
+async def arag_query(
+    query: str,
+    user_id: str,
+    top_k: int = 5,
+    system_prompt: str | None = None,
+    model: str | None = None,
+    mode: str = "fast",
+) -> Dict[str, Any]:
+    """
+    Như rag_query nhưng không chặn event loop: encode trên thread encode riêng,
+    RPC qua Supabase AsyncClient, LLM qua client async.
+    """
+    validated = _validate(query, user_id, top_k, system_prompt, mode)
+    start = perf_counter()
+    retrieved_chunks, prompt = await _aretrieve_and_prompt(validated)
+    vector = await aencode_query(validated.query) if settings.answer_cache_enabled else None
+    cached = _cached_result(validated, model, retrieved_chunks, prompt, vector, start)
+    if cached is not None:
+        return cached
+
+    llm_start = perf_counter()
+    llm_response = await agenerate_answer(prompt=prompt, model=model)
+    cache_info = _store_answer(validated, model, retrieved_chunks, vector, llm_response, llm_start)
+    return _build_result(llm_response, retrieved_chunks, prompt, start, cache_info)
+
+
+def _retrieve_and_prompt(validated: RAGQueryRequest) -> Tuple[List[RetrievedChunk], str]:
+    """Bước 1-2 của vòng RAG: retrieval + ghép prompt."""
     # Bước 1: RETRIEVAL - Tìm chunks tương đồng từ TẤT CẢ documents của user
-    # Sử dụng validated data
     retrieved_chunks = retrieve_similar_chunks_by_user(
         query=validated.query,
         user_id=validated.user_id,
         top_k=validated.top_k
     )
-    
+
     # Bước 2: PROMPT BUILDING - Ghép query + chunks thành prompt
     prompt = build_rag_prompt(
         query=validated.query,
@@ -89,16 +150,87 @@ def rag_query(
         system_prompt=validated.system_prompt,
         mode=validated.mode  # Use validated mode
     )
-    
-    # Bước 3: LLM GENERATION - Gửi prompt tới Ollama để sinh câu trả lời
-    # Model: llama3 (local), temperature=0.7, max_tokens=1000
-    llm_response: LLMResponse = generate_answer(prompt=prompt, model=model)
+    return retrieved_chunks, prompt
+
+
+async def _aretrieve_and_prompt(validated: RAGQueryRequest) -> Tuple[List[RetrievedChunk], str]:
+    """Bản async của _retrieve_and_prompt."""
+    retrieved_chunks = await aretrieve_similar_chunks_by_user(
+        query=validated.query,
+        user_id=validated.user_id,
+        top_k=validated.top_k
+    )
+    prompt = build_rag_prompt(
+        query=validated.query,
+        chunks=retrieved_chunks,
+        system_prompt=validated.system_prompt,
+        mode=validated.mode
+    )
+    return retrieved_chunks, prompt
 
+
+def _answer_scope(validated: RAGQueryRequest, model: str | None) -> Scope:
+    """Phạm vi cache câu trả lời: chỉ dùng lại trong cùng user, mode, model và system prompt."""
+    return (validated.user_id, validated.mode, model or settings.ollama_model, validated.system_prompt or "")
+
+
+def _cached_result(
+    validated: RAGQueryRequest,
+    model: str | None,
+    retrieved_chunks: List[RetrievedChunk],
+    prompt: str,
+    vector: Any,
+    start: float,
+) -> Dict[str, Any] | None:
+    """Kết quả dựng từ answer cache nếu có câu hỏi đủ gần với cùng tập nguồn, ngược lại None."""
+    if vector is None:
+        return None
+    found = answer_cache.lookup(_answer_scope(validated, model), source_signature(retrieved_chunks), vector)
+    if found is None:
+        return None
+    entry, similarity = found
+    logger.info(f"Answer cache hit (cosine={similarity:.3f}), saved ~{entry.llm_ms:.0f}ms of LLM time")
+    llm_response = LLMResponse(answer=entry.answer, model=entry.model, raw=entry.raw)
+    cache_info = {"hit": True, "similarity": round(similarity, 4), "saved_llm_ms": round(entry.llm_ms, 2)}
+    return _build_result(llm_response, retrieved_chunks, prompt, start, cache_info)
+
+
+def _store_answer(
+    validated: RAGQueryRequest,
+    model: str | None,
+    retrieved_chunks: List[RetrievedChunk],
+    vector: Any,
+    llm_response: LLMResponse,
+    llm_start: float,
+) -> Dict[str, Any] | None:
+    """Ghi câu trả lời vừa sinh vào answer cache; trả về metadata cache (None nếu cache tắt)."""
+    if vector is None:
+        return None
+    llm_ms = (perf_counter() - llm_start) * 1000
+    answer_cache.store(
+        _answer_scope(validated, model),
+        source_signature(retrieved_chunks),
+        vector,
+        llm_response.answer,
+        llm_response.model,
+        llm_response.raw,
+        llm_ms,
+    )
+    return {"hit": False, "llm_ms": round(llm_ms, 2)}
+
+
+def _build_result(
+    llm_response: LLMResponse,
+    retrieved_chunks: List[RetrievedChunk],
+    prompt: str,
+    start: float,
+    cache_info: Dict[str, Any] | None = None,
+) -> Dict[str, Any]:
+    """Bước 4: RESPONSE - Trả về kết quả đầy đủ."""
     # Tính tổng thời gian xử lý (ms)
     elapsed_ms = (perf_counter() - start) * 1000
 
-    # Bước 4: RESPONSE - Trả về kết quả đầy đủ
-    return {
+    result = {
         "answer": llm_response.answer,  # Câu trả lời từ LLM
         "sources": [_serialize_chunk(chunk) for chunk in retrieved_chunks],  # Chunks context
         "metadata": {
@@ -109,3 +241,90 @@ def rag_query(
         "prompt": prompt,                     # Full prompt (để debug)
         "raw_llm_response": llm_response.raw, # Raw response từ LLM (để debug)
     }
+    if cache_info is not None:
+        # Hit/miss của request này + hit rate và tổng thời gian LLM tiết kiệm được của process
+        stats = answer_cache.stats()
+        cache_info.update({"hit_rate": stats["hit_rate"], "total_saved_llm_ms": stats["saved_llm_ms"]})
+        result["metadata"]["answer_cache"] = cache_info
+    return result
+
+
+async def stream_answer_events(
+    prompt: str,
+    sources: List[Dict[str, Any]],
+    model: str | None,
+    started: float,
+    metadata: Dict[str, Any] | None = None,
+) -> AsyncIterator[StreamEvent]:
+    """
+    Sinh chuỗi event cho một câu trả lời streaming: sources → token... → done.
+
+    sources được gửi trước khi gọi LLM để client hiển thị ngay. Event done chứa
+    metadata gồm ttft_ms (từ lúc nhận request, tính theo started, tới token đầu
+    tiên) và query_time_ms (tổng thời gian).
+    """
+    metadata = dict(metadata or {})
+    metadata["retrieval_ms"] = round((perf_counter() - started) * 1000, 2)
+    yield "sources", {"sources": sources, "metadata": metadata}
+
+    stream = await astream_answer(prompt=prompt, model=model)
+    ttft_ms: float | None = None
+    try:
+        async for token in stream:
+            if ttft_ms is None:
+                ttft_ms = (perf_counter() - started) * 1000
+            yield "token", {"text": token}
+    finally:
+        await stream.aclose()  # Client ngắt kết nối giữa chừng → giải phóng request tới Ollama
+
+    elapsed_ms = (perf_counter() - started) * 1000
+    metadata.update({
+        "model": stream.model,
+        "ttft_ms": round(ttft_ms, 2) if ttft_ms is not None else None,
+        "llm_ttft_ms": round(stream.first_token_ms, 2) if stream.first_token_ms is not None else None,
+        "query_time_ms": round(elapsed_ms, 2),
+        "eval_count": stream.raw.get("eval_count"),
+    })
+    logger.info(f"Streamed answer: ttft={metadata['ttft_ms']}ms total={metadata['query_time_ms']}ms")
+    yield "done", {"metadata": metadata}
+
+
+async def arag_query_stream(
+    query: str,
+    user_id: str,
+    top_k: int = 5,
+    system_prompt: str | None = None,
+    model: str | None = None,
+    mode: str = "fast",
+) -> AsyncIterator[StreamEvent]:
+    """
+    Giống arag_query nhưng trả câu trả lời dạng stream (xem stream_answer_events).
+
+    Validate và retrieval chạy khi await (lỗi được raise trước khi
+    response bắt đầu); chỉ phần sinh câu trả lời là lazy.
+    """
+    started = perf_counter()
+    validated = _validate(query, user_id, top_k, system_prompt, mode)
+    retrieved_chunks, prompt = await _aretrieve_and_prompt(validated)
+    return stream_answer_events(
+        prompt,
+        [_serialize_chunk(chunk) for chunk in retrieved_chunks],
+        model,
+        started,
+        {"chunk_count": len(retrieved_chunks)},
+    )
+
+
+async def sse_encode(events: AsyncIterator[StreamEvent]) -> AsyncIterator[str]:
+    """
+    Mã hoá event thành Server-Sent Events (event: <tên>\ndata: <json>\n\n).
+
+    Lỗi phát sinh khi đang stream (header đã gửi, không đổi được status code)
+    được gửi thành event error rồi kết thúc stream.
+    """
+    try:
+        async for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    except Exception as exc:  # noqa: BLE001 - báo lỗi qua stream
+        logger.error(f"Streaming answer failed: {exc}", exc_info=True)
+        yield f"event: error\ndata: {json.dumps({'detail': str(exc)}, ensure_ascii=False)}\n\n"
@@ -0,0 +1,226 @@
+"""
+Rerank ứng viên retrieval bằng cross-encoder (tuỳ chọn, RERANK_ENABLED).
+
+Điểm similarity của nguồn nội bộ (cosine) và web (giả lập theo thứ hạng) không
+so sánh được với nhau; cross-encoder chấm lại mọi ứng viên so với câu hỏi trong
+một lượt batch trên CPU/GPU. Điểm được cache theo (câu hỏi chuẩn hoá, hash nội
+dung chunk). Mỗi request có budget thời gian (RERANK_BUDGET_MS): hết budget thì
+giữ thứ tự cũ; lượt chấm điểm đang chạy vẫn chạy nốt và ghi cache cho lần sau,
+lượt còn xếp hàng thì bị huỷ để hàng đợi không dồn lại khi quá tải.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from dataclasses import replace
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .config import settings
+from .query_cache import normalize_query
+from .retriever import RetrievedChunk
+
+logger = logging.getLogger(__name__)
+
+
+ScoreKey = Tuple[str, str]  # (câu hỏi chuẩn hoá, sha1 nội dung chunk)
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class RerankScoreCache:
+    """LRU điểm cross-encoder theo (câu hỏi, chunk), an toàn khi dùng từ nhiều thread."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[ScoreKey, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: Sequence[ScoreKey], count: bool = True) -> List[Optional[float]]:
+        """Điểm của từng khoá (None nếu chưa có); count=False: không tính vào hit/miss."""
+        with self._lock:
+            scores: List[Optional[float]] = []
+            for key in keys:
+                score = self._entries.get(key)
+                if score is not None:
+                    self._entries.move_to_end(key)
+                if count:
+                    if score is None:
+                        self.misses += 1
+                    else:
+                        self.hits += 1
+                scores.append(score)
+            return scores
+
+    def put_many(self, scores: Dict[ScoreKey, float]) -> None:
+        with self._lock:
+            for key, score in scores.items():
+                self._entries[key] = score
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+
+class CrossEncoderReranker:
+    """
+    Cross-encoder chạy trên một thread riêng: mỗi lúc chỉ một lượt batch, request
+    đến sau xếp hàng và tự bỏ rerank (huỷ lượt của mình) khi chờ quá budget.
+    """
+
+    def __init__(self, model_name: str, batch_size: int, budget_ms: float, cache: RerankScoreCache) -> None:
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.cache = cache
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self.applied = 0
+        self.fallbacks = 0
+
+    def _get_model(self):
+        """Load CrossEncoder khi cần (sentence-transformers, thiết bị tự chọn GPU nếu có)."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    start = perf_counter()
+                    self._model = CrossEncoder(self.model_name)
+                    logger.info(f"Loaded rerank model {self.model_name} in {perf_counter() - start:.1f}s")
+        return self._model
+
+    def warm_up(self) -> Future:
+        """Load model trên thread rerank (gọi lúc server khởi động để request đầu không hết budget)."""
+        return self._executor.submit(self._get_model)
+
+    def _score(self, query: str, keys: List[ScoreKey], texts: List[str]) -> bool:
+        """
+        Một lượt batch cho các cặp (câu hỏi, chunk) chưa có điểm, ghi kết quả vào cache.
+
+        Lỗi được log và trả về False (không raise): request có thể đã thôi chờ.
+        """
+        try:
+            scores = self._get_model().predict(
+                [(query, text) for text in texts], batch_size=self.batch_size, show_progress_bar=False
+            )
+        except Exception as exc:  # noqa: BLE001 - rerank lỗi không làm hỏng retrieval
+            logger.error(f"Rerank thất bại: {exc}")
+            return False
+        self.cache.put_many({key: float(score) for key, score in zip(keys, scores)})
+        return True
+
+    def _prepare(self, query: str, chunks: List[RetrievedChunk]) -> Tuple[List[ScoreKey], Dict[ScoreKey, str]]:
+        """Khoá cache của từng chunk và các cặp (khoá → nội dung) chưa có điểm."""
+        query_key = normalize_query(query)
+        keys = [(query_key, _content_hash(chunk.content)) for chunk in chunks]
+        cached = self.cache.get_many(keys)
+        missing = {key: chunk.content for key, chunk, score in zip(keys, chunks, cached) if score is None}
+        return keys, missing
+
+    def _apply(
+        self, chunks: List[RetrievedChunk], keys: List[ScoreKey], start: float, scored: int
+    ) -> Tuple[List[RetrievedChunk], Dict[str, Any]]:
+        scores = self.cache.get_many(keys, count=False)
+        if any(score is None for score in scores):  # Cache vừa bị đẩy ra (rất hiếm): giữ thứ tự cũ
+            return self._fallback(chunks, start, "evicted")
+        order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+        reranked = [
+            replace(chunks[i], metadata={**(chunks[i].metadata or {}), "rerank_score": round(scores[i], 4)})
+            for i in order
+        ]
+        self.applied += 1
+        return reranked, {
+            "applied": True,
+            "candidates": len(chunks),
+            "scored": scored,
+            "cached": len(chunks) - scored,
+            "ms": round((perf_counter() - start) * 1000, 2),
+        }
+
+    def _fallback(self, chunks: List[RetrievedChunk], start: float, reason: str) -> Tuple[List[RetrievedChunk], Dict[str, Any]]:
+        self.fallbacks += 1
+        return chunks, {"applied": False, "reason": reason, "ms": round((perf_counter() - start) * 1000, 2)}
+
+    def _budget_s(self, budget_ms: Optional[float]) -> Optional[float]:
+        budget = self.budget_ms if budget_ms is None else budget_ms
+        return budget / 1000 if budget > 0 else None
+
+    def rerank(
+        self, query: str, chunks: List[RetrievedChunk], budget_ms: Optional[float] = None
+    ) -> Tuple[List[RetrievedChunk], Dict[str, Any]]:
+        """Sắp xếp lại chunks theo điểm cross-encoder; trả về (chunks, metadata của bước rerank)."""
+        start = perf_counter()
+        if len(chunks) < 2:
+            return chunks, {"applied": False, "reason": "too_few_candidates", "ms": 0.0}
+        keys, missing = self._prepare(query, chunks)
+        if missing:
+            future = self._executor.submit(self._score, query, list(missing), list(missing.values()))
+            try:
+                if not future.result(timeout=self._budget_s(budget_ms)):
+                    return self._fallback(chunks, start, "error")
+            except FuturesTimeout:
+                future.cancel()  # Chưa chạy thì bỏ: request sau không phải chờ lượt đã hết hạn
+                logger.warning(f"Rerank vượt budget ({len(missing)} cặp), giữ thứ tự cũ")
+                return self._fallback(chunks, start, "budget")
+        return self._apply(chunks, keys, start, len(missing))
+
+    async def arerank(
+        self, query: str, chunks: List[RetrievedChunk], budget_ms: Optional[float] = None
+    ) -> Tuple[List[RetrievedChunk], Dict[str, Any]]:
+        """Như rerank nhưng chờ trên event loop (lượt chấm điểm chạy trên thread rerank)."""
+        start = perf_counter()
+        if len(chunks) < 2:
+            return chunks, {"applied": False, "reason": "too_few_candidates", "ms": 0.0}
+        keys, missing = self._prepare(query, chunks)
+        if missing:
+            future = self._executor.submit(self._score, query, list(missing), list(missing.values()))
+            try:
+                # shield: hết budget thì chỉ thôi chờ, lượt đang chấm điểm vẫn chạy nốt và ghi cache
+                if not await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self._budget_s(budget_ms)):
+                    return self._fallback(chunks, start, "error")
+            except asyncio.TimeoutError:
+                future.cancel()  # Chưa chạy thì bỏ: request sau không phải chờ lượt đã hết hạn
+                logger.warning(f"Rerank vượt budget ({len(missing)} cặp), giữ thứ tự cũ")
+                return self._fallback(chunks, start, "budget")
+        return self._apply(chunks, keys, start, len(missing))
+
+    def stats(self) -> Dict[str, Any]:
+        """Số liệu để hiển thị ở /health."""
+        return {
+            "enabled": settings.rerank_enabled,
+            "model": self.model_name,
+            "model_loaded": self._model is not None,
+            "budget_ms": self.budget_ms,
+            "applied": self.applied,
+            "fallbacks": self.fallbacks,
+            "score_cache": self.cache.stats(),
+        }
+
+
+reranker = CrossEncoderReranker(
+    model_name=settings.rerank_model,
+    batch_size=settings.rerank_batch_size,
+    budget_ms=settings.rerank_budget_ms,
+    cache=RerankScoreCache(settings.rerank_cache_size),
+)
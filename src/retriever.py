@@ -1,14 +1,18 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import logging
 from dataclasses import dataclass, field
-from typing import Iterable, List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional
 
 import numpy as np
 
 from .config import settings
-from .embedder import _get_model  # sử dụng lại model embedding
-from .supabase_client import get_supabase_client
+from .query_cache import aencode_query, encode_query  # encode câu hỏi qua cache LRU dùng chung
+from .supabase_client import get_async_supabase_client, get_supabase_client
+from .vector_codec import decode_vectors
+
+logger = logging.getLogger(__name__)
 
 """Truy vấn Supabase để lấy các đoạn văn bản liên quan nhất tới câu hỏi."""
 
@@ -24,15 +28,6 @@ class RetrievedChunk:
     metadata: Dict[str, Any] = field(default_factory=dict)  # Thêm metadata field
 
 
-def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
-    """Tính cosine similarity giữa hai vector."""
-    norm_a = np.linalg.norm(a)
-    norm_b = np.linalg.norm(b)
-    if norm_a == 0 or norm_b == 0:
-        return 0.0
-    return float(np.dot(a, b) / (norm_a * norm_b))
-
-
 def retrieve_similar_chunks(query: str, document_id: str, top_k: int = 5) -> List[RetrievedChunk]:
     """Lấy top_k đoạn văn bản gần nhất với truy vấn theo cosine similarity."""
     if not query.strip():
@@ -52,40 +47,71 @@ def retrieve_similar_chunks(query: str, document_id: str, top_k: int = 5) -> Lis
     if not rows:
         return []
 
-    model = _get_model()
-    query_vector = model.encode([query])[0]
-    query_vector = np.asarray(query_vector, dtype=np.float32)
+    query_vector = encode_query(query)
+
+    return _rank_rows(query_vector, rows, top_k)
+
+
+def _build_embedding_matrix(
+    rows: List[Dict[str, Any]], dim: int
+) -> tuple[np.ndarray, List[Dict[str, Any]]]:
+    """
+    Gom toàn bộ embedding của các row vào MỘT ma trận float32 liên tục (n, dim).
+
+    Row nào thiếu embedding, sai định dạng hoặc sai số chiều sẽ bị bỏ qua.
+    Trả về (matrix, kept_rows) với kept_rows[i] tương ứng matrix[i].
+    """
+    matrix, kept = decode_vectors([row.get("embedding") for row in rows], dim)
+    return matrix, [rows[i] for i in kept]
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Chuẩn hoá L2 từng hàng (in-place); hàng có norm 0 giữ nguyên là vector 0."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def _score_matrix(query_vector: np.ndarray, normalized_matrix: np.ndarray) -> np.ndarray:
+    """Cosine similarity của query với mọi hàng của ma trận đã chuẩn hoá: một phép matvec."""
+    query_norm = np.linalg.norm(query_vector)
+    if query_norm == 0:
+        return np.zeros(normalized_matrix.shape[0], dtype=np.float32)
+    return normalized_matrix @ (query_vector / query_norm)
 
-    scored: list[RetrievedChunk] = []
-    for row in rows:
-        embedding_data = row.get("embedding")
-        if embedding_data is None:
-            continue
-
-        if isinstance(embedding_data, str):
-            try:
-                embedding_data = json.loads(embedding_data)
-            except json.JSONDecodeError:
-                continue
-
-        if not isinstance(embedding_data, Iterable):
-            continue
-
-        embedding = np.asarray(list(embedding_data), dtype=np.float32)
-        if embedding.size == 0:
-            continue
-        score = _cosine_similarity(query_vector, embedding)
-        scored.append(
-            RetrievedChunk(
-                content=row["content"],
-                chunk_index=row.get("chunk_index", 0) or 0,
-                page_number=row.get("page_number"),
-                similarity=score,
-            )
-        )
 
-    scored.sort(key=lambda item: item.similarity, reverse=True)
-    return scored[: max(top_k, 1)]
+def _top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Chọn chỉ số top_k điểm cao nhất bằng partial selection (argpartition), rồi sort phần nhỏ đó."""
+    k = min(max(top_k, 1), scores.shape[0])
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _rank_rows(query_vector: np.ndarray, rows: List[Dict[str, Any]], top_k: int) -> List[RetrievedChunk]:
+    """
+    Chấm điểm cosine cho tất cả rows bằng một phép nhân ma trận-vector.
+
+    Tương đương vòng lặp tính cosine từng row + sort toàn bộ,
+    nhưng chỉ decode một lần vào ma trận liên tục và dùng argpartition để lấy top_k.
+    """
+    query_vector = np.asarray(query_vector, dtype=np.float32).ravel()
+    matrix, kept_rows = _build_embedding_matrix(rows, query_vector.shape[0])
+    if not kept_rows:
+        return []
+
+    scores = _score_matrix(query_vector, _normalize_rows(matrix))
+    return [
+        RetrievedChunk(
+            content=kept_rows[idx]["content"],
+            chunk_index=kept_rows[idx].get("chunk_index", 0) or 0,
+            page_number=kept_rows[idx].get("page_number"),
+            similarity=float(scores[idx]),
+        )
+        for idx in _top_k_indices(scores, top_k)
+    ]
 
 
 def retrieve_similar_chunks_by_user(query: str, user_id: str, top_k: int = 5) -> List[RetrievedChunk]:
@@ -114,10 +140,17 @@ def retrieve_similar_chunks_by_user(query: str, user_id: str, top_k: int = 5) ->
 
     # Bước 1: Encode câu hỏi thành vector embedding
     # Sử dụng sentence-transformers model (paraphrase-multilingual-mpnet-base-v2)
-    # Output: vector 768 chiều
-    model = _get_model()
-    query_vector = model.encode([query])[0]  # Encode 1 câu → lấy vector đầu tiên
-    query_vector = np.asarray(query_vector, dtype=np.float32)  # Chuyển sang float32
+    # Output: vector 768 chiều float32 (qua cache: câu hỏi lặp lại không phải encode lại)
+    query_vector = encode_query(query)
+
+    # Backend ANN in-process (tuỳ chọn): tìm trên HNSW index của user thay vì RPC
+    if settings.retrieval_backend == "hnsw":
+        try:
+            from .ann_index import get_user_index
+
+            return get_user_index(user_id).search(query_vector, top_k=top_k)
+        except Exception as exc:  # noqa: BLE001 - fallback về RPC chính xác
+            logger.warning(f"HNSW backend failed, falling back to RPC: {exc}")
     
     # Bước 2: Chuyển numpy array thành Python list để gửi qua RPC
     # Supabase RPC cần list, không nhận numpy array
@@ -141,13 +174,16 @@ def retrieve_similar_chunks_by_user(query: str, user_id: str, top_k: int = 5) ->
     ).execute()
     
     # Bước 4: Parse kết quả từ RPC
-    rows = response.data or []
-    if not rows:
-        # Không tìm thấy documents nào của user hoặc không có chunk tương đồng
-        return []
-    
-    # Bước 5: Chuyển đổi kết quả thành RetrievedChunk objects
-    # RPC đã tính similarity và sort rồi, chỉ cần parse data
+    return _user_rows_to_chunks(response.data or [])
+
+
+def _user_rows_to_chunks(rows: List[Dict[str, Any]]) -> List[RetrievedChunk]:
+    """
+    Chuyển kết quả RPC match_embeddings_by_user thành RetrievedChunk.
+
+    RPC đã tính similarity và sort rồi, chỉ cần parse data; rows rỗng = user
+    không có document nào hoặc không có chunk tương đồng.
+    """
     chunks: list[RetrievedChunk] = []
     for row in rows:
         chunks.append(
@@ -158,10 +194,44 @@ def retrieve_similar_chunks_by_user(query: str, user_id: str, top_k: int = 5) ->
                 similarity=row.get("similarity", 0.0) or 0.0,  # Điểm tương đồng (0-1)
             )
         )
-    
     return chunks
 
 
+async def aretrieve_similar_chunks_by_user(query: str, user_id: str, top_k: int = 5) -> List[RetrievedChunk]:
+    """
+    Như retrieve_similar_chunks_by_user nhưng không chặn event loop.
+
+    Encode qua aencode_query (thread encode riêng), RPC qua Supabase AsyncClient;
+    backend hnsw build index (lần đầu, gọi Supabase sync) trong thread riêng.
+    """
+    if not query.strip():
+        raise ValueError("Query không được để trống")
+    if not user_id.strip():
+        raise ValueError("user_id không được để trống")
+
+    query_vector = await aencode_query(query)
+
+    if settings.retrieval_backend == "hnsw":
+        try:
+            from .ann_index import get_user_index
+
+            index = await asyncio.to_thread(get_user_index, user_id)
+            return index.search(query_vector, top_k=top_k)
+        except Exception as exc:  # noqa: BLE001 - fallback về RPC chính xác
+            logger.warning(f"HNSW backend failed, falling back to RPC: {exc}")
+
+    client = await get_async_supabase_client()
+    response = await client.rpc(
+        'match_embeddings_by_user',
+        {
+            'query_embedding': query_vector.tolist(),
+            'user_id_filter': user_id,
+            'match_count': max(top_k, 1)
+        }
+    ).execute()
+    return _user_rows_to_chunks(response.data or [])
+
+
 def retrieve_similar_chunks_by_document(
     query: str, 
     document_id: str, 
@@ -192,10 +262,8 @@ def retrieve_similar_chunks_by_document(
     if not document_id.strip():
         raise ValueError("document_id không được để trống")
 
-    # Encode câu hỏi thành vector
-    model = _get_model()
-    query_vector = model.encode([query])[0]
-    query_vector = np.asarray(query_vector, dtype=np.float32)
+    # Encode câu hỏi thành vector (qua cache)
+    query_vector = encode_query(query)
     query_embedding_list = query_vector.tolist()
     
     # Gọi RPC function với document filter
@@ -210,10 +278,11 @@ def retrieve_similar_chunks_by_document(
     ).execute()
     
     # Parse kết quả
-    rows = response.data or []
-    if not rows:
-        return []
-    
+    return _document_rows_to_chunks(response.data or [])
+
+
+def _document_rows_to_chunks(rows: List[Dict[str, Any]]) -> List[RetrievedChunk]:
+    """Chuyển kết quả RPC match_embeddings_by_document thành RetrievedChunk (kèm metadata tài liệu)."""
     chunks: list[RetrievedChunk] = []
     for row in rows:
         chunks.append(
@@ -231,3 +300,27 @@ def retrieve_similar_chunks_by_document(
         )
     
     return chunks
+
+
+async def aretrieve_similar_chunks_by_document(
+    query: str,
+    document_id: str,
+    top_k: int = 5
+) -> List[RetrievedChunk]:
+    """Như retrieve_similar_chunks_by_document nhưng không chặn event loop."""
+    if not query.strip():
+        raise ValueError("Query không được để trống")
+    if not document_id.strip():
+        raise ValueError("document_id không được để trống")
+
+    query_vector = await aencode_query(query)
+    client = await get_async_supabase_client()
+    response = await client.rpc(
+        'match_embeddings_by_document',
+        {
+            'query_embedding': query_vector.tolist(),
+            'document_id_filter': document_id,
+            'match_count': max(top_k, 1)
+        }
+    ).execute()
+    return _document_rows_to_chunks(response.data or [])
@@ -1,19 +1,25 @@
 """Utilities cho retry logic với exponential backoff."""
+import asyncio
 import time
 import logging
 from functools import wraps
-from typing import Callable, Type, Tuple, TypeVar, ParamSpec
+from typing import Awaitable, Callable, Type, Tuple, TypeVar, ParamSpec
 
 logger = logging.getLogger(__name__)
 
 P = ParamSpec('P')
 T = TypeVar('T')
 
+def _out_of_time(started: float, delay: float, max_elapsed: float | None) -> bool:
+    return max_elapsed is not None and time.monotonic() - started + delay >= max_elapsed
+
+
 def retry_with_backoff(
     max_retries: int = 3,
     initial_delay: float = 1.0,
     backoff_factor: float = 2.0,
-    exceptions: Tuple[Type[Exception], ...] = (Exception,)
+    exceptions: Tuple[Type[Exception], ...] = (Exception,),
+    max_elapsed: float | None = None,
 ):
     """
     Decorator retry với exponential backoff.
@@ -23,6 +29,8 @@ def retry_with_backoff(
         initial_delay: Delay ban đầu tính bằng giây (mặc định 1.0s)
         backoff_factor: Hệ số nhân cho mỗi lần retry (mặc định 2.0)
         exceptions: Tuple các exception cần retry (mặc định tất cả Exception)
+        max_elapsed: Không retry nữa nếu lần thử sau bắt đầu muộn hơn max_elapsed giây
+            kể từ lần gọi đầu (None = không giới hạn)
     
     Example:
         @retry_with_backoff(max_retries=3, exceptions=(requests.RequestException,))
@@ -40,6 +48,7 @@ def retry_with_backoff(
         def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
             delay = initial_delay
             last_exception = None
+            started = time.monotonic()
             
             for attempt in range(max_retries + 1):
                 try:
@@ -47,9 +56,9 @@ def retry_with_backoff(
                 except exceptions as e:
                     last_exception = e
                     
-                    if attempt == max_retries:
+                    if attempt == max_retries or _out_of_time(started, delay, max_elapsed):
                         logger.error(
-                            f"{func.__name__} failed after {max_retries} retries: {e}"
+                            f"{func.__name__} failed after {attempt + 1} attempts: {e}"
                         )
                         raise
                     
@@ -68,6 +77,45 @@ def retry_with_backoff(
     return decorator
 
 
+def async_retry_with_backoff(
+    max_retries: int = 3,
+    initial_delay: float = 1.0,
+    backoff_factor: float = 2.0,
+    exceptions: Tuple[Type[Exception], ...] = (Exception,),
+    max_elapsed: float | None = None,
+):
+    """
+    Phiên bản async của retry_with_backoff cho coroutine function.
+
+    Chờ bằng asyncio.sleep nên không chặn event loop giữa các lần retry.
+    """
+    def decorator(func: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+        @wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            delay = initial_delay
+            started = time.monotonic()
+            for attempt in range(max_retries + 1):
+                try:
+                    return await func(*args, **kwargs)
+                except exceptions as e:
+                    if attempt == max_retries or _out_of_time(started, delay, max_elapsed):
+                        logger.error(
+                            f"{func.__name__} failed after {attempt + 1} attempts: {e}"
+                        )
+                        raise
+
+                    logger.warning(
+                        f"{func.__name__} failed (attempt {attempt + 1}/{max_retries + 1}), "
+                        f"retrying in {delay:.1f}s: {e}"
+                    )
+                    await asyncio.sleep(delay)
+                    delay *= backoff_factor
+            raise AssertionError("unreachable")
+
+        return wrapper
+    return decorator
+
+
 class CircuitBreaker:
     """
     Circuit breaker pattern để tránh gọi service bị lỗi liên tục.
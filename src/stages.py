@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+from typing import Any, Callable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+"""
+Chạy nhiều stage song song (mỗi stage một thread) nối với nhau bằng hàng đợi có giới hạn.
+
+Hàng đợi đầy thì stage phía trước phải chờ (back-pressure), nên bộ nhớ bị chặn
+bởi tổng kích thước hàng đợi. Lỗi ở một stage sẽ huỷ toàn bộ các stage còn lại
+và được raise lại ở thread gọi run().
+"""
+
+_POLL_SECONDS = 0.1
+
+
+class StageCancelled(Exception):
+    """Dừng một stage vì stage khác đã lỗi."""
+
+
+class StageRunner:
+    """Điều phối các stage: put/drain có back-pressure và lan truyền lỗi."""
+
+    DONE = object()  # Sentinel báo stage trước đã xong
+
+    def __init__(self) -> None:
+        self._cancelled = threading.Event()
+        self._error: BaseException | None = None
+        self._error_lock = threading.Lock()
+
+    def queue(self, maxsize: int) -> "queue.Queue[Any]":
+        """Tạo hàng đợi giữa hai stage (maxsize >= 1)."""
+        return queue.Queue(maxsize=max(maxsize, 1))
+
+    def put(self, q: "queue.Queue[Any]", item: Any) -> None:
+        """Đưa item vào hàng đợi, chờ nếu đầy; dừng nếu pipeline đã bị huỷ."""
+        while True:
+            if self._cancelled.is_set():
+                raise StageCancelled()
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def drain(self, q: "queue.Queue[Any]") -> Iterator[Any]:
+        """Lấy lần lượt item từ hàng đợi cho tới sentinel DONE."""
+        while True:
+            if self._cancelled.is_set():
+                raise StageCancelled()
+            try:
+                item = q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if item is self.DONE:
+                return
+            yield item
+
+    def _wrap(self, stage: Callable[[], None]) -> Callable[[], None]:
+        def target() -> None:
+            try:
+                stage()
+            except StageCancelled:
+                pass
+            except BaseException as exc:  # noqa: BLE001 - ghi lại lỗi đầu tiên rồi huỷ pipeline
+                with self._error_lock:
+                    if self._error is None:
+                        self._error = exc
+                        logger.error(f"Stage {stage.__name__} failed: {exc}")
+                self._cancelled.set()
+        return target
+
+    def run(self, stages: List[Callable[[], None]]) -> None:
+        """Chạy mọi stage đồng thời, chờ tất cả kết thúc; raise lỗi đầu tiên nếu có."""
+        threads = [
+            threading.Thread(target=self._wrap(stage), name=f"stage-{stage.__name__}", daemon=True)
+            for stage in stages
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
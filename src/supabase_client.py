@@ -1,11 +1,14 @@
 from __future__ import annotations
+import asyncio
+import json
 import logging
 from pathlib import Path
 from typing import Any
 
-from supabase import create_client, Client
+from supabase import AsyncClient, acreate_client, create_client, Client
 from postgrest.exceptions import APIError
 
+from .batch_writer import BatchWriter, WriteCursor, WriteStats
 from .config import settings
 from .retry_utils import retry_with_backoff
 
@@ -25,6 +28,24 @@ def get_supabase_client() -> Client:
     return _supabase_client
 
 
+_async_supabase_client: AsyncClient | None = None
+_async_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+async def get_async_supabase_client() -> AsyncClient:
+    """
+    Supabase AsyncClient cho code chạy trên event loop (RAG servers).
+
+    Client async gắn với event loop nên được tạo một lần cho mỗi loop.
+    """
+    global _async_supabase_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_supabase_client is None or _async_client_loop is not loop:
+        _async_supabase_client = await acreate_client(settings.supabase_url, settings.supabase_service_key)
+        _async_client_loop = loop
+    return _async_supabase_client
+
+
 @retry_with_backoff(max_retries=3, initial_delay=1.0)
 def download_file(file_path: str, destination: Path) -> Path:
     """Tải tệp từ bucket Supabase về đường dẫn cục bộ được chỉ định (với retry logic)."""
@@ -73,23 +94,140 @@ def upsert_embedding_status(document_id: str, status: str, error_message: str |
     client.table("embedding_status").upsert(status_payload, on_conflict="document_id").execute()
 
 
+def fetch_ingest_fingerprint(document_id: str) -> dict[str, Any] | None:
+    """Đọc fingerprint (checksum + model + tham số chunk) của lần ingest thành công gần nhất."""
+    client = get_supabase_client()
+    try:
+        response = (
+            client.table("documents")
+            .select("embedding_fingerprint")
+            .eq("id", document_id)
+            .limit(1)
+            .execute()
+        )
+    except APIError as exc:
+        if "embedding_fingerprint" not in str(exc).lower():
+            raise
+        logger.warning("documents.embedding_fingerprint column missing; whole-document skip disabled")
+        return None
+
+    data = response.data
+    fingerprint = data[0].get("embedding_fingerprint") if data else None
+    if isinstance(fingerprint, str):
+        fingerprint = json.loads(fingerprint)
+    return fingerprint
+
+
+def save_ingest_fingerprint(document_id: str, fingerprint: dict[str, Any] | None) -> None:
+    """Ghi (hoặc xoá khi None) fingerprint ingest; bỏ qua nếu bảng chưa có cột embedding_fingerprint."""
+    client = get_supabase_client()
+    try:
+        client.table("documents").update({"embedding_fingerprint": fingerprint}).eq("id", document_id).execute()
+    except APIError as exc:
+        if "embedding_fingerprint" not in str(exc).lower():
+            raise
+        logger.warning("documents.embedding_fingerprint column missing; fingerprint not saved")
+
+
 def delete_existing_embeddings(document_id: str) -> None:
     """Xoá toàn bộ embedding cũ của tài liệu trước khi ghi mới."""
     client = get_supabase_client()
     client.table("document_embeddings").delete().eq("document_id", document_id).execute()
 
 
-@retry_with_backoff(max_retries=3, initial_delay=1.0, exceptions=(APIError, Exception))
-def insert_embeddings(rows: list[dict[str, Any]]) -> None:
-    """Chèn danh sách embedding với retry logic và batch processing."""
-    if not rows:
-        return
-    
+def fetch_existing_chunks(
+    document_id: str, page_size: int = 1000, columns: str = "id, content, chunk_index, page_number"
+) -> list[dict[str, Any]]:
+    """Lấy id, content, chunk_index, page_number (hoặc columns) của các chunk đã lưu (không tải embedding)."""
+    client = get_supabase_client()
+    rows: list[dict[str, Any]] = []
+    start = 0
+    while True:
+        response = (
+            client.table("document_embeddings")
+            .select(columns)
+            .eq("document_id", document_id)
+            .order("id")
+            .range(start, start + page_size - 1)
+            .execute()
+        )
+        batch = response.data or []
+        rows.extend(batch)
+        if len(batch) < page_size:
+            return rows
+        start += page_size
+
+
+def delete_embeddings_by_ids(ids: list[Any], batch_size: int = 200) -> None:
+    """Xoá các chunk cũ theo id (chia batch để URL filter không quá dài)."""
+    client = get_supabase_client()
+    for i in range(0, len(ids), batch_size):
+        client.table("document_embeddings").delete().in_("id", ids[i:i + batch_size]).execute()
+
+
+def update_chunk_positions(document_id: str, updates: list[dict[str, Any]], batch_size: int = 1000) -> None:
+    """
+    Cập nhật chunk_index/page_number cho các chunk được tái sử dụng nhưng đổi vị trí.
+
+    Mỗi batch là một lời gọi RPC update_chunk_positions (docs/SQL_UPDATE_CHUNK_POSITIONS.sql);
+    nếu chưa tạo function thì fallback cập nhật từng chunk.
+    """
+    client = get_supabase_client()
+    for i in range(0, len(updates), batch_size):
+        batch = [
+            {"id": str(item["id"]), "chunk_index": item["chunk_index"], "page_number": item["page_number"]}
+            for item in updates[i:i + batch_size]
+        ]
+        try:
+            client.rpc("update_chunk_positions", {"p_document_id": document_id, "updates": batch}).execute()
+        except APIError as exc:
+            if "update_chunk_positions" not in str(exc).lower():
+                raise
+            logger.warning("RPC update_chunk_positions missing; updating moved chunks one by one")
+            _update_chunk_positions_by_row(client, updates[i:])
+            return
+
+
+def _update_chunk_positions_by_row(client: Client, updates: list[dict[str, Any]]) -> None:
+    for item in updates:
+        (
+            client.table("document_embeddings")
+            .update({"chunk_index": item["chunk_index"], "page_number": item["page_number"]})
+            .eq("id", item["id"])
+            .execute()
+        )
+
+
+def insert_embedding_batch(rows: list[dict[str, Any]]) -> None:
+    """Chèn MỘT batch embedding (không retry; BatchWriter retry từng batch)."""
     client = get_supabase_client()
-    
-    # Batch insert để tránh timeout với dataset lớn
-    BATCH_SIZE = 100
-    for i in range(0, len(rows), BATCH_SIZE):
-        batch = rows[i:i + BATCH_SIZE]
-        client.table("document_embeddings").insert(batch).execute()
-        logger.info(f"Inserted batch {i//BATCH_SIZE + 1}/{(len(rows)-1)//BATCH_SIZE + 1}: {len(batch)} embeddings")
+    client.table("document_embeddings").insert(rows).execute()
+
+
+def new_embedding_writer(cursor: WriteCursor | None = None) -> BatchWriter:
+    """BatchWriter ghi vào document_embeddings theo cấu hình INSERT_* / INGEST_INSERT_BATCH_SIZE."""
+    return BatchWriter(
+        insert_embedding_batch,
+        max_in_flight=settings.insert_max_in_flight,
+        max_batch_bytes=settings.insert_batch_max_kb * 1024,
+        max_batch_rows=settings.ingest_insert_batch_size,
+        cursor=cursor,
+    )
+
+
+def insert_embeddings(rows: list[dict[str, Any]], cursor: WriteCursor | None = None) -> WriteStats:
+    """
+    Chèn danh sách embedding: batch theo dung lượng payload, gửi song song, retry từng batch.
+
+    Nếu một batch vẫn lỗi sau khi retry, raise BatchWriteError kèm cursor; gọi lại
+    với cùng rows và cursor đó sẽ chỉ ghi các batch chưa thành công.
+    """
+    if not rows:
+        return WriteStats()
+
+    stats = new_embedding_writer(cursor).write(rows)
+    logger.info(
+        f"Inserted {stats.rows} embeddings in {stats.batches} batches "
+        f"({stats.bytes / 1024:.0f} KB, {stats.rows_per_second:.0f} rows/s)"
+    )
+    return stats
@@ -1,10 +1,17 @@
 from __future__ import annotations
 import re
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Iterable
+from typing import Callable, Iterable, Iterator, List, Tuple
 from pypdf import PdfReader
 import logging
 
+from .config import settings
+
 # Thiết lập logging để theo dõi lỗi thay vì print
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -60,12 +67,137 @@ def clean_text(text: str) -> str:
     return text
 
 
-def extract_pdf_text(file_path: Path) -> Iterable[DocumentChunk]:
+def _extract_page(page, idx: int, file_name: str) -> str | None:
+    """Trích xuất + làm sạch một trang; trả về None nếu trang trống hoặc lỗi (lỗi chỉ được log)."""
+    try:
+        raw_text = page.extract_text() or ""
+
+        # Áp dụng hàm làm sạch
+        cleaned_text = clean_text(raw_text)
+
+        # Bỏ qua trang trắng hoặc trang quá ít thông tin (< 5 ký tự)
+        if len(cleaned_text) < 5:
+            return None
+        return cleaned_text
+    except Exception as e:
+        # Nếu lỗi 1 trang, log lại và tiếp tục trang sau (không dừng cả chương trình)
+        logger.warning(f"Error extracting page {idx} of {file_name}: {e}")
+        return None
+
+
+def _extract_page_range(file_str: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Worker (chạy trong process con): trích xuất các trang [start, end), đánh số từ 1."""
+    reader = PdfReader(file_str)
+    file_name = Path(file_str).name
+    results: List[Tuple[int, str]] = []
+    for idx in range(start, end):
+        text = _extract_page(reader.pages[idx - 1], idx, file_name)
+        if text is not None:
+            results.append((idx, text))
+    return results
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool dùng chung giữa các tài liệu (spawn: an toàn khi process cha có nhiều thread)."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Bỏ pool đã hỏng (worker chết): lần gọi _get_pool sau sẽ tạo pool mới."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _extract_parallel(
+    file_str: str, total_pages: int, workers: int, pages_per_task: int
+) -> Iterator[Tuple[int, str]]:
+    """
+    Chia trang thành các đoạn pages_per_task cho process pool, yield kết quả ĐÚNG thứ tự trang.
+
+    Chỉ giữ tối đa 2 * workers task đang chạy/chờ lấy kết quả để bộ nhớ không
+    phụ thuộc số trang. Task lỗi cả đoạn được chạy lại tuần tự. Worker chết
+    (BrokenProcessPool) thì pool bị bỏ để tài liệu sau tạo pool mới, các đoạn
+    còn lại của tài liệu này được trích xuất tuần tự trong process hiện tại.
+    """
+    pool: ProcessPoolExecutor | None = _get_pool(workers)
+    ranges = iter(
+        (start, min(start + pages_per_task, total_pages + 1))
+        for start in range(1, total_pages + 1, pages_per_task)
+    )
+    pending: deque[Tuple[int, int, Future | None]] = deque()
+
+    def broken(error: BaseException) -> None:
+        nonlocal pool
+        if pool is not None:
+            logger.warning(f"PDF extraction pool is broken, continuing in-process: {error}")
+            _discard_pool(pool)
+            pool = None
+
+    def submit_next() -> None:
+        page_range = next(ranges, None)
+        if page_range is None:
+            return
+        future = None
+        if pool is not None:
+            try:
+                future = pool.submit(_extract_page_range, file_str, *page_range)
+            except RuntimeError as e:  # BrokenProcessPool, hoặc pool vừa bị thread khác shutdown
+                broken(e)
+        pending.append((*page_range, future))
+
+    for _ in range(2 * workers):
+        submit_next()
+
+    while pending:
+        start, end, future = pending.popleft()
+        results = None
+        if future is not None:
+            try:
+                results = future.result()
+            except BrokenProcessPool as e:
+                broken(e)
+            except Exception as e:
+                logger.warning(f"Parallel extraction of pages {start}-{end - 1} failed, retrying in-process: {e}")
+        if results is None:
+            results = _extract_page_range(file_str, start, end)
+        submit_next()
+        yield from results
+
+
+def extract_pdf_text(
+    file_path: Path,
+    workers: int | None = None,
+    pages_per_task: int | None = None,
+    on_page_count: Callable[[int], None] | None = None,
+) -> Iterable[DocumentChunk]:
     """
     Đọc PDF và yield các khối nội dung theo từng trang.
-    Bao gồm xử lý ngoại lệ (File không tồn tại, File lỗi, File bị mã hóa).
+    Trang lỗi chỉ được log và bỏ qua; file không tồn tại thì không yield gì;
+    lỗi đọc cả file (file hỏng, bị mã hoá, ...) được log rồi raise lại để
+    ingest thất bại thay vì lưu tài liệu thiếu trang.
+
+    PDF có từ PDF_PARALLEL_MIN_PAGES trang trở lên được trích xuất song song
+    bằng process pool (workers, mặc định PDF_EXTRACT_WORKERS), vẫn giữ thứ tự trang.
+    on_page_count nhận tổng số trang ngay khi mở được file (dùng cho progress).
     """
     file_str = str(file_path)
+    workers = settings.pdf_extract_workers if workers is None else workers
+    pages_per_task = pages_per_task or settings.pdf_pages_per_task
     
     try:
         # Kiểm tra file tồn tại
@@ -79,29 +211,27 @@ def extract_pdf_text(file_path: Path) -> Iterable[DocumentChunk]:
         file_name = file_path.name
 
         total_pages = len(reader.pages)
-        logger.info(f"Start processing {file_name}: {total_pages} pages.")
+        if on_page_count is not None:
+            on_page_count(total_pages)
+        parallel = workers > 1 and total_pages >= settings.pdf_parallel_min_pages
+        logger.info(f"Start processing {file_name}: {total_pages} pages{f' ({workers} workers)' if parallel else ''}.")
 
-        for idx, page in enumerate(reader.pages, start=1):
-            try:
-                raw_text = page.extract_text() or ""
-                
-                # Áp dụng hàm làm sạch
-                cleaned_text = clean_text(raw_text)
-                
-                # Bỏ qua trang trắng hoặc trang quá ít thông tin (< 5 ký tự)
-                if len(cleaned_text) < 5:
-                    continue
-                
-                yield DocumentChunk(
-                    text=cleaned_text, 
-                    page_number=idx,
-                    source_file=file_name
-                )
-            except Exception as e:
-                # Nếu lỗi 1 trang, log lại và tiếp tục trang sau (không dừng cả chương trình)
-                logger.warning(f"Error extracting page {idx} of {file_name}: {e}")
-                continue
+        if parallel:
+            pages = _extract_parallel(file_str, total_pages, workers, pages_per_task)
+        else:
+            pages = (
+                (idx, text)
+                for idx, page in enumerate(reader.pages, start=1)
+                if (text := _extract_page(page, idx, file_name)) is not None
+            )
+
+        for idx, cleaned_text in pages:
+            yield DocumentChunk(
+                text=cleaned_text,
+                page_number=idx,
+                source_file=file_name
+            )
                 
     except Exception as e:
         logger.error(f"Critical error processing file {file_str}: {e}")
-        return
+        raise
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import io
+import json
+import logging
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+"""
+Mã hoá / giải mã vector embedding khi đi qua PostgREST.
+
+Ghi: pgvector nhận literal dạng chuỗi "[0.012345,-0.067890,...]" cho cột vector;
+định dạng số thập phân cố định ngắn hơn nhiều so với JSON list float (repr đầy đủ
+của float64) và được format cho cả ma trận trong một lần gọi.
+Đọc: PostgREST trả cột vector dưới dạng chuỗi cùng định dạng; parse cả lô bằng
+parser C của numpy thay cho json.loads từng dòng.
+"""
+
+WIRE_FORMATS = ("json", "text")
+
+
+def encode_vectors(matrix: np.ndarray, wire_format: str = "text", precision: int = 6) -> List[Any]:
+    """
+    Mã hoá từng hàng của ma trận (n, dim) để gửi qua PostgREST.
+
+    Args:
+        matrix: Ma trận float32 (n, dim)
+        wire_format: "text" = literal pgvector với `precision` chữ số thập phân; "json" = list float (cách cũ)
+        precision: Số chữ số sau dấu phẩy cho định dạng "text"
+    """
+    if len(matrix) == 0:
+        return []
+    if wire_format == "json":
+        return matrix.tolist()
+    if wire_format != "text":
+        raise ValueError(f"Unknown embedding wire format: {wire_format!r} (expected one of {WIRE_FORMATS})")
+    buffer = io.StringIO()
+    np.savetxt(buffer, matrix, fmt=f"%.{precision}f", delimiter=",")
+    return [f"[{line}]" for line in buffer.getvalue().splitlines()]
+
+
+def decode_vector(data: Any) -> Optional[np.ndarray]:
+    """Giải mã một embedding (literal pgvector, chuỗi JSON hoặc list) thành vector float32; None nếu không hợp lệ."""
+    if data is None:
+        return None
+    if isinstance(data, str):
+        text = data.strip()
+        if not (text.startswith("[") and text.endswith("]")):
+            return None
+        try:
+            vector = np.array(text[1:-1].split(","), dtype=np.float32)
+        except ValueError:
+            try:
+                vector = np.asarray(json.loads(text), dtype=np.float32)
+            except (json.JSONDecodeError, TypeError, ValueError):
+                return None
+    else:
+        try:
+            vector = np.asarray(list(data), dtype=np.float32)
+        except (TypeError, ValueError):
+            return None
+    if vector.ndim != 1 or vector.size == 0:
+        return None
+    return vector
+
+
+def decode_vectors(values: Sequence[Any], dim: int) -> tuple[np.ndarray, List[int]]:
+    """
+    Giải mã cả lô embedding thành ma trận float32 (k, dim) liên tục.
+
+    Nếu mọi giá trị là literal cùng số chiều, parse một lần bằng np.loadtxt;
+    ngược lại giải mã từng dòng và bỏ các dòng sai định dạng / sai số chiều.
+
+    Returns:
+        (ma trận, chỉ số trong `values` của từng hàng được giữ lại)
+    """
+    if values and all(isinstance(value, str) for value in values):
+        try:
+            matrix = np.loadtxt(
+                [value.strip()[1:-1] for value in values], delimiter=",", dtype=np.float32, ndmin=2
+            )
+            if matrix.shape == (len(values), dim):
+                return matrix, list(range(len(values)))
+        except ValueError:
+            logger.debug("Batch vector decode failed, falling back to per-row decode")
+
+    matrix = np.empty((len(values), dim), dtype=np.float32)
+    kept: List[int] = []
+    for i, value in enumerate(values):
+        vector = decode_vector(value)
+        if vector is None or vector.shape[0] != dim:
+            continue
+        matrix[len(kept)] = vector
+        kept.append(i)
+    return matrix[: len(kept)], kept
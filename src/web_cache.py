@@ -0,0 +1,132 @@
+"""
+Cache kết quả web search (Tavily) cho HybridRetriever: LRU + TTL và single-flight.
+
+Nhiều request đồng thời cùng một khoá (câu hỏi chuẩn hoá, số kết quả) chỉ gọi
+Tavily một lần; các request còn lại chờ kết quả của lần gọi đang chạy, kể cả
+khi trộn lẫn đường sync (thread) và async (event loop). Lỗi không được cache:
+mọi request đang chờ nhận cùng exception, request sau sẽ gọi lại.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .config import settings
+
+
+WebResults = Tuple[Any, ...]  # Document của Tavily (dùng chung giữa các request, không sửa)
+
+
+class WebResultCache:
+    """LRU có giới hạn kích thước và TTL, kèm bảng lời gọi đang chạy; an toàn đa luồng."""
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl  # 0 = không lưu kết quả, chỉ gộp lời gọi đồng thời
+        self._entries: OrderedDict[Hashable, tuple[float, WebResults]] = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0   # Số lần thực sự gọi Tavily
+        self.shared = 0   # Số request dùng chung lời gọi đang chạy
+
+    def _claim(self, key: Hashable) -> tuple[Optional[WebResults], Optional[Future], bool]:
+        """Trả về (kết quả cache, future, là leader?) cho khoá."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], None, False
+            if entry is not None:
+                del self._entries[key]
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self.shared += 1
+                return None, future, False
+            future = Future()
+            self._inflight[key] = future
+            self.misses += 1
+            return None, future, True
+
+    def _settle(self, key: Hashable, future: Future, results: WebResults | None, error: BaseException | None) -> None:
+        """Leader xong: lưu kết quả (nếu thành công) rồi đánh thức các request đang chờ."""
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is None and self.ttl > 0:
+                self._entries[key] = (monotonic(), results)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        if error is None:
+            future.set_result(results)
+        else:
+            future.set_exception(error)
+
+    def get_or_fetch(self, key: Hashable, fetch: Callable[[], List[Any]]) -> List[Any]:
+        """Lấy kết quả từ cache, chờ lời gọi đang chạy, hoặc tự gọi fetch (sync)."""
+        cached, future, leader = self._claim(key)
+        if cached is not None:
+            return list(cached)
+        if not leader:
+            return list(future.result())
+
+        try:
+            results = tuple(fetch())
+        except Exception as exc:
+            self._settle(key, future, None, exc)
+            raise
+        self._settle(key, future, results, None)
+        return list(results)
+
+    async def aget_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[List[Any]]]) -> List[Any]:
+        """Như get_or_fetch nhưng chờ/gọi trên event loop."""
+        cached, future, leader = self._claim(key)
+        if cached is not None:
+            return list(cached)
+        if not leader:
+            return list(await asyncio.wrap_future(future))
+
+        try:
+            results = tuple(await fetch())
+        except Exception as exc:
+            self._settle(key, future, None, exc)
+            raise
+        except BaseException:
+            # Leader bị huỷ (client ngắt kết nối): request đang chờ không được treo mãi
+            self._settle(key, future, None, RuntimeError("Web search cancelled"))
+            raise
+        self._settle(key, future, results, None)
+        return list(results)
+
+    def clear(self) -> None:
+        """Xoá toàn bộ entry (giữ nguyên bộ đếm và lời gọi đang chạy)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Số liệu hit/miss/shared để hiển thị ở /health."""
+        with self._lock:
+            total = self.hits + self.misses + self.shared
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "hit_rate": round((self.hits + self.shared) / total, 4) if total else 0.0,
+                "size": len(self._entries),
+                "in_flight": len(self._inflight),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+            }
+
+
+web_result_cache = WebResultCache(
+    max_size=settings.web_cache_size,
+    ttl=settings.web_cache_ttl,
+)